@@ -0,0 +1,223 @@
+# config/metricas.py
+# Métricas de desempenho por requisição, expostas no formato texto do Prometheus em /metrics.
+#
+# Para cada endpoint (rota + método + ação do ViewSet) são registrados histogramas de:
+#   - tempo total da requisição;
+#   - número de consultas SQL e tempo gasto nelas;
+#   - tempo gasto em dependências externas (ERP via ODBC, webhooks, SMTP), medido com medir().
+# Com METRICAS_SERVER_TIMING = True, a resposta também traz o cabeçalho Server-Timing (visível
+# nas ferramentas de desenvolvedor do navegador).
+#
+# O custo por requisição é uma medição de tempo por consulta SQL e a atualização de alguns
+# contadores em memória. As métricas são do processo (cada worker expõe as suas).
+#
+# Respostas em streaming (ex: exportacao.py) leem o banco depois que a view termina: para elas a
+# medição continua enquanto o conteúdo é enviado, e os histogramas (tempo total e SQL) são
+# atualizados no fim do envio. O cabeçalho Server-Timing, enviado antes, mostra só a parte da view.
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+ATIVAS = getattr(settings, 'METRICAS_ATIVAS', True)
+SERVER_TIMING = getattr(settings, 'METRICAS_SERVER_TIMING', False)
+# Se definido, /metrics exige o cabeçalho "Authorization: Bearer <token>". Sem token, só usuários
+# staff logados leem as métricas, a não ser que METRICAS_PUBLICAS = True.
+TOKEN = getattr(settings, 'METRICAS_TOKEN', '')
+PUBLICAS = getattr(settings, 'METRICAS_PUBLICAS', False)
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histograma:
+    """Histograma acumulado com rótulos, no modelo do Prometheus (buckets cumulativos, _sum e _count)."""
+
+    def __init__(self, nome, ajuda, rotulos, limites=LIMITES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.limites = limites
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        posicao = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                # [contagem por faixa (+Inf no fim), soma, total]
+                serie = self._series[valores_rotulos] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            series = [(chave, list(faixas), soma, total) for chave, (faixas, soma, total) in self._series.items()]
+        for chave, faixas, soma, total in sorted(series):
+            rotulos = ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(self.rotulos, chave))
+            separador = ',' if rotulos else ''
+            acumulado = 0
+            for limite, quantidade in zip((*self.limites, '+Inf'), faixas):
+                acumulado += quantidade
+                linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="{limite}"}} {acumulado}')
+            linhas.append(f'{self.nome}_sum{{{rotulos}}} {soma}')
+            linhas.append(f'{self.nome}_count{{{rotulos}}} {total}')
+        return linhas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+ROTULOS_ENDPOINT = ('endpoint', 'metodo', 'acao', 'status')
+DURACAO = Histograma(
+    'http_requisicao_segundos', 'Tempo total da requisição.', ROTULOS_ENDPOINT)
+CONSULTAS_SQL = Histograma(
+    'http_consultas_sql', 'Consultas SQL por requisição.', ROTULOS_ENDPOINT, LIMITES_CONSULTAS)
+TEMPO_SQL = Histograma(
+    'http_tempo_sql_segundos', 'Tempo gasto em consultas SQL por requisição.', ROTULOS_ENDPOINT)
+TEMPO_EXTERNO = Histograma(
+    'dependencia_externa_segundos', 'Duração das chamadas a dependências externas (erp, webhook, smtp).',
+    ('dependencia', 'resultado'))
+HISTOGRAMAS = [DURACAO, CONSULTAS_SQL, TEMPO_SQL, TEMPO_EXTERNO]
+
+# Tempos da requisição atual: {'sql': [consultas, segundos], 'erp': segundos, ...}.
+_medicoes = ContextVar('medicoes', default=None)
+
+
+# Mede um trecho que chama uma dependência externa. Uso: with medir('erp'): cursor.execute(...)
+# Fora de uma requisição (workers, comandos), alimenta apenas o histograma global.
+@contextmanager
+def medir(dependencia):
+    if not ATIVAS:
+        yield
+        return
+    inicio = time.perf_counter()
+    resultado = 'ok'
+    try:
+        yield
+    except Exception:
+        resultado = 'erro'
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        TEMPO_EXTERNO.observar(duracao, dependencia, resultado)
+        medicoes = _medicoes.get()
+        if medicoes is not None:
+            medicoes[dependencia] = medicoes.get(dependencia, 0.0) + duracao
+
+
+def _medir_sql(execute, sql, params, many, context):
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicoes = _medicoes.get()
+        if medicoes is not None:
+            medicoes['sql'][0] += 1
+            medicoes['sql'][1] += time.perf_counter() - inicio
+
+
+# Mesmo que _medir_sql, com as medições fixas (o conteúdo em streaming é lido fora do contexto da requisição).
+def _medidor_sql(medicoes):
+    def medir_sql(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            medicoes['sql'][0] += 1
+            medicoes['sql'][1] += time.perf_counter() - inicio
+    return medir_sql
+
+
+def _rotulos(request, response):
+    rota = getattr(request, 'resolver_match', None)
+    if rota is None:
+        # Sem rota resolvida (404): um rótulo só, para não criar uma série por URL inválida.
+        endpoint, acao = 'nao_encontrado', ''
+    else:
+        # Rotas do router do DRF são expressões regulares terminadas em '$'.
+        endpoint = '/' + rota.route.rstrip('$') if rota.route else rota.view_name
+        classe = getattr(rota.func, 'cls', None)
+        acao = classe.__name__ if classe else rota.view_name
+        # ViewSets do DRF: a função da rota sabe qual ação atende cada método (list, retrieve, ...).
+        acoes = getattr(rota.func, 'actions', None) or {}
+        if request.method.lower() in acoes:
+            acao = f'{acao}.{acoes[request.method.lower()]}'
+    return endpoint, request.method, acao, f'{response.status_code // 100}xx'
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not ATIVAS:
+            return self.get_response(request)
+        medicoes = {'sql': [0, 0.0]}
+        token = _medicoes.set(medicoes)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(_medir_sql))
+                response = self.get_response(request)
+        finally:
+            _medicoes.reset(token)
+        duracao = time.perf_counter() - inicio
+
+        rotulos = _rotulos(request, response)
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = self._acompanhar_streaming(response.streaming_content, medicoes, inicio, rotulos)
+        else:
+            self._observar(duracao, medicoes, rotulos)
+        if SERVER_TIMING:
+            partes = [f'total;dur={duracao * 1000:.1f}', f'sql;dur={medicoes["sql"][1] * 1000:.1f};desc="{medicoes["sql"][0]} consultas"']
+            partes += [
+                f'{nome};dur={segundos * 1000:.1f}' for nome, segundos in medicoes.items() if nome != 'sql'
+            ]
+            response['Server-Timing'] = ', '.join(partes)
+        return response
+
+    @staticmethod
+    def _observar(duracao, medicoes, rotulos):
+        DURACAO.observar(duracao, *rotulos)
+        CONSULTAS_SQL.observar(medicoes['sql'][0], *rotulos)
+        TEMPO_SQL.observar(medicoes['sql'][1], *rotulos)
+
+    def _acompanhar_streaming(self, conteudo, medicoes, inicio, rotulos):
+        # Continua medindo o SQL enquanto o conteúdo é gerado; registra tudo quando o envio termina
+        # (inclusive se o cliente desconectar no meio).
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(_medidor_sql(medicoes)))
+                yield from conteudo
+        finally:
+            self._observar(time.perf_counter() - inicio, medicoes, rotulos)
+
+
+# GET /metrics  (formato texto do Prometheus)
+def exportar_metricas(request):
+    if TOKEN:
+        # Comparação em tempo constante, para o token não vazar pelo tempo de resposta.
+        if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {TOKEN}'.encode()):
+            return HttpResponseForbidden()
+    elif not PUBLICAS:
+        usuario = getattr(request, 'user', None)
+        if usuario is None or not usuario.is_staff:
+            return HttpResponseForbidden()
+    linhas = []
+    for histograma in HISTOGRAMAS:
+        linhas.extend(histograma.exportar())
+    return HttpResponse('\n'.join(linhas) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
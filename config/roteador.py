@@ -0,0 +1,158 @@
+# config/roteador.py
+# Roteamento entre o banco principal ('default') e uma réplica somente leitura.
+#
+# - Gravações sempre vão para o principal.
+# - Leituras de requisições seguras (GET/HEAD/OPTIONS) vão para a réplica, se ela estiver configurada
+#   (DATABASES['replica']), acessível e com atraso aceitável; caso contrário, para o principal.
+# - Leia o que você gravou: depois de uma gravação, o mesmo cliente (token, sessão ou IP) lê do
+#   principal por REPLICA_JANELA_APOS_ESCRITA segundos, para não ver dados antigos logo após salvar.
+#   A marca fica no cache do Django: com o Redis (CACHE_REDIS_URL, ver CACHES em config/settings.py)
+#   vale mesmo que a leitura seguinte caia em outro worker; com o cache em memória, só no mesmo processo.
+#   Se uma requisição GET grava algo, o restante dela também passa a ler do principal.
+#
+# A decisão vale para a requisição atual (contextvars), então threads e tarefas assíncronas
+# não interferem umas nas outras.
+
+import hashlib
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+from django.utils import timezone
+
+ALIAS_REPLICA = getattr(settings, 'REPLICA_ALIAS', 'replica')
+JANELA_APOS_ESCRITA = getattr(settings, 'REPLICA_JANELA_APOS_ESCRITA', 5)
+# Atraso máximo (segundos) da réplica; acima disso, as leituras voltam para o principal.
+ATRASO_MAXIMO = getattr(settings, 'REPLICA_ATRASO_MAXIMO', 10)
+# De quanto em quanto tempo (segundos) cada processo verifica se a réplica está disponível.
+INTERVALO_VERIFICACAO = getattr(settings, 'REPLICA_INTERVALO_VERIFICACAO', 5)
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+PREFIXO_APOS_ESCRITA = 'config:replica:apos_escrita:'
+# App da tabela do DatabaseCache: fica sempre no principal (a marca acima precisa ser lida de lá), e
+# gravar nela (ex: guardar uma página em cache num GET) não conta como gravação da requisição.
+APP_CACHE = 'django_cache'
+
+# Banco de leitura da requisição atual (None: principal) e se ela já gravou algo.
+_alias_leitura = ContextVar('alias_leitura', default=None)
+_gravou = ContextVar('gravou', default=False)
+
+_estado_replica = {'disponivel': False, 'verificado_em': 0.0, 'ultimo_replicado': 0}
+_lock_verificacao = threading.Lock()
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+# Retorna (atraso em segundos, ID do último RegistroMudanca que já chegou na réplica).
+def _medir_atraso():
+    # O log de mudanças (RegistroMudanca) cresce a cada gravação: a réplica está atrasada há tanto
+    # tempo quanto o registro mais antigo do principal que ela ainda não recebeu.
+    from customizacoes.models import RegistroMudanca
+
+    ultimo_replicado = (
+        RegistroMudanca.objects.using(ALIAS_REPLICA).order_by('-id').values_list('id', flat=True).first() or 0
+    )
+    pendente = (
+        RegistroMudanca.objects.using(DEFAULT_DB_ALIAS).filter(id__gt=ultimo_replicado)
+        .order_by('id').values_list('data', flat=True).first()
+    )
+    atraso = 0 if pendente is None else (timezone.now() - pendente).total_seconds()
+    return atraso, ultimo_replicado
+
+
+# Diz se a réplica pode receber leituras agora (resultado guardado por INTERVALO_VERIFICACAO segundos).
+def replica_disponivel():
+    if not replica_configurada():
+        return False
+    if time.monotonic() - _estado_replica['verificado_em'] < INTERVALO_VERIFICACAO:
+        return _estado_replica['disponivel']
+    with _lock_verificacao:
+        if time.monotonic() - _estado_replica['verificado_em'] >= INTERVALO_VERIFICACAO:
+            try:
+                connections[ALIAS_REPLICA].ensure_connection()
+                atraso, ultimo_replicado = _medir_atraso()
+                disponivel = atraso <= ATRASO_MAXIMO
+            except DatabaseError:
+                disponivel, ultimo_replicado = False, 0
+            _estado_replica.update(
+                disponivel=disponivel, verificado_em=time.monotonic(), ultimo_replicado=ultimo_replicado
+            )
+    return _estado_replica['disponivel']
+
+
+# Banco que as leituras da requisição atual estão usando (útil para .using() em consultas avaliadas
+# fora da view, como as exportações em streaming).
+def alias_leitura():
+    return _alias_leitura.get() or DEFAULT_DB_ALIAS
+
+
+# Identifica "até onde" vão os dados lidos pela requisição atual: vazio no principal; na réplica,
+# inclui o último registro replicado. Caches de respostas montadas com leituras (ex: ETag) usam
+# este valor para não servir, depois que a réplica alcança o principal, uma resposta antiga.
+def marca_leitura():
+    if _alias_leitura.get() is None:
+        return ''
+    return f"{ALIAS_REPLICA}:{_estado_replica['ultimo_replicado']}"
+
+
+class RoteadorReplica:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == APP_CACHE:
+            return DEFAULT_DB_ALIAS
+        return _alias_leitura.get()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_CACHE:
+            return DEFAULT_DB_ALIAS
+        # A partir da primeira gravação, a requisição lê só do principal.
+        _gravou.set(True)
+        _alias_leitura.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica é uma cópia do principal: objetos dos dois bancos podem se relacionar.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema pela replicação do SQL Server, não pelas migrations.
+        return db != ALIAS_REPLICA
+
+
+def _escopo(request):
+    # Identifica o cliente sem consultar o banco: token JWT, sessão ou, em último caso, o IP.
+    origem = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.META.get('REMOTE_ADDR', '')
+    )
+    return PREFIXO_APOS_ESCRITA + hashlib.blake2b(origem.encode('utf-8'), digest_size=12).hexdigest()
+
+
+class RoteamentoReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        escopo = _escopo(request)
+        usar_replica = (
+            request.method in METODOS_SEGUROS
+            and replica_disponivel()
+            and not cache.get(escopo)
+        )
+        # Sem réplica configurada, nada muda: o roteador devolve None e tudo vai para o 'default'.
+        token_alias = _alias_leitura.set(ALIAS_REPLICA if usar_replica else None)
+        token_gravou = _gravou.set(False)
+        try:
+            response = self.get_response(request)
+            if replica_configurada() and (_gravou.get() or request.method not in METODOS_SEGUROS):
+                # No cache compartilhado: a próxima leitura deste cliente pode ir para outro worker.
+                cache.set(escopo, True, JANELA_APOS_ESCRITA)
+        finally:
+            _alias_leitura.reset(token_alias)
+            _gravou.reset(token_gravou)
+        return response
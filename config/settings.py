@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metricas.MetricasMiddleware',                    # primeiro, para medir o tempo total
     'corsheaders.middleware.CorsMiddleware',                 # pode ficar no topo
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',  # <- precisa vir ANTES do AuthenticationMiddleware
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.roteador.RoteamentoReplicaMiddleware',           # leituras de GET na réplica (se houver)
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -77,6 +79,52 @@ DATABASES = {
     }
 }
 
+# Réplica somente leitura (opcional). Com DB_REPLICA_HOST definido, as leituras das requisições
+# GET vão para ela (ver config/roteador.py); sem ele, tudo continua no 'default'.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        # Nos testes, a "réplica" é o próprio banco de teste do 'default'.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['config.roteador.RoteadorReplica']
+
+# --------- CACHE ---------
+# Sem configuração, cada processo tem o seu cache em memória (LocMem): uma leitura do cache não custa
+# nenhuma consulta ao banco. Com vários workers, defina CACHE_REDIS_URL (ex: redis://localhost:6379/1,
+# requer o pacote 'redis') para que eles compartilhem o cache: aí as marcas gravadas nele (usuários
+# da autenticação JWT em users/autenticacao.py, "leia o que você gravou" em config/roteador.py) valem
+# para todos os processos; com o LocMem elas valem só para o processo que as gravou.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Segundos em que um cliente lê só do principal depois de gravar (leia o que você gravou).
+REPLICA_JANELA_APOS_ESCRITA = int(os.getenv('REPLICA_JANELA_APOS_ESCRITA', '5'))
+# Atraso máximo (segundos) aceito na réplica antes de voltar as leituras para o principal.
+REPLICA_ATRASO_MAXIMO = int(os.getenv('REPLICA_ATRASO_MAXIMO', '10'))
+
+# Métricas de desempenho (GET /metrics, formato Prometheus). Com METRICAS_TOKEN definido,
+# /metrics exige "Authorization: Bearer <token>"; sem ele, só um usuário staff logado (sessão) as lê,
+# a não ser que METRICAS_PUBLICAS libere o acesso (ex: rede interna, atrás de um proxy).
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
+METRICAS_PUBLICAS = os.getenv('METRICAS_PUBLICAS', 'False').lower() in ('1', 'true', 'sim')
+# Cabeçalho Server-Timing nas respostas (tempo total, SQL, ERP...): útil em desenvolvimento.
+METRICAS_SERVER_TIMING = os.getenv('METRICAS_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true', 'sim')
+
 
 
 LANGUAGE_CODE = 'pt-br'
@@ -91,7 +139,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # --------- DRF / JWT / Swagger ---------
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT do simplejwt, com os usuários em cache (sem consultar o banco a cada requisição).
+        'users.autenticacao.JWTAuthenticationCache',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -106,6 +155,10 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# Cache de usuários da autenticação JWT (users/autenticacao.py): validade (segundos) e tamanho máximo.
+AUTH_CACHE_USUARIOS_TTL = int(os.getenv('AUTH_CACHE_USUARIOS_TTL', '60'))
+AUTH_CACHE_USUARIOS_MAXIMO = 1000
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Jota Nunes – API de Customizações',
     'DESCRIPTION': 'Gestão de customizações TOTVS (alertas, histórico, dependências).',
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from config.metricas import exportar_metricas
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -17,6 +18,9 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 
+    # Métricas (Prometheus)
+    path('metrics', exportar_metricas, name='metricas'),
+
     # Páginas HTML
     path('', include('core.urls')),
 ]
@@ -0,0 +1,116 @@
+# customizacoes/erp_leitor.py
+# Leitura do ERP em fluxo (streaming): as linhas chegam em blocos de tamanho fixo,
+# então a memória usada não depende do tamanho da tabela lida.
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config.metricas import medir
+
+from .erp_pool import conexao_erp, obter_pool
+
+# Quantidade padrão de linhas buscadas do ERP a cada fetchmany.
+TAMANHO_BLOCO = 1000
+
+
+# Executa 'sql' no ERP e devolve um gerador de blocos (listas de linhas) com até 'tamanho_bloco' linhas.
+# A conexão fica emprestada do pool enquanto o gerador estiver sendo consumido.
+def ler_em_blocos(sql, params=(), tamanho_bloco=TAMANHO_BLOCO):
+    with conexao_erp() as conn:
+        cursor = conn.cursor()
+        try:
+            with medir('erp'):
+                cursor.execute(sql, params)
+            while True:
+                with medir('erp'):
+                    bloco = cursor.fetchmany(tamanho_bloco)
+                if not bloco:
+                    break
+                yield bloco
+        finally:
+            cursor.close()
+
+
+# Descobre o menor e o maior valor da chave numérica 'coluna_chave' em 'tabela'.
+def _intervalo_chaves(tabela, coluna_chave):
+    with conexao_erp() as conn:
+        cursor = conn.cursor()
+        with medir('erp'):
+            cursor.execute(f"SELECT MIN({coluna_chave}), MAX({coluna_chave}) FROM {tabela}")
+            minimo, maximo = cursor.fetchone()
+        cursor.close()
+    return minimo, maximo
+
+
+# Divide o intervalo [minimo, maximo] em até 'partes' faixas contíguas [inicio, fim].
+def dividir_intervalo(minimo, maximo, partes):
+    total = maximo - minimo + 1
+    passo = -(-total // partes)  # Divisão arredondada para cima.
+    return [
+        (inicio, min(inicio + passo - 1, maximo))
+        for inicio in range(minimo, maximo + 1, passo)
+    ]
+
+
+# Lê 'colunas' de 'tabela' em paralelo: a faixa de chaves é dividida em 'shards' partes e cada
+# parte é lida por uma thread com sua própria conexão do pool.
+# Devolve um gerador de blocos, como ler_em_blocos. A fila entre as threads e o consumidor é
+# limitada, então os leitores esperam quando o estágio de gravação (no Django) fica para trás.
+# Os blocos chegam na ordem em que ficam prontos, não na ordem da chave.
+def ler_em_paralelo(tabela, colunas, coluna_chave, shards=4, tamanho_bloco=TAMANHO_BLOCO, blocos_em_espera=8):
+    # Cada shard segura uma conexão até terminar; mais shards que o pool só gerariam espera.
+    shards = max(1, min(shards, obter_pool().tamanho_maximo))
+    minimo, maximo = _intervalo_chaves(tabela, coluna_chave)
+    if minimo is None:
+        return
+
+    faixas = dividir_intervalo(int(minimo), int(maximo), shards)
+    sql = (
+        f"SELECT {', '.join(colunas)} FROM {tabela} "
+        f"WHERE {coluna_chave} BETWEEN ? AND ? ORDER BY {coluna_chave}"
+    )
+    fila = queue.Queue(maxsize=blocos_em_espera)
+    cancelado = threading.Event()
+    FIM = object()  # Marca o fim de uma faixa.
+
+    def ler_faixa(inicio, fim):
+        try:
+            for bloco in ler_em_blocos(sql, (inicio, fim), tamanho_bloco):
+                # Espera em fatias curtas para perceber um cancelamento do consumidor.
+                while not cancelado.is_set():
+                    try:
+                        fila.put(bloco, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if cancelado.is_set():
+                    return
+        except BaseException as erro:
+            fila.put(erro)
+        finally:
+            fila.put(FIM)
+
+    with ThreadPoolExecutor(max_workers=len(faixas), thread_name_prefix='erp-shard') as executor:
+        for inicio, fim in faixas:
+            executor.submit(ler_faixa, inicio, fim)
+
+        pendentes = len(faixas)
+        try:
+            while pendentes:
+                item = fila.get()
+                if item is FIM:
+                    pendentes -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # Se o consumidor parar antes do fim (ou der erro), libera as threads leitoras.
+            cancelado.set()
+            while pendentes:
+                try:
+                    if fila.get(timeout=0.5) is FIM:
+                        pendentes -= 1
+                except queue.Empty:
+                    continue
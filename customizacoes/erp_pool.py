@@ -0,0 +1,226 @@
+# customizacoes/erp_pool.py
+# Pool de conexões com o banco de dados do ERP RM TOTVS, compartilhado por todo o processo.
+# Abrir uma conexão ODBC com o SQL Server (TLS + login) custa mais do que a maioria das
+# consultas que fazemos; por isso as conexões são reaproveitadas entre as chamadas.
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pyodbc
+
+
+class ErroPoolERP(pyodbc.Error):
+    """Nenhuma conexão com o ERP ficou disponível dentro do tempo de espera.
+
+    É um pyodbc.Error (com o SQLSTATE HYT00, "timeout expired", em args[0]) para que quem já trata
+    as falhas do ERP com "except pyodbc.Error" trate também o pool esgotado.
+    """
+
+    def __init__(self, mensagem):
+        super().__init__('HYT00', mensagem)
+
+
+# Monta a string de conexão ODBC a partir das variáveis de ambiente.
+def montar_string_conexao():
+    return (
+        f"DRIVER={{{os.getenv('ODBC_DRIVER')}}};"
+        f"SERVER={os.getenv('DB_HOST')},{os.getenv('DB_PORT')};"
+        f"DATABASE={os.getenv('DB_NAME')};"
+        f"UID={os.getenv('DB_USER')};"
+        f"PWD={os.getenv('DB_PASSWORD')};"
+        "TrustServerCertificate=yes;"  # Necessário para algumas configurações de SQL Server.
+    )
+
+
+# Abre uma conexão nova com o ERP (usada pelo pool; prefira conexao_erp()).
+# autocommit=True: só fazemos leituras, então nenhuma transação fica aberta entre usos.
+def get_erp_db_connection():
+    return pyodbc.connect(montar_string_conexao(), autocommit=True)
+
+
+class PoolConexoesERP:
+    """Pool de conexões thread-safe com tamanho máximo, expiração por ociosidade e teste de vida.
+
+    Uso:
+        with pool.conexao() as conn:
+            cursor = conn.cursor()
+            ...
+    """
+
+    def __init__(self, fabrica=get_erp_db_connection, tamanho_maximo=5, tempo_ocioso=300,
+                 timeout_consulta=30, timeout_espera=30, ping_apos=5, erros_conexao=(pyodbc.Error,)):
+        # fabrica: função sem argumentos que abre uma conexão nova.
+        self._fabrica = fabrica
+        self.tamanho_maximo = tamanho_maximo
+        # Conexões ociosas há mais de 'tempo_ocioso' segundos são fechadas.
+        self.tempo_ocioso = tempo_ocioso
+        # Tempo máximo (segundos) de cada consulta; 0 desativa.
+        self.timeout_consulta = timeout_consulta
+        # Tempo máximo (segundos) esperando uma conexão livre quando o pool está cheio.
+        self.timeout_espera = timeout_espera
+        # Conexões paradas há mais de 'ping_apos' segundos são testadas antes de serem entregues.
+        self.ping_apos = ping_apos
+        # Erros que indicam que a conexão pode estar quebrada e não deve voltar ao pool.
+        self._erros_conexao = erros_conexao
+
+        self._livres = deque()  # Pilha de (conexão, instante do último uso).
+        self._abertas = 0
+        self._condicao = threading.Condition()
+        self._contadores = {
+            'checkouts': 0,     # Conexões entregues.
+            'esperas': 0,       # Vezes em que foi preciso esperar o pool liberar uma conexão.
+            'reconexoes': 0,    # Conexões mortas substituídas no checkout.
+            'criadas': 0,       # Conexões abertas no ERP.
+            'descartadas': 0,   # Conexões fechadas (ociosas, mortas ou com erro).
+        }
+
+    @contextmanager
+    def conexao(self):
+        conn = self._retirar()
+        try:
+            yield conn
+        except ErroPoolERP:
+            # Pool esgotado em uma chamada aninhada: a conexão desta continua boa.
+            self._devolver(conn)
+            raise
+        except self._erros_conexao:
+            # Após um erro do driver não sabemos o estado da conexão: descarta.
+            self._descartar(conn)
+            raise
+        except BaseException:
+            self._devolver(conn)
+            raise
+        else:
+            self._devolver(conn)
+
+    def estatisticas(self):
+        with self._condicao:
+            return dict(self._contadores, abertas=self._abertas, livres=len(self._livres))
+
+    def fechar(self):
+        # Fecha todas as conexões ociosas (as que estão em uso são fechadas ao voltar).
+        with self._condicao:
+            livres = list(self._livres)
+            self._livres.clear()
+            self._abertas -= len(livres)
+            self._condicao.notify_all()
+        for conn, _ in livres:
+            self._fechar(conn)
+
+    def _retirar(self):
+        prazo = time.monotonic() + self.timeout_espera
+        expiradas = []
+        esperou = False
+        with self._condicao:
+            self._contadores['checkouts'] += 1
+            while True:
+                agora = time.monotonic()
+                # As mais antigas ficam à esquerda; fecha as que passaram do tempo ocioso.
+                while self._livres and agora - self._livres[0][1] > self.tempo_ocioso:
+                    expiradas.append(self._livres.popleft()[0])
+                    self._abertas -= 1
+                if self._livres:
+                    # Pega a usada mais recentemente (mais chance de estar viva).
+                    conn, ultimo_uso = self._livres.pop()
+                    break
+                if self._abertas < self.tamanho_maximo:
+                    self._abertas += 1
+                    conn, ultimo_uso = None, None
+                    break
+                if not esperou:
+                    # Conta o checkout que esperou, não cada vez que a thread acordou sem conseguir.
+                    esperou = True
+                    self._contadores['esperas'] += 1
+                restante = prazo - agora
+                if restante <= 0 or not self._condicao.wait(restante):
+                    raise ErroPoolERP(
+                        f"Nenhuma conexão com o ERP disponível após {self.timeout_espera}s "
+                        f"(máximo de {self.tamanho_maximo})."
+                    )
+        for antiga in expiradas:
+            self._fechar(antiga)
+
+        if conn is not None and time.monotonic() - ultimo_uso > self.ping_apos and not self._esta_viva(conn):
+            self._contar('reconexoes')
+            self._fechar(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._abrir()
+            except BaseException:
+                # Libera a vaga reservada para que outra thread possa tentar.
+                with self._condicao:
+                    self._abertas -= 1
+                    self._condicao.notify()
+                raise
+        return conn
+
+    def _devolver(self, conn):
+        with self._condicao:
+            self._livres.append((conn, time.monotonic()))
+            self._condicao.notify()
+
+    def _descartar(self, conn):
+        with self._condicao:
+            self._abertas -= 1
+            self._condicao.notify()
+        self._fechar(conn)
+
+    def _abrir(self):
+        conn = self._fabrica()
+        # Timeout por consulta (atributo do pyodbc; outros drivers podem não ter).
+        if self.timeout_consulta and hasattr(conn, 'timeout'):
+            conn.timeout = self.timeout_consulta
+        self._contar('criadas')
+        return conn
+
+    def _esta_viva(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _fechar(self, conn):
+        self._contar('descartadas')
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _contar(self, nome):
+        with self._condicao:
+            self._contadores[nome] += 1
+
+
+# --- Pool global do processo ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Retorna o pool compartilhado, criado na primeira chamada com os limites das variáveis de ambiente.
+def obter_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoesERP(
+                    tamanho_maximo=int(os.getenv('ERP_POOL_TAMANHO', '5')),
+                    tempo_ocioso=int(os.getenv('ERP_POOL_TEMPO_OCIOSO', '300')),
+                    timeout_consulta=int(os.getenv('ERP_TIMEOUT_CONSULTA', '30')),
+                    timeout_espera=int(os.getenv('ERP_POOL_TIMEOUT_ESPERA', '30')),
+                )
+    return _pool
+
+
+# Atalho para pegar uma conexão do pool global:
+#     with conexao_erp() as conn:
+#         ...
+def conexao_erp():
+    return obter_pool().conexao()
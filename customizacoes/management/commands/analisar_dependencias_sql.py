@@ -0,0 +1,24 @@
+# customizacoes/management/commands/analisar_dependencias_sql.py
+# Descobre dependências entre customizações analisando o SQL/fórmula de cada uma.
+# Uso: python manage.py analisar_dependencias_sql [--processos 4] [--forcar]
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from customizacoes.analisador_sql import analisar_dependencias
+
+
+class Command(BaseCommand):
+    help = "Analisa o SQL das customizações e atualiza as dependências automáticas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=os.cpu_count(), help="Processos de análise em paralelo.")
+        parser.add_argument('--forcar', action='store_true', help="Reanalisa mesmo o que não mudou desde a última análise.")
+
+    def handle(self, *args, **options):
+        estatisticas = analisar_dependencias(processos=options['processos'], forcar=options['forcar'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{estatisticas['analisadas']} analisadas ({estatisticas['sem_alteracao']} sem alteração), "
+            f"{estatisticas['arestas_criadas']} dependências criadas, {estatisticas['arestas_removidas']} removidas."
+        ))
@@ -0,0 +1,68 @@
+# customizacoes/management/commands/benchmark.py
+# Mede o desempenho da API e da sincronização com o ERP sobre um catálogo sintético.
+# Roda num banco de teste criado só para isso (o banco configurado não é tocado).
+# Uso: python manage.py benchmark [--customizacoes 100000] [--saida resultado.json] [--comparar anterior.json]
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from customizacoes.benchmark import comparar_resultados, executar_benchmark, gravar_resultado
+
+
+class Command(BaseCommand):
+    help = "Gera um catálogo sintético, mede latência, consultas, memória e vazão da sincronização e grava em JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customizacoes', type=int, default=10000, help="Customizações geradas (ex: 10000 a 1000000).")
+        parser.add_argument('--historicos', type=int, default=5, help="Registros de histórico por customização.")
+        parser.add_argument('--profundidade', type=int, default=50, help="Comprimento das cadeias de dependência.")
+        parser.add_argument('--arestas', type=int, default=2, help="Dependências aleatórias extras por customização.")
+        parser.add_argument('--linhas-erp', type=int, default=10000, help="Linhas da tabela FCUSTOMIZACOES do ERP falso.")
+        parser.add_argument('--repeticoes', type=int, default=50, help="Requisições medidas por cenário da API.")
+        parser.add_argument('--semente', type=int, default=42, help="Semente dos dados gerados.")
+        parser.add_argument('--com-cache', action='store_true', help="Mede com o cache de respostas ativo (padrão: limpo a cada requisição).")
+        parser.add_argument('--saida', default='resultado_benchmark.json', help="Arquivo JSON com os resultados.")
+        parser.add_argument('--comparar', help="Resultado JSON anterior para comparar com este.")
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        bancos = setup_databases(verbosity=options['verbosity'], interactive=False, aliases={'default'})
+        try:
+            resultado = executar_benchmark(
+                customizacoes=options['customizacoes'], historicos_por_item=options['historicos'],
+                profundidade=options['profundidade'], arestas_por_item=options['arestas'],
+                linhas_erp=options['linhas_erp'], repeticoes=options['repeticoes'],
+                semente=options['semente'], usar_cache=options['com_cache'],
+            )
+        finally:
+            teardown_databases(bancos, verbosity=options['verbosity'])
+            teardown_test_environment()
+
+        gravar_resultado(resultado, options['saida'])
+        for nome, dados in sorted(resultado['cenarios'].items()):
+            if 'erro' in dados:
+                self.stdout.write(self.style.WARNING(f"{nome}: {dados['erro']}"))
+            elif 'linhas_por_segundo' in dados:
+                self.stdout.write(
+                    f"{nome}: {dados['lidas']} linhas em {dados['segundos']:.2f}s "
+                    f"({dados['linhas_por_segundo']:.0f}/s), {dados['consultas']} consultas, {dados['memoria_pico_kb']} KB"
+                )
+            else:
+                self.stdout.write(
+                    f"{nome}: p50 {dados['p50_ms']:.1f}ms, p95 {dados['p95_ms']:.1f}ms, "
+                    f"{dados['consultas']} consultas, {dados['memoria_pico_kb']} KB"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
+
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+            for nome, metricas in sorted(comparar_resultados(anterior, resultado).items()):
+                for metrica, valores in metricas.items():
+                    if valores['variacao_pct'] is not None:
+                        self.stdout.write(
+                            f"{nome}.{metrica}: {valores['antes']:.1f} -> {valores['depois']:.1f} "
+                            f"({valores['variacao_pct']:+.1f}%)"
+                        )
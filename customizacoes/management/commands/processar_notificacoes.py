@@ -0,0 +1,35 @@
+# customizacoes/management/commands/processar_notificacoes.py
+# Worker que esvazia a fila de notificações (NotificacaoPendente).
+# Uso: python manage.py processar_notificacoes [--workers 4] [--lote 100] [--intervalo 5] [--uma-vez]
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from customizacoes.notificacao import criar_executor_entregas, processar_fila_notificacoes
+
+
+class Command(BaseCommand):
+    help = "Entrega as notificações pendentes (e-mail, Teams, Slack) em segundo plano."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Threads de entrega em paralelo.")
+        parser.add_argument('--lote', type=int, default=500, help="Notificações reservadas (e agrupadas em resumos) por vez.")
+        parser.add_argument('--intervalo', type=float, default=5, help="Segundos de espera quando a fila está vazia.")
+        parser.add_argument('--uma-vez', action='store_true', help="Processa o que estiver pendente e termina.")
+
+    def handle(self, *args, **options):
+        with criar_executor_entregas(options['workers']) as executor:
+            while True:
+                resultado = processar_fila_notificacoes(executor, options['lote'])
+                processadas = sum(resultado.values())
+                if processadas:
+                    self.stdout.write(
+                        f"{resultado['enviadas']} enviadas, {resultado['reagendadas']} reagendadas, "
+                        f"{resultado['falhas']} com falha definitiva."
+                    )
+                if options['uma_vez'] and processadas < options['lote']:
+                    break
+                if processadas < options['lote']:
+                    # Fila vazia (ou quase): espera antes de consultar de novo.
+                    time.sleep(options['intervalo'])
@@ -0,0 +1,15 @@
+# customizacoes/management/commands/reindexar_busca.py
+# Reconstrói o índice da busca textual (TermoBusca) de todas as customizações.
+# Uso: python manage.py reindexar_busca
+
+from django.core.management.base import BaseCommand
+
+from customizacoes.busca import reindexar_tudo
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o índice da busca textual de customizações e documentação técnica."
+
+    def handle(self, *args, **options):
+        total = reindexar_tudo()
+        self.stdout.write(self.style.SUCCESS(f"{total} customizações indexadas."))
@@ -0,0 +1,87 @@
+# customizacoes/management/commands/sincronizar_erp.py
+# Daemon que sincroniza continuamente as customizações novas do ERP.
+# Pode rodar em todos os servidores: uma trava no banco garante que só um sincroniza por vez.
+# A cada --reconciliar-a-cada segundos, a execução compara o catálogo inteiro do ERP por hash (para
+# trazer edições de customizações antigas, que a consulta incremental não vê).
+# Uso: python manage.py sincronizar_erp [--intervalo-min 5] [--intervalo-max 300] [--reconciliar-a-cada 3600] [--uma-vez]
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from customizacoes.erp_integrator import NOME_SINCRONIZACAO
+from customizacoes.sincronizacao import (
+    IntervaloAdaptativo, adquirir_trava, executar_sincronizacao, identificar_executor,
+    liberar_trava, limpar_execucoes_antigas, reconciliacao_pendente,
+)
+
+# A cada quantas execuções as estatísticas antigas são apagadas.
+EXECUCOES_POR_LIMPEZA = 500
+# Segundos entre as tentativas de obter a trava, enquanto outro servidor sincroniza.
+ESPERA_RESERVA = 30
+
+
+class Command(BaseCommand):
+    help = "Sincroniza continuamente as customizações do ERP, com um único servidor ativo por vez."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo-min', type=float, default=5, help="Segundos entre consultas quando o ERP tem mudanças.")
+        parser.add_argument('--intervalo-max', type=float, default=300, help="Segundos entre consultas quando o ERP está parado.")
+        parser.add_argument(
+            '--reconciliar-a-cada', type=float, default=3600,
+            help="Segundos entre reconciliações completas com o ERP (edições no ERP); 0 desativa.",
+        )
+        parser.add_argument('--uma-vez', action='store_true', help="Executa uma sincronização (se obtiver a trava) e termina.")
+
+    def handle(self, *args, **options):
+        dono = identificar_executor()
+        intervalo = IntervaloAdaptativo(options['intervalo_min'], options['intervalo_max'])
+        execucoes = 0
+        try:
+            while True:
+                # Fora de uma requisição ninguém recicla as conexões: descarta as que caíram ou venceram
+                # (CONN_MAX_AGE), em vez de reutilizá-las para sempre.
+                close_old_connections()
+                try:
+                    # Quem não tem a trava tenta de novo mais tarde (ela vence se o dono parar de renová-la).
+                    if not adquirir_trava(NOME_SINCRONIZACAO, dono, intervalo.atual):
+                        if options['uma_vez']:
+                            self.stdout.write("Outro servidor está sincronizando; nada a fazer.")
+                            break
+                        time.sleep(ESPERA_RESERVA)
+                        continue
+
+                    reconciliar = options['reconciliar_a_cada'] > 0 and reconciliacao_pendente(
+                        timedelta(seconds=options['reconciliar_a_cada'])
+                    )
+                    execucao = executar_sincronizacao(dono, intervalo.atual, reconciliar=reconciliar)
+                    # Após um erro, espera como se o ERP estivesse parado (o intervalo cresce até o máximo).
+                    espera = intervalo.registrar(0 if execucao.erro else execucao.inseridas + execucao.alteradas)
+                    # Renova a trava para cobrir a espera até a próxima execução.
+                    adquirir_trava(NOME_SINCRONIZACAO, dono, espera)
+                    if execucao.erro:
+                        self.stderr.write(execucao.erro)
+                    elif execucao.lidas:
+                        self.stdout.write(
+                            f"{execucao.lidas} lidas, {execucao.inseridas} novas, {execucao.alteradas} alteradas "
+                            f"em {execucao.duracao:.2f}s; próxima consulta em {espera:.0f}s."
+                        )
+
+                    execucoes += 1
+                    if execucoes % EXECUCOES_POR_LIMPEZA == 1:
+                        limpar_execucoes_antigas()
+                except Exception as ex:
+                    # Ex: o banco do Django está fora do ar e nem a execução pôde ser registrada. O daemon
+                    # não morre: espera e tenta de novo (a trava vence sozinha se não for renovada).
+                    self.stderr.write(f"Falha na sincronização: {type(ex).__name__}: {ex}")
+                    if options['uma_vez']:
+                        raise
+                    espera = intervalo.registrar(0)
+                if options['uma_vez']:
+                    break
+                time.sleep(espera)
+        finally:
+            # Libera a trava ao sair (inclusive Ctrl+C), para outro servidor assumir sem esperar ela vencer.
+            liberar_trava(NOME_SINCRONIZACAO, dono)
@@ -1,19 +1,123 @@
 # customizacoes/notificacoes.py
 
+import math
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from urllib.parse import urlsplit
+
 import requests
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
-from users.models import ConfiguracaoNotificacao # Importa o modelo de configuração
+from django.db import transaction
+from django.utils import timezone
+from config.metricas import medir
+from users.models import ConfiguracaoNotificacao, NotificacaoPendente # Importa os modelos de configuração e da fila
 
-# --- Função para Enviar Notificação para Microsoft Teams ---
-def enviar_notificacao_teams(webhook_url, titulo, mensagem):
-    payload = {
+# --- Parâmetros de entrega (podem ser sobrescritos no settings.py) ---
+# Tempo máximo (segundos) de uma chamada HTTP a um webhook.
+TIMEOUT_WEBHOOK = getattr(settings, 'NOTIFICACOES_TIMEOUT_WEBHOOK', 10)
+# Número máximo de tentativas antes de a notificação ir para o estado de falha definitiva.
+MAX_TENTATIVAS = getattr(settings, 'NOTIFICACOES_MAX_TENTATIVAS', 6)
+# Espera base (segundos) do backoff exponencial: 30s, 60s, 120s, ...
+BACKOFF_BASE = getattr(settings, 'NOTIFICACOES_BACKOFF_BASE', 30)
+BACKOFF_MAXIMO = getattr(settings, 'NOTIFICACOES_BACKOFF_MAXIMO', 3600)
+# Por quanto tempo uma notificação fica reservada para um worker. Se o worker cair no meio da
+# entrega, ela volta a ficar disponível depois desse prazo. Enquanto a entrega de um lote continua
+# (o limite de taxa dos webhooks pode fazê-la durar mais que o prazo), a reserva é renovada.
+PRAZO_RESERVA = timedelta(minutes=5)
+
+# Janela (segundos) em que notificações "imediatas" para o mesmo destino são agrupadas em uma só.
+JANELA_AGRUPAMENTO = getattr(settings, 'NOTIFICACOES_JANELA_AGRUPAMENTO', 60)
+# Hora do dia (horário local) em que os resumos diários são enviados.
+HORA_RESUMO_DIARIO = getattr(settings, 'NOTIFICACOES_HORA_RESUMO_DIARIO', 8)
+# Limite de envios por webhook (token bucket): taxa em mensagens/segundo e rajada máxima.
+WEBHOOK_TAXA = getattr(settings, 'NOTIFICACOES_WEBHOOK_TAXA', 1.0)
+WEBHOOK_RAJADA = getattr(settings, 'NOTIFICACOES_WEBHOOK_RAJADA', 5)
+
+# Quantos e-mails são enviados por lote na mesma conexão SMTP.
+TAMANHO_LOTE_EMAIL = getattr(settings, 'NOTIFICACOES_TAMANHO_LOTE_EMAIL', 50)
+
+# Sessões HTTP por thread e por host: mantém a conexão (keep-alive/TLS) aberta entre entregas.
+_sessoes = threading.local()
+
+
+def _sessao_para(url):
+    if not hasattr(_sessoes, 'por_host'):
+        _sessoes.por_host = {}
+    host = urlsplit(url).netloc
+    sessao = _sessoes.por_host.get(host)
+    if sessao is None:
+        sessao = _sessoes.por_host[host] = requests.Session()
+    return sessao
+
+
+# --- Limite de taxa por webhook (token bucket) ---
+# Cada webhook tem um balde com até 'rajada' fichas, reabastecido a 'taxa' fichas por segundo.
+# Cada envio consome uma ficha; sem fichas, a thread espera o reabastecimento.
+class LimitadorTaxa:
+    def __init__(self, taxa, rajada):
+        self.taxa = taxa
+        self.rajada = rajada
+        self._fichas = float(rajada)
+        self._atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.rajada, self._fichas + (agora - self._atualizado_em) * self.taxa)
+                self._atualizado_em = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+_limitadores = {}
+_limitadores_lock = threading.Lock()
+
+
+def _limitador_para(url):
+    with _limitadores_lock:
+        limitador = _limitadores.get(url)
+        if limitador is None:
+            limitador = _limitadores[url] = LimitadorTaxa(WEBHOOK_TAXA, WEBHOOK_RAJADA)
+        return limitador
+
+
+# Faz o POST do payload no webhook, respeitando o limite de taxa dele.
+# Lança requests.exceptions.RequestException em caso de erro.
+def _postar_webhook(webhook_url, payload):
+    _limitador_para(webhook_url).aguardar()
+    with medir('webhook'):
+        _sessao_para(webhook_url).post(webhook_url, json=payload, timeout=TIMEOUT_WEBHOOK).raise_for_status()
+
+
+def _payload_teams(titulo, mensagem):
+    return {
         "@type": "MessageCard",
         "summary": titulo,
         "sections": [{"activityTitle": titulo, "activitySubtitle": mensagem, "markdown": True}]
     }
+
+
+def _payload_slack(titulo, mensagem):
+    # O Slack espera um campo "text" para o conteúdo da mensagem.
+    return {
+        "text": f"*{titulo}*\n{mensagem}" # Formata a mensagem com o título em negrito e quebra de linha.
+    }
+
+
+# --- Função para Enviar Notificação para Microsoft Teams ---
+def enviar_notificacao_teams(webhook_url, titulo, mensagem):
     try:
-        requests.post(webhook_url, json=payload).raise_for_status()
+        _postar_webhook(webhook_url, _payload_teams(titulo, mensagem))
         print(f"Notificação do Teams enviada com sucesso.")
     except requests.exceptions.RequestException as e:
         print(f"Erro ao enviar notificação para o Teams: {e}")
@@ -25,33 +129,95 @@ def enviar_notificacao_email(destinatario, assunto, mensagem):
     try:
         # send_mail(): Função do Django para enviar e-mails.
         # Ela usa as configurações definidas em settings.py (que por sua vez lê do .env).
-        send_mail(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [destinatario])
+        with medir('smtp'):
+            send_mail(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [destinatario])
         print(f"E-mail enviado para {destinatario}")
     except Exception as e:
         print(f"Erro ao enviar e-mail: {e}")
 
+# --- Função para Enviar E-mails em Lote ---
+# mensagens: lista de tuplas (destinatario, assunto, mensagem).
+# Envia as mensagens uma a uma pela mesma conexão SMTP, em vez de abrir e fechar uma conexão por
+# mensagem; a cada 'tamanho_lote' mensagens a conexão é renovada (servidores limitam o número de
+# mensagens por sessão). Só a mensagem que falhou é marcada com erro: se o servidor recusar um
+# destinatário, as mensagens seguintes continuam na mesma conexão.
+# Retorna uma lista com None (enviado) ou a mensagem de erro, na mesma ordem de 'mensagens'.
+def enviar_emails_em_lote(mensagens, tamanho_lote=TAMANHO_LOTE_EMAIL):
+    resultados = [None] * len(mensagens)
+    if not mensagens:
+        return resultados
+
+    conexao = get_connection(fail_silently=False)
+    try:
+        for inicio in range(0, len(mensagens), tamanho_lote):
+            lote = mensagens[inicio:inicio + tamanho_lote]
+            for indice, (destinatario, assunto, mensagem) in enumerate(lote, inicio):
+                try:
+                    # open() não faz nada se a conexão já estiver aberta; reabre se um erro anterior a derrubou.
+                    with medir('smtp'):
+                        conexao.open()
+                        enviadas = conexao.send_messages([
+                            EmailMessage(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [destinatario], connection=conexao)
+                        ])
+                    if not enviadas:
+                        resultados[indice] = 'E-mail não enviado.'
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Erro só desta mensagem: a conexão continua válida para as próximas.
+                    resultados[indice] = str(e) or e.__class__.__name__
+                    print(f"E-mail para {destinatario} recusado: {resultados[indice]}")
+                except Exception as e:
+                    resultados[indice] = str(e) or e.__class__.__name__
+                    print(f"Erro ao enviar e-mail para {destinatario}: {resultados[indice]}")
+                    # Fecha a conexão para que a próxima mensagem comece com uma nova.
+                    _fechar_conexao(conexao)
+            _fechar_conexao(conexao)
+    finally:
+        _fechar_conexao(conexao)
+    return resultados
+
+
+def _fechar_conexao(conexao):
+    try:
+        conexao.close()
+    except Exception:
+        pass
+
 # --- Função para Enviar Notificação para Slack ---------------------------------
 # webhook_url: A URL do webhook do Slack para onde a mensagem será enviada.
 # titulo: O título da notificação.
 # mensagem: O corpo da mensagem.
 def enviar_notificacao_slack(webhook_url, titulo, mensagem):
-    # payload: O dicionário de dados que será enviado para o webhook do Slack.
-    # O Slack espera um campo "text" para o conteúdo da mensagem.
-    payload = {
-        "text": f"*{titulo}*\n{mensagem}" # Formata a mensagem com o título em negrito e quebra de linha.
-    }
     try:
-        # requests.post(): Envia uma requisição POST HTTP para a URL do webhook com o payload JSON.
-        # .raise_for_status(): Verifica se a requisição foi bem-sucedida.
-        requests.post(webhook_url, json=payload).raise_for_status() 
+        # Envia o POST (com timeout) e verifica se a requisição foi bem-sucedida.
+        _postar_webhook(webhook_url, _payload_slack(titulo, mensagem))
         print(f"Notificação do Slack enviada com sucesso para {webhook_url}")
     except requests.exceptions.RequestException as e:
         # Captura erros relacionados à requisição HTTP e os imprime.
         print(f"Erro ao enviar notificação para o Slack ({webhook_url}): {e}")
 
 
+# Calcula a partir de quando uma notificação pode ser entregue, conforme a frequência escolhida.
+# Todos os eventos de um mesmo período recebem exatamente o mesmo horário, e o worker junta
+# os que vencem juntos para o mesmo destino em uma única mensagem de resumo.
+def calcular_liberacao(frequencia, agora=None):
+    agora = agora or timezone.now()
+    if frequencia == ConfiguracaoNotificacao.FREQUENCIA_HORARIA:
+        return agora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if frequencia == ConfiguracaoNotificacao.FREQUENCIA_DIARIA:
+        local = timezone.localtime(agora)
+        liberacao = local.replace(hour=HORA_RESUMO_DIARIO, minute=0, second=0, microsecond=0)
+        return liberacao if liberacao > local else liberacao + timedelta(days=1)
+    # Imediata: arredonda para o fim da janela de agrupamento atual.
+    if not JANELA_AGRUPAMENTO:
+        return agora
+    segundos = agora.timestamp()
+    return agora + timedelta(seconds=math.ceil(segundos / JANELA_AGRUPAMENTO) * JANELA_AGRUPAMENTO - segundos)
+
+
 # --- Função Principal para Notificar o Usuário ---
-# Orquestra o envio de notificações para um usuário, verificando suas preferências.
+# Verifica as preferências do usuário e coloca uma notificação na fila para cada canal configurado.
+# Nada é enviado aqui: as linhas são gravadas na transação de quem chamou (se ela for desfeita,
+# as notificações também são) e o worker 'processar_notificacoes' faz a entrega.
 def notificar_usuario(usuario, assunto, mensagem):
     try:
         config = usuario.config_notificacao
@@ -59,15 +225,188 @@ def notificar_usuario(usuario, assunto, mensagem):
         # Se o usuário não tem configuração, não faz nada ou cria uma padrão.
         return
 
-    # Enviar E-mail (se configurado)
-    if config.receber_email and config.email_para_notificacao:
-        send_mail(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [config.email_para_notificacao])
+    liberacao = calcular_liberacao(config.frequencia)
 
-    # Enviar para Microsoft Teams (se configurado)
+    destinos = []
+    # E-mail (se configurado)
+    if config.receber_email and config.email_para_notificacao:
+        destinos.append((NotificacaoPendente.CANAL_EMAIL, config.email_para_notificacao))
+    # Microsoft Teams (se configurado)
     if config.webhook_teams:
-        enviar_notificacao_teams(config.webhook_teams, assunto, mensagem)
-
-    # Enviar para Slack (se configurado)
+        destinos.append((NotificacaoPendente.CANAL_TEAMS, config.webhook_teams))
+    # Slack (se configurado)
     if config.webhook_slack:
-        # (implementar a função enviar_notificacao_slack) #complete aqui 
-        pass
+        destinos.append((NotificacaoPendente.CANAL_SLACK, config.webhook_slack))
+
+    NotificacaoPendente.objects.bulk_create([
+        NotificacaoPendente(
+            usuario=usuario, canal=canal, destino=destino, assunto=assunto, mensagem=mensagem,
+            proxima_tentativa=liberacao,
+        )
+        for canal, destino in destinos
+    ])
+
+
+# --- Entrega (usada pelo worker) ---
+
+# Monta o assunto e a mensagem de um grupo de notificações para o mesmo destino.
+# Um grupo com uma só notificação é enviado como está; com várias, vira um resumo.
+def montar_resumo(notificacoes):
+    if len(notificacoes) == 1:
+        return notificacoes[0].assunto, notificacoes[0].mensagem
+    assunto = f"[Resumo] {len(notificacoes)} notificações"
+    mensagem = "\n\n".join(f"- {n.assunto}\n{n.mensagem}" for n in notificacoes)
+    return assunto, mensagem
+
+
+# Entrega um grupo de notificações (mesmo canal e destino) em uma única mensagem.
+# Lança exceção em caso de erro.
+def entregar_notificacao(notificacoes):
+    canal, destino = notificacoes[0].canal, notificacoes[0].destino
+    assunto, mensagem = montar_resumo(notificacoes)
+    if canal == NotificacaoPendente.CANAL_EMAIL:
+        with medir('smtp'):
+            send_mail(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [destino])
+    elif canal == NotificacaoPendente.CANAL_TEAMS:
+        _postar_webhook(destino, _payload_teams(assunto, mensagem))
+    elif canal == NotificacaoPendente.CANAL_SLACK:
+        _postar_webhook(destino, _payload_slack(assunto, mensagem))
+    else:
+        raise ValueError(f"Canal de notificação desconhecido: {canal}")
+
+
+# Calcula quando a próxima tentativa pode acontecer (backoff exponencial com um pouco de aleatoriedade,
+# para que falhas em massa não voltem todas ao mesmo tempo).
+def _proxima_tentativa(tentativas, agora):
+    espera = min(BACKOFF_BASE * 2 ** (tentativas - 1), BACKOFF_MAXIMO)
+    return agora + timedelta(seconds=espera * random.uniform(0.8, 1.2))
+
+
+# Reserva até 'limite' notificações vencidas para este worker.
+# skip_locked faz com que vários workers em paralelo nunca peguem as mesmas linhas.
+def _reservar_lote(limite):
+    agora = timezone.now()
+    with transaction.atomic():
+        lote = list(
+            NotificacaoPendente.objects.select_for_update(skip_locked=True)
+            .filter(status=NotificacaoPendente.STATUS_PENDENTE, proxima_tentativa__lte=agora)
+            .order_by('proxima_tentativa')[:limite]
+        )
+        if lote:
+            NotificacaoPendente.objects.filter(id__in=[n.id for n in lote]).update(
+                proxima_tentativa=agora + PRAZO_RESERVA
+            )
+    return lote
+
+
+# Estende a reserva das notificações ainda pendentes do lote. Só as que ainda estão reservadas (prazo
+# no futuro): se o prazo de alguma já venceu, outro worker pode tê-la reservado.
+def _renovar_reserva(ids):
+    agora = timezone.now()
+    NotificacaoPendente.objects.filter(
+        id__in=ids, status=NotificacaoPendente.STATUS_PENDENTE, proxima_tentativa__gt=agora,
+    ).update(proxima_tentativa=agora + PRAZO_RESERVA)
+
+
+def _entregar_capturando(notificacoes):
+    try:
+        entregar_notificacao(notificacoes)
+        return None
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+
+
+# Entrega todos os grupos de e-mail do lote pela mesma conexão SMTP.
+def _entregar_emails(grupos):
+    return enviar_emails_em_lote([
+        (grupo[0].destino, *montar_resumo(grupo)) for grupo in grupos
+    ])
+
+
+# Cria o pool de threads de entrega. Quem processa a fila continuamente deve reaproveitar o mesmo
+# executor entre os lotes, para que as sessões HTTP (uma por thread e host) continuem abertas.
+def criar_executor_entregas(workers=4):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notificacao')
+
+
+# Separa as notificações por (usuário, canal, destino), preservando a ordem de chegada.
+def agrupar_por_destino(notificacoes):
+    grupos = {}
+    for notificacao in notificacoes:
+        grupos.setdefault((notificacao.usuario_id, notificacao.canal, notificacao.destino), []).append(notificacao)
+    return list(grupos.values())
+
+
+# Entrega os grupos no executor: todos os e-mails vão juntos em uma tarefa (uma conexão SMTP)
+# e cada grupo de webhook é uma tarefa separada. Retorna os erros na ordem de 'grupos'.
+# 'renovar', se informada, é chamada (nesta thread) a cada terço de PRAZO_RESERVA enquanto houver entregas em andamento.
+def _entregar_grupos(executor, grupos, renovar=None):
+    emails = [i for i, grupo in enumerate(grupos) if grupo[0].canal == NotificacaoPendente.CANAL_EMAIL]
+    webhooks = [i for i, grupo in enumerate(grupos) if grupo[0].canal != NotificacaoPendente.CANAL_EMAIL]
+
+    futuro_emails = executor.submit(_entregar_emails, [grupos[i] for i in emails]) if emails else None
+    futuros = [executor.submit(_entregar_capturando, grupos[i]) for i in webhooks]
+
+    pendentes = [futuro for futuro in (futuro_emails, *futuros) if futuro is not None]
+    while pendentes:
+        _, pendentes = wait(pendentes, timeout=PRAZO_RESERVA.total_seconds() / 3)
+        if pendentes and renovar is not None:
+            renovar()
+
+    erros = [None] * len(grupos)
+    for i, futuro in zip(webhooks, futuros):
+        erros[i] = futuro.result()
+    if futuro_emails is not None:
+        try:
+            for i, erro in zip(emails, futuro_emails.result()):
+                erros[i] = erro
+        except Exception as e:
+            for i in emails:
+                erros[i] = str(e) or e.__class__.__name__
+    return erros
+
+
+# Processa um lote da fila: agrupa por destinatário e canal, entrega cada grupo como uma única
+# mensagem (em paralelo, no 'executor') e grava o resultado de cada notificação.
+# Retorna um dicionário com as contagens de notificações (enviadas, reagendadas, falhas).
+def processar_fila_notificacoes(executor=None, limite=100):
+    lote = _reservar_lote(limite)
+    resultado = {'enviadas': 0, 'reagendadas': 0, 'falhas': 0}
+    if not lote:
+        return resultado
+    grupos = agrupar_por_destino(lote)
+
+    # As threads só falam com SMTP/webhooks; o banco é atualizado aqui, na thread principal.
+    ids = [notificacao.id for notificacao in lote]
+    if executor is None:
+        with criar_executor_entregas() as executor:
+            erros = _entregar_grupos(executor, grupos, lambda: _renovar_reserva(ids))
+    else:
+        erros = _entregar_grupos(executor, grupos, lambda: _renovar_reserva(ids))
+
+    agora = timezone.now()
+    for grupo, erro in zip(grupos, erros):
+        # Um só horário (com a mesma aleatoriedade) para o grupo inteiro: na nova tentativa as
+        # notificações vencem juntas e continuam saindo em um único resumo.
+        proxima = _proxima_tentativa(max(notificacao.tentativas for notificacao in grupo) + 1, agora)
+        for notificacao in grupo:
+            notificacao.tentativas += 1
+            if erro is None:
+                notificacao.status = NotificacaoPendente.STATUS_ENVIADA
+                notificacao.data_envio = agora
+                notificacao.ultimo_erro = None
+                resultado['enviadas'] += 1
+            elif notificacao.tentativas >= MAX_TENTATIVAS:
+                notificacao.status = NotificacaoPendente.STATUS_FALHA
+                notificacao.ultimo_erro = erro
+                resultado['falhas'] += 1
+                print(f"Notificação {notificacao.id} descartada após {notificacao.tentativas} tentativas: {erro}")
+            else:
+                notificacao.proxima_tentativa = proxima
+                notificacao.ultimo_erro = erro
+                resultado['reagendadas'] += 1
+
+    NotificacaoPendente.objects.bulk_update(
+        lote, ['status', 'tentativas', 'proxima_tentativa', 'ultimo_erro', 'data_envio']
+    )
+    return resultado
@@ -1 +1,825 @@
-from django.test import TestCase 
+import json
+
+from django.test import SimpleTestCase, TestCase, modify_settings, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import (
+    Customizacao, Dependencia, DocumentacaoTecnica, HistoricoAlteracao, RegistroMudanca, RevisaoDocumentacao,
+    TipoCustomizacao,
+)
+
+User = get_user_model()
+
+
+# --- Orçamento de consultas ---
+# Garante que um endpoint faz um número fixo de consultas, não importa quantas linhas ele devolve.
+# Uso: self.assertOrcamentoConsultas('/api/customizacoes/', self.criar_customizacoes, limite=3)
+# 'criar(n)' deve deixar pelo menos n linhas no banco; o endpoint é medido com cada quantidade de
+# 'quantidades' e precisa ficar dentro do 'limite' e gastar o mesmo número de consultas em todas.
+class OrcamentoConsultasMixin:
+    quantidades = (1, 10)
+
+    def medir_consultas(self, url, **params):
+        # Mede a resposta "fria": sem páginas em cache (ver cache_http.py).
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, params)
+        self.assertEqual(resposta.status_code, 200, resposta.content[:500])
+        return len(consultas), consultas
+
+    def assertOrcamentoConsultas(self, url, criar, limite, quantidades=None, **params):
+        medidas = {}
+        for quantidade in quantidades or self.quantidades:
+            criar(quantidade)
+            total, consultas = self.medir_consultas(url, **params)
+            sql = '\n'.join(consulta['sql'] for consulta in consultas.captured_queries)
+            self.assertLessEqual(
+                total, limite,
+                f"{url} com {quantidade} linhas fez {total} consultas (limite {limite}):\n{sql}",
+            )
+            medidas[quantidade] = total
+        self.assertEqual(
+            len(set(medidas.values())), 1,
+            f"{url} faz mais consultas conforme cresce o número de linhas (N+1?): {medidas}",
+        )
+
+
+class ConsultasPorEndpointTests(OrcamentoConsultasMixin, TestCase):
+    # Contagem da paginação + página (a autenticação é forçada, sem consulta).
+    LIMITE_LISTAGEM = 2
+    # Sondas da versão das respostas (cache_http.py): RegistroMudanca e, se houver tipos na resposta, a tabela de tipos.
+    SONDAS_CUSTOMIZACOES = 2
+    SONDAS_DOCUMENTACOES = 1
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('analista', password='senha-teste')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.tipos = [TipoCustomizacao.objects.create(nome=f'Tipo {i}') for i in range(3)]
+
+    def criar_customizacoes(self, quantidade):
+        for i in range(Customizacao.objects.count(), quantidade):
+            Customizacao.objects.create(
+                nome=f'Customização {i}', codigo_erp=f'C{i:05d}', tipo=self.tipos[i % 3], criado_por=self.usuario,
+            )
+
+    def criar_historicos(self, quantidade):
+        self.criar_customizacoes(quantidade)
+        customizacoes = list(Customizacao.objects.all())
+        for i in range(HistoricoAlteracao.objects.count(), quantidade):
+            usuario = User.objects.create_user(f'editor{i}')
+            HistoricoAlteracao.objects.create(
+                customizacao=customizacoes[i], alterado_por=usuario, tipo_alteracao='Edição',
+            )
+
+    def criar_dependencias(self, quantidade):
+        self.criar_customizacoes(quantidade + 1)
+        customizacoes = list(Customizacao.objects.order_by('id'))
+        for i in range(Dependencia.objects.count(), quantidade):
+            Dependencia.objects.create(
+                customizacao_origem=customizacoes[i], customizacao_destino=customizacoes[i + 1], tipo_dependencia='Usa',
+            )
+
+    def criar_documentacoes(self, quantidade):
+        self.criar_customizacoes(quantidade)
+        for customizacao in Customizacao.objects.filter(documentacao__isnull=True)[:quantidade]:
+            DocumentacaoTecnica.objects.create(customizacao=customizacao, conteudo='Texto', atualizado_por=self.usuario)
+
+    def test_listagem_de_customizacoes(self):
+        self.assertOrcamentoConsultas(
+            '/api/customizacoes/', self.criar_customizacoes, self.LIMITE_LISTAGEM + self.SONDAS_CUSTOMIZACOES,
+        )
+
+    def test_busca_de_customizacoes(self):
+        # O índice de busca entra como subconsulta na contagem e na página.
+        self.assertOrcamentoConsultas(
+            '/api/customizacoes/', self.criar_customizacoes, self.LIMITE_LISTAGEM + self.SONDAS_CUSTOMIZACOES,
+            search='customizacao',
+        )
+
+    def test_busca_sem_limite_de_resultados(self):
+        from .busca import reindexar_tudo
+
+        Customizacao.objects.bulk_create([
+            Customizacao(nome=f'Fórmula {i}', codigo_erp=f'B{i:04d}', descricao='contabil') for i in range(600)
+        ])
+        Customizacao.objects.create(nome='Fórmula contábil', codigo_erp='B9999')
+        reindexar_tudo()
+        resposta = self.client.get('/api/customizacoes/', {'search': 'formula contabil'})
+        self.assertEqual(resposta.data['count'], 601)
+        # O termo no nome pesa mais que na descrição.
+        self.assertEqual(resposta.data['results'][0]['codigo_erp'], 'B9999')
+        linhas = self.client.get('/api/customizacoes/exportar/', {'formato': 'ndjson', 'search': 'formula contabil'})
+        self.assertEqual(len(b''.join(linhas.streaming_content).splitlines()), 601)
+
+    def test_listagem_do_historico(self):
+        # Paginação por cursor: sem COUNT(*).
+        self.assertOrcamentoConsultas('/api/historico-alteracoes/', self.criar_historicos, self.LIMITE_LISTAGEM - 1)
+
+    def test_listagem_de_dependencias(self):
+        self.assertOrcamentoConsultas('/api/dependencias/', self.criar_dependencias, self.LIMITE_LISTAGEM)
+
+    def test_listagem_de_documentacoes(self):
+        self.assertOrcamentoConsultas(
+            '/api/documentacao-tecnica/', self.criar_documentacoes, self.LIMITE_LISTAGEM + self.SONDAS_DOCUMENTACOES,
+        )
+
+    def test_listagem_de_tipos(self):
+        # Os tipos vêm do setUp; a sonda da versão (cache_http.py) lê a mesma tabela.
+        self.assertOrcamentoConsultas('/api/tipos-customizacao/', lambda quantidade: None, self.LIMITE_LISTAGEM + 1)
+
+    def test_dashboard(self):
+        # Os contadores saem de uma única agregação; a outra consulta traz os itens recentes.
+        self.assertOrcamentoConsultas('/api/dashboard/', self.criar_customizacoes, 2)
+
+    def test_dashboard_conta_por_situacao(self):
+        self.criar_customizacoes(3)
+        Customizacao.objects.filter(codigo_erp='C00000').update(ativo=False)
+        resposta = self.client.get('/api/dashboard/')
+        self.assertEqual(resposta.data['cards'], {'total': 3, 'ativas': 2, 'inativas': 1, 'alteradas_semana': 3})
+        self.assertEqual(len(resposta.data['recentes']), 3)
+        # Salvar uma customização descarta o resumo em cache.
+        Customizacao.objects.create(nome='Nova', codigo_erp='NOVA')
+        resposta = self.client.get('/api/dashboard/')
+        self.assertEqual(resposta.data['cards']['total'], 4)
+        self.assertEqual(resposta.data['recentes'][0]['codigo_erp'], 'NOVA')
+
+    def test_str_nao_consulta_relacionados(self):
+        self.criar_dependencias(3)
+        dependencias = list(Dependencia.objects.all())
+        with self.assertNumQueries(0):
+            [str(dependencia) for dependencia in dependencias]
+        with self.assertNumQueries(1):
+            textos = [str(d) for d in Dependencia.objects.select_related('customizacao_origem', 'customizacao_destino')]
+        self.assertIn('Customização 0 -> Customização 1', textos)
+
+
+class RespostaCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('analista', password='senha-teste')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.tipo = TipoCustomizacao.objects.create(nome='Consulta SQL')
+        Customizacao.objects.create(nome='Fórmula', codigo_erp='F1', tipo=self.tipo)
+
+    def test_listagem_em_cache_e_304(self):
+        resposta = self.client.get('/api/customizacoes/')
+        etag = resposta['ETag']
+        # Só as sondas da versão (RegistroMudanca e tipos), sem ler as customizações.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/customizacoes/').status_code, 200)
+        with self.assertNumQueries(2):
+            resposta = self.client.get('/api/customizacoes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_gravacao_invalida_as_respostas(self):
+        etag = self.client.get('/api/customizacoes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tipo.nome = 'Fórmula Visual'
+            self.tipo.save()
+        resposta = self.client.get('/api/customizacoes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['results'][0]['tipo_nome'], 'Fórmula Visual')
+
+    def test_gravacao_de_outro_processo_invalida_as_respostas(self):
+        etag = self.client.get('/api/customizacoes/')['ETag']
+        # Sem executar os on_commit deste processo, como numa gravação feita por outro worker.
+        with self.captureOnCommitCallbacks(execute=False):
+            Customizacao.objects.create(nome='Nova', codigo_erp='F2', tipo=self.tipo)
+        resposta = self.client.get('/api/customizacoes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['count'], 2)
+
+
+class RoteadorReplicaTests(SimpleTestCase):
+    def test_leitura_volta_ao_principal_depois_de_gravar(self):
+        from config import roteador
+
+        token = roteador._alias_leitura.set(roteador.ALIAS_REPLICA)
+        try:
+            rota = roteador.RoteadorReplica()
+            self.assertEqual(rota.db_for_read(Customizacao), roteador.ALIAS_REPLICA)
+            self.assertEqual(rota.db_for_write(Customizacao), 'default')
+            self.assertIsNone(rota.db_for_read(Customizacao))
+            self.assertEqual(roteador.alias_leitura(), 'default')
+        finally:
+            roteador._alias_leitura.reset(token)
+
+    def test_sem_replica_configurada(self):
+        from config import roteador
+
+        if not roteador.replica_configurada():
+            self.assertFalse(roteador.replica_disponivel())
+        self.assertEqual(roteador.marca_leitura(), '')
+
+
+class ReplicaSQLiteTests(TestCase):
+    # Dois bancos SQLite: o de teste faz o papel do principal e um arquivo temporário o da réplica.
+    # A réplica é configurada depois do setUpClass (e removida antes do tearDownClass) para ficar
+    # fora da transação de cada teste, como um banco de verdade.
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from config import roteador
+
+        super().setUpClass()
+        cls.diretorio = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'], 'NAME': f'{cls.diretorio.name}/replica.sqlite3', 'TEST': {},
+        }
+        with connections['replica'].schema_editor() as editor:
+            for modelo in (TipoCustomizacao, RegistroMudanca):
+                editor.create_model(modelo)
+        cls.configuracao = override_settings(
+            DATABASES={**settings.DATABASES, 'replica': connections.settings['replica']},
+            DATABASE_ROUTERS=['config.roteador.RoteadorReplica'],
+        )
+        cls.configuracao.enable()
+        cls.middleware = modify_settings(MIDDLEWARE={'append': 'config.roteador.RoteamentoReplicaMiddleware'})
+        cls.middleware.enable()
+        roteador._estado_replica.update(verificado_em=0.0)
+
+    @classmethod
+    def tearDownClass(cls):
+        from config import roteador
+
+        cls.middleware.disable()
+        cls.configuracao.disable()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.diretorio.cleanup()
+        roteador._estado_replica.update(verificado_em=0.0, disponivel=False)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('replica', password='senha-teste'))
+        # A réplica ainda não recebeu este tipo.
+        TipoCustomizacao.objects.create(nome='Só no principal')
+
+    def nomes(self):
+        resposta = self.client.get('/api/tipos-customizacao/')
+        self.assertEqual(resposta.status_code, 200)
+        return [tipo['nome'] for tipo in resposta.data['results']]
+
+    def test_leitura_depois_de_gravar_vai_ao_principal(self):
+        self.assertEqual(self.nomes(), [])
+        resposta = self.client.post('/api/tipos-customizacao/', {'nome': 'Novo'}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(self.nomes(), ['Só no principal', 'Novo'])
+
+
+class MetricasTests(SimpleTestCase):
+    def test_histograma_no_formato_prometheus(self):
+        from config.metricas import Histograma
+
+        histograma = Histograma('teste_segundos', 'Teste.', ('dependencia',), limites=(0.1, 1))
+        histograma.observar(0.05, 'erp')
+        histograma.observar(0.5, 'erp')
+        linhas = histograma.exportar()
+        self.assertIn('teste_segundos_bucket{dependencia="erp",le="0.1"} 1', linhas)
+        self.assertIn('teste_segundos_bucket{dependencia="erp",le="+Inf"} 2', linhas)
+        self.assertIn('teste_segundos_count{dependencia="erp"} 2', linhas)
+
+    def test_medir_registra_erros(self):
+        from config.metricas import TEMPO_EXTERNO, medir
+
+        with self.assertRaises(RuntimeError):
+            with medir('smtp'):
+                raise RuntimeError
+        self.assertTrue(any('resultado="erro"' in linha for linha in TEMPO_EXTERNO.exportar()))
+
+
+class MetricasRequisicaoTests(TestCase):
+    def test_acesso_exige_token_ou_staff(self):
+        from unittest import mock
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from config import metricas
+
+        def status(usuario=None, **cabecalhos):
+            request = RequestFactory().get('/metrics', **cabecalhos)
+            request.user = usuario or AnonymousUser()
+            return metricas.exportar_metricas(request).status_code
+
+        staff = User(username='operador', is_staff=True)
+        with mock.patch.object(metricas, 'TOKEN', ''), mock.patch.object(metricas, 'PUBLICAS', False):
+            self.assertEqual(status(), 403)
+            self.assertEqual(status(User(username='comum')), 403)
+            self.assertEqual(status(staff), 200)
+        with mock.patch.object(metricas, 'TOKEN', ''), mock.patch.object(metricas, 'PUBLICAS', True):
+            self.assertEqual(status(), 200)
+        with mock.patch.object(metricas, 'TOKEN', 'segredo'):
+            self.assertEqual(status(staff), 403)
+            self.assertEqual(status(HTTP_AUTHORIZATION='Bearer segredo'), 200)
+
+    def test_streaming_conta_as_consultas_do_envio(self):
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory
+        from config.metricas import CONSULTAS_SQL, MetricasMiddleware
+
+        def linhas():
+            for pk in Customizacao.objects.values_list('id', flat=True):
+                yield f'{pk}\n'
+            yield f'{TipoCustomizacao.objects.count()}\n'
+
+        def series():
+            return {linha for linha in CONSULTAS_SQL.exportar() if 'acao="streaming_teste"' in linha}
+
+        request = RequestFactory().get('/exportar')
+        request.resolver_match = type('Rota', (), {'route': 'exportar', 'func': None, 'view_name': 'streaming_teste'})()
+        resposta = MetricasMiddleware(lambda request: StreamingHttpResponse(linhas()))(request)
+        self.assertEqual(series(), set())
+        b''.join(resposta.streaming_content)
+        self.assertIn('http_consultas_sql_bucket{endpoint="/exportar",metodo="GET",acao="streaming_teste",status="2xx",le="2"} 1', series())
+
+
+class AutenticacaoCacheTests(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from users.autenticacao import _usuarios
+
+        _usuarios.limpar()
+        cache.clear()
+        self.usuario = get_user_model().objects.create_user('jwt', 'jwt@jotanunes.com', 'senha')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.usuario)}')
+
+    def _consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get('/api/historico-alteracoes/').status_code, 200)
+        return len(consultas)
+
+    def test_usuario_em_cache_poupa_uma_consulta(self):
+        primeira = self._consultas()
+        self.assertEqual(self._consultas(), primeira - 1)
+
+    def test_usuario_desativado_perde_o_acesso(self):
+        self._consultas()
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get('/api/historico-alteracoes/').status_code, 401)
+
+    def test_alteracao_em_outro_processo_perde_o_acesso(self):
+        from unittest import mock
+        from users import autenticacao
+
+        # Como com o Redis: o cache do Django (aqui o LocMem do teste) faz o papel do cache compartilhado.
+        with mock.patch.object(autenticacao, 'VERSAO_COMPARTILHADA', True):
+            self._consultas()
+            # Outro processo desativa o usuário: o sinal dele só muda a versão no cache compartilhado,
+            # sem mexer no cache em memória deste processo.
+            get_user_model().objects.filter(pk=self.usuario.pk).update(is_active=False)
+            cache.set(autenticacao._chave_versao(self.usuario.pk), 'outro-processo', timeout=None)
+            self.assertEqual(self.client.get('/api/historico-alteracoes/').status_code, 401)
+
+
+class AuditoriaTests(TestCase):
+    def setUp(self):
+        self.usuario = get_user_model().objects.create_user('auditor', 'auditor@jotanunes.com', 'senha')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        tipo = TipoCustomizacao.objects.create(nome='Consulta SQL')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customizacao = Customizacao.objects.create(
+                nome='Antiga', tipo=tipo, codigo_erp='A1', codigo_fonte='SELECT 1', criado_por=self.usuario,
+            )
+
+    def test_edicao_registra_as_diferencas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(f'/api/customizacoes/{self.customizacao.id}/', {'nome': 'Nova'}, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.content[:500])
+        historico = HistoricoAlteracao.objects.get(customizacao=self.customizacao, tipo_alteracao='Edição')
+        self.assertEqual(historico.alterado_por, self.usuario)
+        self.assertEqual(json.loads(historico.alteracoes), {'nome': {'de': 'Antiga', 'para': 'Nova'}})
+
+    def test_registros_da_transacao_sao_gravados_juntos(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for i in range(3):
+                    self.customizacao.nome = f'Nome {i}'
+                    self.customizacao.save()
+        self.assertFalse(HistoricoAlteracao.objects.filter(tipo_alteracao='Edição').exists())
+        with CaptureQueriesContext(connection) as consultas:
+            for callback in callbacks:
+                callback()
+        inserts = [c for c in consultas.captured_queries if 'INSERT' in c['sql'] and 'historicoalteracao' in c['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(HistoricoAlteracao.objects.filter(tipo_alteracao='Edição').count(), 3)
+
+    def test_savepoint_desfeito_nao_grava_seus_registros(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.customizacao.nome = 'Confirmado'
+                self.customizacao.save()
+                # O último savepoint também é desfeito: o buffer ainda precisa ser gravado.
+                for nome in ('Desfeito 1', 'Desfeito 2'):
+                    with self.assertRaises(RuntimeError), transaction.atomic():
+                        self.customizacao.nome = nome
+                        self.customizacao.save()
+                        raise RuntimeError
+        edicoes = HistoricoAlteracao.objects.filter(tipo_alteracao='Edição')
+        self.assertEqual(
+            [json.loads(h.alteracoes)['nome']['para'] for h in edicoes], ['Confirmado'],
+        )
+
+
+class LoteConcorrenteTests(TestCase):
+    def test_codigo_gravado_por_outra_requisicao_vira_erro_do_item(self):
+        from unittest import mock
+        from . import lote
+
+        usuario = get_user_model().objects.create_user('importador', 'importador@jotanunes.com', 'senha')
+        client = APIClient()
+        client.force_authenticate(usuario)
+        validar_codigos = lote._validar_codigos
+        concorrente = {'codigo': 'C2'}
+
+        # A outra requisição grava o código logo depois da primeira validação deste lote.
+        def validar_e_concorrer(validos, erros, *args):
+            validar_codigos(validos, erros, *args)
+            if concorrente['codigo']:
+                Customizacao.objects.create(nome='Concorrente', codigo_erp=concorrente['codigo'])
+                concorrente['codigo'] = None
+
+        itens = [{'nome': 'Primeira', 'codigo_erp': 'C1'}, {'nome': 'Segunda', 'codigo_erp': 'C2'}]
+        with mock.patch.object(lote, '_validar_codigos', validar_e_concorrer):
+            resposta = client.post('/api/customizacoes/lote/', itens, format='json')
+            self.assertEqual(resposta.status_code, 400, resposta.content[:500])
+            self.assertEqual(resposta.json()['resultados'], [
+                {'indice': 1, 'status': 'erro', 'erros': {'codigo_erp': ['Já existe uma customização com o código C2.']}},
+            ])
+            self.assertFalse(Customizacao.objects.filter(codigo_erp='C1').exists())
+
+            concorrente['codigo'] = 'C4'
+            resposta = client.post('/api/customizacoes/lote/?ignorar_invalidos=true', [
+                {'nome': 'Terceira', 'codigo_erp': 'C3'}, {'nome': 'Quarta', 'codigo_erp': 'C4'},
+            ], format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.content[:500])
+        self.assertEqual([r['status'] for r in resposta.json()['resultados']], ['criada', 'erro'])
+        self.assertTrue(Customizacao.objects.filter(codigo_erp='C3', nome='Terceira').exists())
+
+
+class ListagemRapidaTests(TestCase):
+    def setUp(self):
+        usuario = get_user_model().objects.create_user('leitor', 'leitor@jotanunes.com', 'senha')
+        tipo = TipoCustomizacao.objects.create(nome='Fórmula Visual')
+        # Com e sem tipo (tipo_nome some do JSON), com e sem autor e alterações no histórico.
+        com_tipo = Customizacao.objects.create(nome='Com tipo', tipo=tipo, codigo_erp='R1', criado_por=usuario)
+        sem_tipo = Customizacao.objects.create(nome='Sem tipo', codigo_erp='R2', ativo=False)
+        Dependencia.objects.create(customizacao_origem=com_tipo, customizacao_destino=sem_tipo, tipo_dependencia='SQL')
+        HistoricoAlteracao.objects.create(customizacao=sem_tipo, tipo_alteracao='Manual', detalhes_alteracao='Sem autor')
+        HistoricoAlteracao.objects.create(
+            customizacao=com_tipo, alterado_por=usuario, tipo_alteracao='Edição',
+            alteracoes=json.dumps({'nome': {'de': 'Á', 'para': 'B'}}),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(usuario)
+
+    def test_mesmo_json_que_o_serializer(self):
+        from rest_framework.renderers import JSONRenderer
+        from .listagem import MapeadorListagem
+        from .views import CustomizacaoViewSet, DependenciaViewSet, HistoricoAlteracaoViewSet
+
+        for viewset in (CustomizacaoViewSet, HistoricoAlteracaoViewSet, DependenciaViewSet):
+            with self.subTest(viewset=viewset.__name__):
+                queryset = viewset.queryset.order_by('id')
+                mapeador = MapeadorListagem(viewset.serializer_class, viewset.conversores_listagem)
+                self.assertEqual(
+                    JSONRenderer().render(mapeador.serializar(mapeador.consultar(queryset))),
+                    JSONRenderer().render(viewset.serializer_class(queryset, many=True).data),
+                )
+
+    def test_listagem_paginada(self):
+        resposta = self.client.get('/api/historico-alteracoes/', {'page_size': 1})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['results'][0]['alteracoes'], {'nome': {'de': 'Á', 'para': 'B'}})
+        self.assertEqual(self.client.get(resposta.json()['next']).json()['results'][0]['detalhes_alteracao'], 'Sem autor')
+
+
+class RevisoesTests(TestCase):
+    def setUp(self):
+        self.usuario = get_user_model().objects.create_user('redator', 'redator@jotanunes.com', 'senha')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        customizacao = Customizacao.objects.create(nome='Com documentação', codigo_erp='D1')
+        resposta = self.client.post(
+            '/api/documentacao-tecnica/', {'customizacao': customizacao.id, 'conteudo': 'v1'}, format='json',
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.content[:500])
+        self.documentacao = DocumentacaoTecnica.objects.get(pk=resposta.json()['id'])
+
+    def editar(self, conteudo):
+        resposta = self.client.patch(
+            f'/api/documentacao-tecnica/{self.documentacao.pk}/', {'conteudo': conteudo}, format='json',
+        )
+        self.assertEqual(resposta.status_code, 200, resposta.content[:500])
+
+    def textos(self):
+        from .revisoes import obter_conteudo
+        numeros = RevisaoDocumentacao.objects.filter(documentacao=self.documentacao).values_list('numero', flat=True)
+        return [obter_conteudo(self.documentacao.pk, numero) for numero in numeros]
+
+    def test_edicao_concorrente_com_instancia_desatualizada(self):
+        from types import SimpleNamespace
+        from .serializers import DocumentacaoTecnicaSerializer
+        from .views import DocumentacaoTecnicaViewSet
+
+        # As duas edições leem a documentação (revisão 1) antes de qualquer uma gravar.
+        desatualizada = DocumentacaoTecnica.objects.get(pk=self.documentacao.pk)
+        self.editar('v2')
+        view = DocumentacaoTecnicaViewSet()
+        view.request = SimpleNamespace(user=self.usuario)
+        serializer = DocumentacaoTecnicaSerializer(desatualizada, data={'conteudo': 'v3'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        view.perform_update(serializer)
+
+        self.assertEqual(DocumentacaoTecnica.objects.get(pk=self.documentacao.pk).revisao_atual, 3)
+        self.editar('v4')
+        self.assertEqual(self.textos(), ['v1', 'v2', 'v3', 'v4'])
+
+    def test_gravacao_fora_da_api_entra_no_historico(self):
+        self.editar('v2')
+        # Ex: admin ou shell, com uma instância lida antes da edição pela API.
+        fora = DocumentacaoTecnica.objects.get(pk=self.documentacao.pk)
+        fora.conteudo = 'manual'
+        fora.save()
+        self.editar('v3')
+        self.assertEqual(self.textos(), ['v1', 'v2', 'manual', 'v3'])
+        self.assertIsNone(RevisaoDocumentacao.objects.get(documentacao=self.documentacao, numero=3).autor)
+
+
+class FeedMudancasTests(TestCase):
+    def registrar(self, **campos):
+        RegistroMudanca.objects.bulk_create([RegistroMudanca(modelo='customizacao', operacao='criacao', **campos)])
+
+    def test_buraco_e_esperado_a_partir_de_quando_foi_visto(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import mudancas
+
+        base = (RegistroMudanca.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        self.registrar(id=base, objeto_id=1)
+        self.registrar(id=base + 2, objeto_id=3)
+        # Registros antigos: uma transação aberta há mais que a janela ainda pode confirmar o base + 1.
+        RegistroMudanca.objects.filter(id__gte=base).update(data=timezone.now() - timedelta(hours=1))
+
+        registros, proximo, tem_mais = mudancas.ler_mudancas(base - 1)
+        self.assertEqual([registro.id for registro in registros], [base])
+        self.assertTrue(tem_mais)
+        self.assertEqual(mudancas.ler_mudancas(proximo)[0], [])
+
+        # Passada a janela desde que o buraco foi visto, ele é pulado.
+        mudancas._lacunas_vistas[base + 1] -= mudancas.JANELA_LACUNA.total_seconds()
+        self.assertEqual([registro.id for registro in mudancas.ler_mudancas(proximo)[0]], [base + 2])
+
+    def test_espera_invalida(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('feed', password='senha-teste'))
+        for espera in ('nan', 'inf', 'abc'):
+            self.assertEqual(client.get('/api/mudancas/', {'espera': espera}).status_code, 400, espera)
+
+    def test_espera_acorda_com_gravacao_de_outro_processo(self):
+        from unittest import mock
+        from . import mudancas
+
+        ultimo = RegistroMudanca.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        # Durante a espera, outro processo grava (sem sinais nem cache deste processo).
+        def dormir(segundos):
+            self.registrar(objeto_id=42)
+
+        with mock.patch.object(mudancas.time, 'sleep', dormir):
+            registros, _, _ = mudancas.aguardar_mudancas(ultimo, espera=5)
+        self.assertEqual([registro.objeto_id for registro in registros], [42])
+
+
+class GrafoDependenciasTests(TestCase):
+    def test_gravacao_de_outro_processo_recarrega_o_grafo(self):
+        from .grafo import obter_grafo
+        from .mudancas import registrar_mudancas
+
+        a, b, c = [Customizacao.objects.create(nome=f'G{i}', codigo_erp=f'G{i}') for i in range(3)]
+        Dependencia.objects.create(customizacao_origem=a, customizacao_destino=b)
+        self.assertEqual(obter_grafo().dependencias(a.pk), {b.pk: 1})
+        # Outro processo: grava sem sinais e sem acesso à memória deste, só registrando a mudança no banco.
+        nova = Dependencia.objects.bulk_create([Dependencia(customizacao_origem=b, customizacao_destino=c)])
+        registrar_mudancas(Dependencia, [dependencia.pk for dependencia in nova], RegistroMudanca.OPERACAO_CRIACAO)
+        self.assertEqual(obter_grafo().dependencias(a.pk), {b.pk: 1, c.pk: 2})
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('exportador', password='senha-teste'))
+        self.customizacoes = [Customizacao.objects.create(nome=f'Exp {i}', codigo_erp=f'E{i}') for i in range(4)]
+        # As duas últimas foram alteradas no mesmo instante.
+        self.datas = [timezone.now().replace(microsecond=0) - timedelta(minutes=m) for m in (30, 20, 10, 10)]
+        for customizacao, data in zip(self.customizacoes, self.datas):
+            Customizacao.objects.filter(pk=customizacao.pk).update(data_ultima_alteracao=data)
+
+    def exportar(self, **params):
+        resposta = self.client.get('/api/customizacoes/exportar/', params)
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        import csv
+
+        linhas = list(csv.reader(self.exportar(formato='csv').lstrip('\ufeff').splitlines()))
+        self.assertEqual(linhas[0][:2], ['id', 'nome'])
+        self.assertEqual([linha[1] for linha in linhas[1:]], ['Exp 0', 'Exp 1', 'Exp 2', 'Exp 3'])
+
+    def test_ndjson_incremental_pela_data_e_id(self):
+        def ids(**params):
+            return [json.loads(linha)['id'] for linha in self.exportar(formato='ndjson', **params).splitlines()]
+
+        todos = [customizacao.id for customizacao in self.customizacoes]
+        empate = self.datas[2].isoformat()
+        # Só a data: as linhas com exatamente essa data também vêm (nenhuma se perde no empate).
+        self.assertEqual(ids(since=empate), todos[2:])
+        # Data e id da última linha recebida: retoma logo depois dela.
+        self.assertEqual(ids(since=empate, since_id=todos[2]), todos[3:])
+        self.assertEqual(ids(since=empate, since_id=todos[3]), [])
+        self.assertEqual(self.client.get('/api/customizacoes/exportar/', {'since_id': 1}).status_code, 400)
+
+
+class AnaliseDependenciasTests(TestCase):
+    def test_nomes_sem_diferenciar_maiusculas(self):
+        from .analisador_sql import analisar_dependencias
+
+        destino = Customizacao.objects.create(nome='vw_Clientes_Ativos', codigo_erp='Vw01')
+        origem = Customizacao.objects.create(nome='Relatório', codigo_erp='R01', codigo_fonte='SELECT * FROM dbo.VW_CLIENTES_ATIVOS')
+        codigo = Customizacao.objects.create(nome='Outro', codigo_erp='R02', codigo_fonte='exec vw01')
+        analisar_dependencias()
+        self.assertEqual(
+            set(Dependencia.objects.values_list('customizacao_origem_id', 'customizacao_destino_id')),
+            {(origem.pk, destino.pk), (codigo.pk, destino.pk)},
+        )
+
+    def test_sincronizacao_analisa_as_customizacoes_do_lote(self):
+        from datetime import datetime
+        from .erp_integrator import _processar_lote, obter_usuario_sistema
+
+        destino = Customizacao.objects.create(nome='FCLIENTES', codigo_erp='900')
+        linhas = [(1, 'Fórmula', 'SQL', datetime(2024, 5, 1), 'SELECT NOME FROM FCLIENTES')]
+        with transaction.atomic():
+            criadas, _ = _processar_lote(linhas, obter_usuario_sistema(), {})
+        self.assertTrue(
+            Dependencia.objects.filter(customizacao_origem_id=criadas[0].id, customizacao_destino=destino).exists()
+        )
+
+
+class EnvioEmailsEmLoteTests(SimpleTestCase):
+    def test_so_a_mensagem_que_falhou_fica_com_erro(self):
+        import smtplib
+        from unittest import mock
+        from django.core.mail.backends.locmem import EmailBackend
+        from . import notificacao
+
+        class Backend(EmailBackend):
+            enviados = []
+
+            def send_messages(self, mensagens):
+                for mensagem in mensagens:
+                    if mensagem.to == ['recusado@exemplo.com']:
+                        raise smtplib.SMTPRecipientsRefused({'recusado@exemplo.com': (550, b'Unknown user')})
+                    self.enviados.extend(mensagem.to)
+                return len(mensagens)
+
+        mensagens = [(f'{nome}@exemplo.com', 'Assunto', 'Texto') for nome in ('a', 'recusado', 'b', 'c')]
+        with mock.patch.object(notificacao, 'get_connection', lambda **kwargs: Backend(**kwargs)):
+            resultados = notificacao.enviar_emails_em_lote(mensagens, tamanho_lote=3)
+        self.assertEqual([resultado is None for resultado in resultados], [True, False, True, True])
+        self.assertEqual(Backend.enviados, ['a@exemplo.com', 'b@exemplo.com', 'c@exemplo.com'])
+
+
+class PoolConexoesERPTests(SimpleTestCase):
+    def test_pool_esgotado(self):
+        import pyodbc
+        from .erp_pool import ErroPoolERP, PoolConexoesERP
+
+        class Conexao:
+            def close(self):
+                pass
+
+        pool = PoolConexoesERP(fabrica=Conexao, tamanho_maximo=1, timeout_espera=0.2)
+        with pool.conexao():
+            # Quem já trata as falhas do ERP com "except pyodbc.Error" trata também o pool esgotado.
+            with self.assertRaises(pyodbc.Error) as contexto:
+                with pool.conexao():
+                    pass
+        self.assertIsInstance(contexto.exception, ErroPoolERP)
+        estatisticas = pool.estatisticas()
+        # Uma espera por checkout, por mais vezes que a thread tenha acordado; a conexão voltou ao pool.
+        self.assertEqual(estatisticas['esperas'], 1)
+        self.assertEqual((estatisticas['abertas'], estatisticas['livres'], estatisticas['descartadas']), (1, 1, 0))
+
+
+class ReconciliacaoERPTests(TestCase):
+    def test_edicao_no_erp_aparece_na_reconciliacao(self):
+        from datetime import datetime, timedelta
+        from unittest import mock
+        from . import erp_integrator
+        from .sincronizacao import executar_sincronizacao, reconciliacao_pendente
+
+        linha = [7, 'Fórmula', 'SQL', datetime(2024, 5, 1), 'SELECT 1']
+
+        def ler_em_blocos(sql, parametros, tamanho):
+            yield [tuple(linha)]
+
+        with mock.patch.object(erp_integrator, 'ler_em_blocos', ler_em_blocos):
+            self.assertTrue(reconciliacao_pendente(timedelta(hours=1)))
+            self.assertEqual(executar_sincronizacao('teste', 60, reconciliar=True).inseridas, 1)
+            self.assertFalse(reconciliacao_pendente(timedelta(hours=1)))
+            # O ERP edita uma customização antiga (a data de criação não muda).
+            linha[4] = 'SELECT 2'
+            execucao = executar_sincronizacao('teste', 60, reconciliar=True)
+        self.assertEqual((execucao.lidas, execucao.inseridas, execucao.alteradas, execucao.erro), (1, 0, 1, None))
+        self.assertEqual(Customizacao.objects.get(codigo_erp='7').codigo_fonte, 'SELECT 2')
+
+
+class BuscaIndexadaTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('buscador', password='senha-teste'))
+        self.customizacao = Customizacao.objects.create(nome='Relatório X9000 xyz', codigo_erp='BX1')
+
+    def contar(self, texto):
+        return self.client.get('/api/customizacoes/', {'search': texto}).data['count']
+
+    def test_prefixo_terminado_em_z_ou_9(self):
+        self.assertEqual(self.contar('x9'), 1)
+        self.assertEqual(self.contar('xyz'), 1)
+
+    def test_documentacao_excluida_sai_do_indice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            documentacao = DocumentacaoTecnica.objects.create(customizacao=self.customizacao, conteudo='Rateio gerencial')
+        self.assertEqual(self.contar('rateio'), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            documentacao.delete()
+        self.assertEqual(self.contar('rateio'), 0)
+        self.assertEqual(self.contar('relatorio'), 1)
+
+
+class FilaNotificacoesTests(TestCase):
+    def setUp(self):
+        from users.models import NotificacaoPendente
+
+        self.usuario = User.objects.create_user('notificado', password='senha-teste')
+        self.criar = lambda **campos: NotificacaoPendente.objects.create(
+            usuario=self.usuario, canal=NotificacaoPendente.CANAL_TEAMS, destino='https://webhook.exemplo.com/x',
+            assunto='Aviso', mensagem='Texto', **campos,
+        )
+
+    def test_entrega_mais_longa_que_a_reserva_nao_e_reservada_de_novo(self):
+        import time
+        from datetime import timedelta
+        from unittest import mock
+        from . import notificacao
+
+        self.criar()
+        reservas_concorrentes = []
+        renovar = notificacao._renovar_reserva
+
+        def renovar_e_tentar_reservar(ids):
+            renovar(ids)
+            # Outro worker, depois que o prazo original da reserva já venceu.
+            reservas_concorrentes.append(notificacao._reservar_lote(10))
+
+        with mock.patch.object(notificacao, 'PRAZO_RESERVA', timedelta(seconds=0.3)), \
+                mock.patch.object(notificacao, 'entregar_notificacao', lambda grupo: time.sleep(0.7)), \
+                mock.patch.object(notificacao, '_renovar_reserva', renovar_e_tentar_reservar):
+            resultado = notificacao.processar_fila_notificacoes()
+        self.assertEqual(resultado['enviadas'], 1)
+        self.assertGreaterEqual(len(reservas_concorrentes), 2)
+        self.assertEqual([lote for lote in reservas_concorrentes if lote], [])
+
+    def test_resumo_que_falhou_volta_junto(self):
+        from unittest import mock
+        from users.models import NotificacaoPendente
+        from . import notificacao
+
+        self.criar()
+        self.criar(tentativas=2)
+
+        def falhar(grupo):
+            raise RuntimeError('webhook fora do ar')
+
+        with mock.patch.object(notificacao, 'entregar_notificacao', falhar):
+            self.assertEqual(notificacao.processar_fila_notificacoes()['reagendadas'], 2)
+        tentativas = set(NotificacaoPendente.objects.values_list('proxima_tentativa', flat=True))
+        # O mesmo horário para as duas: na próxima tentativa elas saem de novo em um só resumo.
+        self.assertEqual(len(tentativas), 1)
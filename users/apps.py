@@ -0,0 +1,12 @@
+# users/apps.py
+from django.apps import AppConfig
+
+
+class UsersConfig(AppConfig):
+    name = 'users'
+
+    def ready(self):
+        # Conecta os receptores que descartam o usuário do cache da autenticação JWT. Sem isto eles só
+        # seriam registrados na primeira requisição autenticada, e um 'manage.py changepassword' (ou
+        # outro comando) não invalidaria os tokens em cache.
+        from . import autenticacao  # noqa: F401
@@ -0,0 +1,122 @@
+# users/autenticacao.py
+# Autenticação JWT com cache dos usuários em memória.
+#
+# O JWTAuthentication do simplejwt busca o User no banco a cada requisição, antes de qualquer
+# código da view. Aqui o usuário fica num cache LRU do processo (até AUTH_CACHE_USUARIOS_MAXIMO
+# usuários, por AUTH_CACHE_USUARIOS_TTL segundos), então a maioria das requisições autenticadas
+# não consulta o banco para isso.
+#
+# O token continua sendo validado (assinatura e expiração) em toda requisição, e as verificações
+# sobre o usuário (ativo, senha trocada com CHECK_REVOKE_TOKEN) são refeitas sobre o usuário em
+# cache. Salvar ou excluir um usuário o remove do cache deste processo na hora. Com o Redis como
+# cache do Django (CACHE_REDIS_URL, ver CACHES em config/settings.py), os demais processos também
+# percebem na próxima requisição, por um número de versão guardado nele; sem o Redis, não há versão
+# (ler um cache no banco custaria a mesma consulta que se quer evitar) e eles percebem em até TTL
+# segundos, como acontece com alterações que não disparam sinais (QuerySet.update).
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+TTL_USUARIO = getattr(settings, 'AUTH_CACHE_USUARIOS_TTL', 60)
+MAXIMO_USUARIOS = getattr(settings, 'AUTH_CACHE_USUARIOS_MAXIMO', 1000)
+PREFIXO_VERSAO = 'users:autenticacao:versao:'
+# A versão só é consultada se o cache do Django for compartilhado e barato de ler (Redis, Memcached).
+VERSAO_COMPARTILHADA = settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1] in (
+    'RedisCache', 'PyMemcacheCache', 'PyLibMCCache',
+)
+
+
+class CacheUsuarios:
+    """Cache LRU com validade: {id do usuário: (usuário, versão, expira_em)}."""
+
+    def __init__(self, maximo=MAXIMO_USUARIOS, ttl=TTL_USUARIO):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, user_id, versao):
+        with self._lock:
+            item = self._itens.get(user_id)
+            if item is None:
+                return None
+            usuario, versao_item, expira_em = item
+            if versao_item != versao or time.monotonic() >= expira_em:
+                del self._itens[user_id]
+                return None
+            self._itens.move_to_end(user_id)
+        # Cada requisição recebe a sua cópia: atributos guardados no objeto (ex: cache de
+        # permissões) não passam de uma requisição para outra.
+        return copy.copy(usuario)
+
+    def guardar(self, user_id, usuario, versao):
+        with self._lock:
+            self._itens[user_id] = (copy.copy(usuario), versao, time.monotonic() + self.ttl)
+            self._itens.move_to_end(user_id)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def remover(self, user_id):
+        with self._lock:
+            self._itens.pop(user_id, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+_usuarios = CacheUsuarios()
+
+
+def _chave_versao(user_id):
+    return f'{PREFIXO_VERSAO}{user_id}'
+
+
+class JWTAuthenticationCache(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        versao = cache.get(_chave_versao(user_id)) if VERSAO_COMPARTILHADA else None
+        usuario = _usuarios.obter(user_id, versao)
+        if usuario is None:
+            # Consulta o banco e faz todas as verificações do simplejwt; só usuários válidos entram no cache.
+            usuario = super().get_user(validated_token)
+            _usuarios.guardar(user_id, usuario, versao)
+            return usuario
+
+        # As mesmas verificações do simplejwt, sobre o usuário em cache.
+        if not usuario.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(usuario.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return usuario
+
+
+# --- Invalidação pelos sinais ---
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _usuario_alterado(sender, instance, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    _usuarios.remover(user_id)
+    if VERSAO_COMPARTILHADA:
+        cache.set(_chave_versao(user_id), time.time_ns(), timeout=None)
@@ -0,0 +1,228 @@
+# customizacoes/analisador_sql.py
+# Descoberta automática de dependências: lê o texto SQL/fórmula de cada customização (codigo_fonte),
+# extrai as tabelas, views e procedures referenciadas e, quando a referência é outra customização
+# do catálogo, grava a aresta correspondente em Dependencia.
+#
+# - Só customizações cujo texto mudou desde a última análise são reprocessadas (hash_analise).
+# - O parsing (a parte cara) roda em um pool de processos quando há muito trabalho.
+# - As arestas são gravadas em lote: um SELECT, um bulk_create e um DELETE por lote.
+#
+# Os modelos são importados dentro das funções: assim os processos do pool (que no Windows
+# são iniciados do zero) conseguem importar este módulo sem configurar o Django.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlparse
+from sqlparse.sql import Identifier, IdentifierList, Function, Parenthesis
+from sqlparse.tokens import DML, Keyword, Name
+
+from django.db import transaction
+
+# Tipo gravado nas dependências descobertas pelo analisador. Só essas são removidas quando a
+# referência some do SQL; dependências cadastradas à mão nunca são tocadas.
+TIPO_DEPENDENCIA_AUTOMATICA = 'Referência SQL (automática)'
+# Palavras-chave depois das quais vem o nome de um objeto do banco.
+PALAVRAS_OBJETO = {'FROM', 'JOIN', 'INTO', 'UPDATE', 'TABLE', 'EXEC', 'EXECUTE', 'APPLY', 'USING', 'MERGE'}
+# Abaixo desta quantidade de textos, o custo de subir processos não compensa.
+MINIMO_PARA_PROCESSOS = 200
+TAMANHO_LOTE = 500
+# Customizações analisadas por rodada (parsing em paralelo + gravação). Fica abaixo do limite
+# de ~2100 parâmetros por comando do SQL Server nas consultas com __in.
+TAMANHO_LOTE_ANALISE = 2000
+# Quantidade de resultados de extrair_referencias mantidos em memória (os mais recentes).
+MAXIMO_CACHE_REFERENCIAS = 4096
+
+
+def hash_codigo_fonte(texto):
+    return hashlib.blake2b((texto or '').encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _nome_objeto(token):
+    # Nome completo (schema.objeto), sem colchetes/aspas e em maiúsculas.
+    nome = token.get_real_name()
+    if not nome:
+        return None
+    pai = token.get_parent_name()
+    completo = f"{pai}.{nome}" if pai else nome
+    return completo.strip('[]"`').replace('[', '').replace(']', '').upper()
+
+
+def _coletar(tokens, referencias):
+    esperando_objeto = False
+    for token in tokens:
+        if token.is_whitespace or token.ttype in sqlparse.tokens.Comment:
+            continue
+        if token.ttype in Keyword or token.ttype in DML:
+            palavra = token.normalized.upper()
+            # 'LEFT OUTER JOIN', 'INNER JOIN' etc. chegam como uma única palavra-chave.
+            esperando_objeto = palavra.split()[-1] in PALAVRAS_OBJETO
+            continue
+        if esperando_objeto:
+            if isinstance(token, IdentifierList):
+                for identificador in token.get_identifiers():
+                    if isinstance(identificador, Identifier):
+                        _adicionar(identificador, referencias)
+            elif isinstance(token, (Identifier, Function)):
+                _adicionar(token, referencias)
+            elif token.ttype in Name:
+                referencias.add(token.value.strip('[]"`').upper())
+            esperando_objeto = False
+        if token.is_group:
+            # Subconsultas, CTEs, parênteses: analisa o conteúdo também.
+            _coletar(token.tokens, referencias)
+
+
+def _adicionar(token, referencias):
+    # "(SELECT ...) AS x" é uma subconsulta, não um objeto; o conteúdo é analisado por _coletar.
+    if any(isinstance(filho, Parenthesis) for filho in token.tokens):
+        return
+    nome = _nome_objeto(token)
+    if nome:
+        referencias.add(nome)
+
+
+# Extrai os nomes de objetos referenciados por um texto SQL. Função pura (pode rodar em outro processo).
+def extrair_referencias(texto):
+    referencias = set()
+    if texto:
+        for comando in sqlparse.parse(texto):
+            _coletar(comando.tokens, referencias)
+    return tuple(sorted(referencias))
+
+
+# Cache das referências pelo hash do texto. A chave é só o hash: os textos (que podem ser
+# grandes) não ficam presos na memória.
+_cache_referencias = OrderedDict()
+_trava_cache = threading.Lock()
+
+
+# Mesmo resultado de extrair_referencias, com cache em memória pelo hash do texto.
+def _referencias_por_hash(hash_texto, texto):
+    with _trava_cache:
+        referencias = _cache_referencias.get(hash_texto)
+        if referencias is not None:
+            _cache_referencias.move_to_end(hash_texto)
+            return referencias
+    referencias = extrair_referencias(texto)
+    with _trava_cache:
+        _cache_referencias[hash_texto] = referencias
+        if len(_cache_referencias) > MAXIMO_CACHE_REFERENCIAS:
+            _cache_referencias.popitem(last=False)
+    return referencias
+
+
+# Extrai as referências de cada (texto, hash do texto) de 'itens'.
+def _extrair_em_paralelo(itens, processos):
+    if processos and processos > 1 and len(itens) >= MINIMO_PARA_PROCESSOS:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            return list(executor.map(extrair_referencias, [texto for texto, _ in itens], chunksize=50))
+    return [_referencias_por_hash(hash_texto, texto) for texto, hash_texto in itens]
+
+
+# Relaciona os nomes referenciados às customizações do catálogo (pelo código do ERP ou pelo nome).
+# Os nomes extraídos do SQL estão em maiúsculas; a comparação ignora maiúsculas/minúsculas também no
+# banco, que pode ter uma collation que as diferencia.
+def _resolver_nomes(nomes):
+    from django.db.models.functions import Upper
+    from .models import Customizacao
+
+    por_nome = {}
+    nomes = list(nomes)
+    for inicio in range(0, len(nomes), TAMANHO_LOTE):
+        lote = nomes[inicio:inicio + TAMANHO_LOTE]
+        # O último pedaço do nome (sem schema) também vale: 'dbo.VW_X' referencia 'VW_X'.
+        candidatos = set(lote) | {nome.rsplit('.', 1)[-1] for nome in lote}
+        for pk, codigo_erp, nome in Customizacao.objects.annotate(codigo_maiusculo=Upper('codigo_erp')).filter(
+            codigo_maiusculo__in=candidatos
+        ).values_list('id', 'codigo_erp', 'nome').union(
+            Customizacao.objects.annotate(nome_maiusculo=Upper('nome')).filter(
+                nome_maiusculo__in=candidatos
+            ).values_list('id', 'codigo_erp', 'nome')
+        ):
+            por_nome.setdefault(codigo_erp.upper(), pk)
+            por_nome.setdefault(nome.upper(), pk)
+    return por_nome
+
+
+# Analisa as customizações (todas, ou só as de 'ids') e sincroniza as dependências automáticas.
+# Com forcar=True ignora o hash da última análise e reprocessa tudo.
+# Retorna um dicionário com as estatísticas da análise.
+def analisar_dependencias(ids=None, processos=None, forcar=False):
+    from .models import Customizacao, Dependencia, RegistroMudanca
+    from .grafo import invalidar_grafo
+    from .mudancas import registrar_mudancas
+
+    estatisticas = {'analisadas': 0, 'sem_alteracao': 0, 'arestas_criadas': 0, 'arestas_removidas': 0}
+    consulta = Customizacao.objects.exclude(codigo_fonte__isnull=True).exclude(codigo_fonte='')
+    if ids is not None:
+        consulta = consulta.filter(id__in=list(ids))
+
+    pendentes = []
+    for pk, texto, hash_analise in consulta.values_list('id', 'codigo_fonte', 'hash_analise').iterator(chunk_size=2000):
+        hash_texto = hash_codigo_fonte(texto)
+        if not forcar and hash_texto == hash_analise:
+            estatisticas['sem_alteracao'] += 1
+            continue
+        pendentes.append((pk, texto, hash_texto))
+
+    for inicio in range(0, len(pendentes), TAMANHO_LOTE_ANALISE):
+        lote = pendentes[inicio:inicio + TAMANHO_LOTE_ANALISE]
+        referencias = _extrair_em_paralelo([(texto, hash_texto) for _, texto, hash_texto in lote], processos)
+        por_nome = _resolver_nomes({nome for refs in referencias for nome in refs})
+
+        desejadas = set()
+        for (origem, _, _), refs in zip(lote, referencias):
+            for nome in refs:
+                destino = por_nome.get(nome) or por_nome.get(nome.rsplit('.', 1)[-1])
+                if destino and destino != origem:
+                    desejadas.add((origem, destino))
+
+        origens = [pk for pk, _, _ in lote]
+        with transaction.atomic():
+            existentes = set(
+                Dependencia.objects.filter(customizacao_origem_id__in=origens)
+                .values_list('customizacao_origem_id', 'customizacao_destino_id')
+            )
+            automaticas = {
+                (origem, destino): pk
+                for pk, origem, destino in Dependencia.objects.filter(
+                    customizacao_origem_id__in=origens, tipo_dependencia=TIPO_DEPENDENCIA_AUTOMATICA
+                ).values_list('id', 'customizacao_origem_id', 'customizacao_destino_id')
+            }
+            novas = desejadas - existentes
+            obsoletas = automaticas.keys() - desejadas
+
+            Dependencia.objects.bulk_create([
+                Dependencia(
+                    customizacao_origem_id=origem, customizacao_destino_id=destino,
+                    tipo_dependencia=TIPO_DEPENDENCIA_AUTOMATICA,
+                )
+                for origem, destino in novas
+            ], batch_size=TAMANHO_LOTE, ignore_conflicts=True)
+            if novas:
+                # bulk_create não dispara sinais (nem devolve os IDs com ignore_conflicts): relê as
+                # arestas automáticas do lote para registrar as novas no feed de mudanças.
+                registrar_mudancas(Dependencia, [
+                    pk for pk, origem, destino in Dependencia.objects.filter(
+                        customizacao_origem_id__in=origens, tipo_dependencia=TIPO_DEPENDENCIA_AUTOMATICA
+                    ).values_list('id', 'customizacao_origem_id', 'customizacao_destino_id')
+                    if (origem, destino) in novas
+                ], RegistroMudanca.OPERACAO_CRIACAO)
+            if obsoletas:
+                Dependencia.objects.filter(id__in=[automaticas[aresta] for aresta in obsoletas]).delete()
+
+            Customizacao.objects.bulk_update(
+                [Customizacao(id=pk, hash_analise=hash_texto) for pk, _, hash_texto in lote],
+                ['hash_analise'], batch_size=TAMANHO_LOTE,
+            )
+
+        estatisticas['analisadas'] += len(lote)
+        estatisticas['arestas_criadas'] += len(novas)
+        estatisticas['arestas_removidas'] += len(obsoletas)
+
+    if estatisticas['arestas_criadas'] or estatisticas['arestas_removidas']:
+        invalidar_grafo()
+    return estatisticas
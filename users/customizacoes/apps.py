@@ -0,0 +1,12 @@
+# customizacoes/apps.py
+from django.apps import AppConfig
+
+
+class CustomizacoesConfig(AppConfig):
+    name = 'customizacoes'
+
+    def ready(self):
+        # Conecta os receptores de sinais (auditoria, busca, dashboard, feed de mudanças). Sem isto eles
+        # só seriam registrados quando as views fossem importadas, e gravações feitas fora de uma
+        # requisição (sincronizar_erp, shell, outros comandos) não gerariam histórico nem índice.
+        from . import auditoria, busca, dashboard, mudancas  # noqa: F401
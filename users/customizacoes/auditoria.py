@@ -0,0 +1,205 @@
+# customizacoes/auditoria.py
+# Auditoria campo a campo de Customizacao, Dependencia e DocumentacaoTecnica.
+#
+# Cada criação, alteração ou exclusão gera um HistoricoAlteracao com as diferenças em JSON
+# ({"campo": {"de": antigo, "para": novo}}). Os valores antigos vêm de quando o objeto foi lido
+# do banco (AuditoriaMixin.from_db), então calcular a diferença não custa nenhuma consulta.
+#
+# Os registros não são gravados um a um: ficam num buffer da transação atual e são gravados com
+# um único bulk_create quando ela é confirmada (nada é gravado se ela for desfeita). Fora de uma
+# transação, o registro é gravado na hora. As gravações em lote (lote.py, sincronização com o ERP)
+# usam o mesmo buffer por meio de registrar_historico().
+#
+# O autor das alterações é o usuário da requisição (AutorAuditoriaMixin nos ViewSets) ou o
+# informado explicitamente.
+
+import json
+import threading
+import weakref
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Customizacao, Dependencia, DocumentacaoTecnica, HistoricoAlteracao
+
+TAMANHO_LOTE = 500
+
+# Usuário a quem as alterações da requisição atual são atribuídas.
+_autor = ContextVar('autor_auditoria', default=None)
+
+
+class AutorAuditoriaMixin:
+    """Para ViewSets: atribui ao usuário autenticado as alterações feitas durante a requisição."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._token_autor = _autor.set(request.user if request.user.is_authenticated else None)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_token_autor', None)
+        if token is not None:
+            _autor.reset(token)
+            self._token_autor = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# --- Diferenças ---
+
+# Diferenças entre dois dicionários {campo: valor}. Campos ausentes em 'antes' (valor antigo
+# desconhecido, ex: objeto criado sem ler do banco) aparecem só com "para".
+def calcular_alteracoes(antes, depois):
+    alteracoes = {}
+    for campo, valor in depois.items():
+        if campo not in antes:
+            alteracoes[_nome_campo(campo)] = {'para': valor}
+        elif antes[campo] != valor:
+            alteracoes[_nome_campo(campo)] = {'de': antes[campo], 'para': valor}
+    return alteracoes
+
+
+def _nome_campo(campo):
+    # 'tipo_id' aparece como 'tipo', como na API.
+    return campo.removesuffix('_id')
+
+
+def _descrever(alteracoes):
+    return 'Campos alterados: ' + ', '.join(alteracoes) if alteracoes else None
+
+
+# --- Buffer por transação ---
+# Cada registro agenda um transaction.on_commit próprio (a "confirmação"), e o buffer é gravado de uma
+# vez pela última confirmação executada. Se um savepoint é desfeito, o Django descarta as confirmações
+# agendadas dentro dele: elas deixam de existir (o buffer só guarda referências fracas a elas), e os
+# registros correspondentes não são gravados.
+
+_local = threading.local()
+
+
+class _Confirmacao:
+    __slots__ = ('buffer', 'indice', '__weakref__')
+
+    def __init__(self, buffer, indice):
+        self.buffer = buffer
+        self.indice = indice
+
+    def __call__(self):
+        self.buffer.confirmar(self.indice)
+
+
+class _BufferHistorico:
+    def __init__(self, using):
+        self.using = using
+        self.registros = []
+        # Referência fraca à confirmação de cada registro (morta se descartada ou já executada).
+        self.confirmacoes = []
+        self.confirmados = []
+        # Se algum registro é de uma exclusão, a customização pode ter sido excluída na mesma transação.
+        self.verificar_existencia = False
+        self.gravado = False
+
+    def ativo(self):
+        # Ainda na transação que o criou: a confirmação do último registro está agendada.
+        return not self.gravado and bool(self.confirmacoes) and self.confirmacoes[-1]() is not None
+
+    def adicionar(self, registro, exclusao):
+        confirmacao = _Confirmacao(self, len(self.registros))
+        self.registros.append(registro)
+        self.confirmacoes.append(weakref.ref(confirmacao))
+        self.verificar_existencia |= exclusao
+        transaction.on_commit(confirmacao, using=self.using)
+
+    def confirmar(self, indice):
+        self.confirmados.append(self.registros[indice])
+        # As confirmações rodam na ordem em que foram agendadas: se nenhuma das seguintes ainda existe,
+        # esta é a última.
+        for seguinte in range(indice + 1, len(self.confirmacoes)):
+            if self.confirmacoes[seguinte]() is not None:
+                return
+        self.gravar()
+
+    def gravar(self):
+        self.gravado = True
+        registros = self.confirmados
+        if self.verificar_existencia:
+            existentes = set(
+                Customizacao.objects.using(self.using)
+                .filter(id__in={registro.customizacao_id for registro in registros})
+                .values_list('id', flat=True)
+            )
+            registros = [registro for registro in registros if registro.customizacao_id in existentes]
+        HistoricoAlteracao.objects.using(self.using).bulk_create(registros, batch_size=TAMANHO_LOTE)
+
+
+def _buffer(using):
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buffer = buffers.get(using)
+    if buffer is None or not buffer.ativo():
+        buffer = buffers[using] = _BufferHistorico(using)
+    return buffer
+
+
+# Acrescenta um HistoricoAlteracao ao buffer da transação atual (ou o grava, fora de uma transação).
+# 'alteracoes' é o dicionário de calcular_alteracoes(); 'usuario', se omitido, é o autor da requisição.
+def registrar_historico(customizacao_id, tipo_alteracao, alteracoes=None, detalhes=None, usuario=None,
+                        exclusao=False, using=DEFAULT_DB_ALIAS):
+    registro = HistoricoAlteracao(
+        customizacao_id=customizacao_id,
+        alterado_por=usuario if usuario is not None else _autor.get(),
+        tipo_alteracao=tipo_alteracao,
+        detalhes_alteracao=detalhes if detalhes is not None else _descrever(alteracoes),
+        alteracoes=json.dumps(alteracoes, ensure_ascii=False, default=str) if alteracoes else None,
+    )
+    if not connections[using].in_atomic_block:
+        if not exclusao or Customizacao.objects.using(using).filter(id=customizacao_id).exists():
+            registro.save(using=using)
+        return
+    _buffer(using).adicionar(registro, exclusao)
+
+
+# --- Registro automático pelos sinais ---
+
+# (customização do histórico, tipo da criação, da alteração e da exclusão) de cada modelo auditado.
+_MODELOS = {
+    Customizacao: (lambda obj: obj.pk, 'Criação', 'Edição', None),
+    Dependencia: (lambda obj: obj.customizacao_origem_id, 'Dependência criada', 'Dependência alterada', 'Dependência removida'),
+    DocumentacaoTecnica: (lambda obj: obj.customizacao_id, 'Documentação criada', 'Documentação alterada', 'Documentação removida'),
+}
+
+
+@receiver(post_save, sender=Customizacao)
+@receiver(post_save, sender=Dependencia)
+@receiver(post_save, sender=DocumentacaoTecnica)
+def _objeto_salvo(sender, instance, created, raw=False, using=DEFAULT_DB_ALIAS, update_fields=None, **kwargs):
+    if raw:
+        return
+    customizacao, criacao, alteracao, _ = _MODELOS[sender]
+    atuais = instance.valores_auditados()
+    if update_fields is not None:
+        # save(update_fields=[...]) grava só esses campos.
+        atuais = {
+            campo: valor for campo, valor in atuais.items()
+            if campo in update_fields or _nome_campo(campo) in update_fields
+        }
+    originais = {} if created else getattr(instance, '_valores_originais', {})
+    alteracoes = calcular_alteracoes(originais, atuais)
+    # A partir daqui, o próximo save() compara com o que acabou de ser gravado.
+    instance._valores_originais = {**originais, **atuais}
+    if not alteracoes:
+        return
+    tipo = criacao if created else alteracao
+    if sender is Customizacao and not created and set(alteracoes) == {'ativo'}:
+        tipo = 'Reativação' if instance.ativo else 'Desativação'
+    registrar_historico(customizacao(instance), tipo, alteracoes, using=using)
+
+
+@receiver(post_delete, sender=Dependencia)
+@receiver(post_delete, sender=DocumentacaoTecnica)
+def _objeto_excluido(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    # A exclusão de uma customização não entra no histórico: o histórico dela é excluído junto.
+    customizacao, _, _, exclusao = _MODELOS[sender]
+    alteracoes = {_nome_campo(campo): {'de': valor} for campo, valor in instance.valores_auditados().items()}
+    registrar_historico(customizacao(instance), exclusao, alteracoes, exclusao=True, using=using)
@@ -0,0 +1,382 @@
+# customizacoes/benchmark.py
+# Suíte de benchmark (comando "python manage.py benchmark"): gera um catálogo sintético, mede os
+# caminhos quentes da API e da sincronização com o ERP e grava os resultados em JSON, para que
+# execuções em commits diferentes possam ser comparadas.
+#
+# Tudo roda num banco de teste criado para a ocasião (como o "manage.py test"), nunca no banco real.
+# O ERP é substituído por um arquivo SQLite com a mesma tabela FCUSTOMIZACOES, servido pelo mesmo
+# pool de conexões (erp_pool), então a leitura em blocos e o processamento em lote são os de produção.
+#
+# Os dados são gerados a partir de uma semente: a mesma semente e os mesmos tamanhos produzem
+# sempre o mesmo catálogo.
+
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Customizacao, Dependencia, HistoricoAlteracao, TipoCustomizacao
+
+User = get_user_model()
+
+VERSAO_FORMATO = 1
+TAMANHO_LOTE_GERACAO = 5000
+# Vocabulário dos nomes e descrições gerados (e dos termos pesquisados no cenário de busca).
+PALAVRAS = (
+    'formula contabil fiscal folha pagamento estoque compras vendas titulo financeiro '
+    'relatorio consulta sentenca integracao tributo imposto centro custo lancamento '
+    'faturamento cliente fornecedor produto contrato medicao obra orcamento'
+).split()
+TIPOS = ('Fórmula Visual', 'Consulta SQL', 'Relatório', 'Fórmula', 'Integração', 'Processo', 'Tela', 'Gatilho')
+
+
+# --- ERP falso (SQLite) ---
+
+@contextmanager
+def erp_falso(linhas):
+    """Substitui o pool do ERP por um banco SQLite com a tabela FCUSTOMIZACOES preenchida com 'linhas'.
+
+    Produz a conexão SQLite, para que o cenário possa alterar a tabela entre as medições.
+    """
+    from customizacoes import erp_pool
+
+    pasta = tempfile.mkdtemp(prefix='erp_benchmark_')
+    caminho = os.path.join(pasta, 'erp.sqlite3')
+
+    def _conectar():
+        return sqlite3.connect(caminho, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
+    erp = _conectar()
+    erp.execute(
+        "CREATE TABLE FCUSTOMIZACOES (ID_CUSTOMIZACAO INTEGER PRIMARY KEY, NOME TEXT, TIPO TEXT, "
+        "DATA_CRIACAO TIMESTAMP, CONTEUDO TEXT)"
+    )
+    erp.execute("CREATE INDEX FCUSTOMIZACOES_DATA ON FCUSTOMIZACOES (DATA_CRIACAO, ID_CUSTOMIZACAO)")
+    erp.executemany("INSERT INTO FCUSTOMIZACOES VALUES (?, ?, ?, ?, ?)", linhas)
+    erp.commit()
+
+    pool_original = erp_pool._pool
+    erp_pool._pool = erp_pool.PoolConexoesERP(fabrica=_conectar, erros_conexao=(sqlite3.Error,))
+    try:
+        yield erp
+    finally:
+        erp_pool._pool.fechar()
+        erp_pool._pool = pool_original
+        erp.close()
+        os.remove(caminho)
+        os.rmdir(pasta)
+
+
+def gerar_linhas_erp(aleatorio, primeiro_id, quantidade, inicio):
+    # Datas crescentes a partir de 'inicio', como registros criados em sequência no ERP.
+    return [
+        (
+            primeiro_id + i,
+            _frase(aleatorio, 3),
+            aleatorio.choice(TIPOS),
+            inicio + timedelta(seconds=i),
+            f"SELECT * FROM FCUSTOMIZACOES WHERE ID_CUSTOMIZACAO = {primeiro_id + i}",
+        )
+        for i in range(quantidade)
+    ]
+
+
+# --- Geração do catálogo ---
+
+def _frase(aleatorio, palavras):
+    return ' '.join(aleatorio.choices(PALAVRAS, k=palavras))
+
+
+def gerar_catalogo(customizacoes, historicos_por_item, profundidade, arestas_por_item, semente):
+    """Gera tipos, customizações, cadeias de dependências e histórico. Retorna as quantidades geradas.
+
+    As dependências formam cadeias de 'profundidade' customizações (cada uma depende da anterior),
+    mais 'arestas_por_item' arestas aleatórias por customização, sempre para uma anterior (sem ciclos).
+    """
+    from .busca import reindexar_tudo
+
+    aleatorio = random.Random(semente)
+    usuario = User.objects.create_user('benchmark', 'benchmark@jotanunes.com', 'benchmark')
+    TipoCustomizacao.objects.bulk_create([TipoCustomizacao(nome=nome) for nome in TIPOS])
+    tipos = list(TipoCustomizacao.objects.values_list('id', flat=True))
+
+    for inicio in range(0, customizacoes, TAMANHO_LOTE_GERACAO):
+        Customizacao.objects.bulk_create([
+            Customizacao(
+                nome=_frase(aleatorio, 3),
+                tipo_id=aleatorio.choice(tipos),
+                codigo_erp=f'BENCH-{numero:07d}',
+                descricao=_frase(aleatorio, 12),
+                codigo_fonte=f'SELECT {numero} FROM DUAL',
+                criado_por=usuario,
+                ativo=aleatorio.random() > 0.05,
+            )
+            for numero in range(inicio, min(inicio + TAMANHO_LOTE_GERACAO, customizacoes))
+        ], batch_size=1000)
+    ids = list(Customizacao.objects.order_by('id').values_list('id', flat=True))
+
+    arestas = set()
+    for posicao in range(1, len(ids)):
+        if posicao % profundidade:
+            arestas.add((ids[posicao], ids[posicao - 1]))
+        for _ in range(arestas_por_item):
+            destino = ids[aleatorio.randrange(posicao)]
+            if destino != ids[posicao]:
+                arestas.add((ids[posicao], destino))
+    arestas = sorted(arestas)
+    for inicio in range(0, len(arestas), TAMANHO_LOTE_GERACAO):
+        Dependencia.objects.bulk_create([
+            Dependencia(customizacao_origem_id=origem, customizacao_destino_id=destino, tipo_dependencia='Usa')
+            for origem, destino in arestas[inicio:inicio + TAMANHO_LOTE_GERACAO]
+        ], batch_size=1000)
+
+    historicos = 0
+    lote = []
+    for pk in ids:
+        for _ in range(historicos_por_item):
+            lote.append(HistoricoAlteracao(
+                customizacao_id=pk, alterado_por=usuario,
+                tipo_alteracao=aleatorio.choice(('Criação', 'Edição', 'Alteração (ERP)')),
+                detalhes_alteracao=_frase(aleatorio, 8),
+            ))
+        if len(lote) >= TAMANHO_LOTE_GERACAO:
+            HistoricoAlteracao.objects.bulk_create(lote, batch_size=1000)
+            historicos += len(lote)
+            lote = []
+    HistoricoAlteracao.objects.bulk_create(lote, batch_size=1000)
+    historicos += len(lote)
+
+    # bulk_create não dispara os sinais que mantêm o índice da busca.
+    reindexar_tudo()
+    return {
+        'customizacoes': len(ids), 'dependencias': len(arestas), 'historicos': historicos,
+        'raiz_cadeia': ids[0] if ids else None, 'usuario': usuario,
+    }
+
+
+# --- Medições ---
+
+def percentis(amostras):
+    ordenadas = sorted(amostras)
+
+    def _posicao(p):
+        # Método do posto mais próximo.
+        return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+    return {
+        'p50_ms': _posicao(50) * 1000, 'p90_ms': _posicao(90) * 1000,
+        'p95_ms': _posicao(95) * 1000, 'p99_ms': _posicao(99) * 1000,
+        'media_ms': sum(ordenadas) / len(ordenadas) * 1000,
+        'min_ms': ordenadas[0] * 1000, 'max_ms': ordenadas[-1] * 1000,
+    }
+
+
+@contextmanager
+def contar_consultas():
+    # Conta as consultas SQL sem guardá-las (o CaptureQueriesContext para de contar em 9000).
+    contador = {'consultas': 0}
+
+    def _contar(execute, sql, params, many, context):
+        contador['consultas'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(_contar):
+        yield contador
+
+
+def medir_memoria(funcao):
+    # Feito numa execução separada: o tracemalloc deixa o código bem mais lento e distorceria os tempos.
+    tracemalloc.start()
+    try:
+        funcao()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def medir_latencia(funcao, repeticoes, aquecimento=2, usar_cache=False):
+    """Executa 'funcao' várias vezes e devolve os percentis de tempo, as consultas SQL e o pico de memória."""
+    for _ in range(aquecimento):
+        funcao()
+    amostras = []
+    consultas = 0
+    for _ in range(repeticoes):
+        if not usar_cache:
+            # Sem o cache das respostas (ETag) e do dashboard, para medir o trabalho no banco.
+            cache.clear()
+        with contar_consultas() as contador:
+            inicio = time.perf_counter()
+            funcao()
+            amostras.append(time.perf_counter() - inicio)
+        consultas = contador['consultas']
+    if not usar_cache:
+        cache.clear()
+    return {
+        **percentis(amostras), 'repeticoes': repeticoes, 'consultas': consultas,
+        'memoria_pico_kb': medir_memoria(funcao),
+    }
+
+
+def medir_vazao(funcao):
+    """Executa 'funcao' (que devolve as estatísticas da sincronização) uma vez e mede a vazão."""
+    tracemalloc.start()
+    try:
+        with contar_consultas() as contador:
+            inicio = time.perf_counter()
+            estatisticas = funcao()
+            duracao = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+    return {
+        **estatisticas, 'segundos': duracao, 'linhas_por_segundo': estatisticas['lidas'] / duracao if duracao else 0,
+        'consultas': contador['consultas'], 'memoria_pico_kb': memoria,
+    }
+
+
+# --- Cenários ---
+
+def _requisicao(cliente, url):
+    def _executar():
+        resposta = cliente.get(url)
+        if resposta.status_code != 200:
+            raise RuntimeError(f'GET {url} respondeu {resposta.status_code}.')
+    return _executar
+
+
+def cenarios_api(catalogo, repeticoes, usar_cache):
+    cliente = APIClient()
+    cliente.force_authenticate(catalogo['usuario'])
+    raiz = catalogo['raiz_cadeia']
+    urls = {
+        'listagem_customizacoes': '/api/customizacoes/',
+        'listagem_customizacoes_ordenada': '/api/customizacoes/?ordering=-data_criacao&ativo=true',
+        'busca_um_termo': '/api/customizacoes/?search=contabil',
+        'busca_prefixos': '/api/customizacoes/?search=form fisc',
+        'listagem_historico': '/api/historico-alteracoes/',
+        'listagem_historico_1000': '/api/historico-alteracoes/?page_size=1000',
+        'listagem_dependencias': '/api/dependencias/',
+        'dependentes_transitivos': f'/api/customizacoes/{raiz}/dependentes/',
+    }
+    resultados = {}
+    for nome, url in urls.items():
+        resultados[nome] = _executar_cenario(
+            lambda url=url: medir_latencia(_requisicao(cliente, url), repeticoes, usar_cache=usar_cache)
+        )
+
+    def _dashboard():
+        from customizacoes.dashboard import calcular_resumo
+        calcular_resumo()
+    resultados['dashboard'] = _executar_cenario(lambda: medir_latencia(_dashboard, repeticoes, usar_cache=usar_cache))
+    return resultados
+
+
+def cenarios_sincronizacao(linhas_erp, semente):
+    """Sincronização com o ERP falso: carga inicial, reconciliação com 1% alterado e incremental com 1% novo."""
+    from .erp_integrator import monitorar_novas_customizacoes_erp, reconciliar_customizacoes_erp
+
+    aleatorio = random.Random(semente + 1)
+    # O ERP guarda datas sem fuso; tudo dentro da janela inicial da sincronização incremental.
+    inicio = datetime.now() - timedelta(hours=12)
+    resultados = {}
+    with erp_falso(gerar_linhas_erp(aleatorio, 1, linhas_erp, inicio)) as erp:
+        resultados['erp_carga_inicial'] = _executar_cenario(lambda: medir_vazao(monitorar_novas_customizacoes_erp))
+
+        alteradas = aleatorio.sample(range(1, linhas_erp + 1), max(1, linhas_erp // 100))
+        erp.executemany("UPDATE FCUSTOMIZACOES SET NOME = ? WHERE ID_CUSTOMIZACAO = ?",
+                        [(_frase(aleatorio, 4), pk) for pk in alteradas])
+        erp.commit()
+        resultados['erp_reconciliacao'] = _executar_cenario(lambda: medir_vazao(reconciliar_customizacoes_erp))
+
+        # As novas vêm depois da última linha já sincronizada (marca d'água).
+        novas = gerar_linhas_erp(
+            aleatorio, linhas_erp + 1, max(1, linhas_erp // 100), inicio + timedelta(seconds=linhas_erp + 1),
+        )
+        erp.executemany("INSERT INTO FCUSTOMIZACOES VALUES (?, ?, ?, ?, ?)", novas)
+        erp.commit()
+        resultados['erp_incremental'] = _executar_cenario(lambda: medir_vazao(monitorar_novas_customizacoes_erp))
+    return resultados
+
+
+def _executar_cenario(funcao):
+    # Um cenário com erro é registrado como tal, sem interromper os demais.
+    try:
+        return funcao()
+    except Exception as ex:
+        return {'erro': f'{ex.__class__.__name__}: {ex}'}
+
+
+# --- Resultados ---
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def executar_benchmark(customizacoes=10000, historicos_por_item=5, profundidade=50, arestas_por_item=2,
+                       linhas_erp=10000, repeticoes=50, semente=42, usar_cache=False):
+    """Gera o catálogo, executa todos os cenários e devolve o resultado (pronto para json.dump)."""
+    inicio = time.perf_counter()
+    catalogo = gerar_catalogo(customizacoes, historicos_por_item, profundidade, arestas_por_item, semente)
+    geracao = time.perf_counter() - inicio
+    cenarios = cenarios_api(catalogo, repeticoes, usar_cache)
+    cenarios.update(cenarios_sincronizacao(linhas_erp, semente))
+    return {
+        'formato': VERSAO_FORMATO,
+        'commit': _commit_atual(),
+        'data': timezone.now().isoformat(),
+        'ambiente': {
+            'python': platform.python_version(), 'django': django.get_version(),
+            'banco': connection.vendor, 'plataforma': platform.platform(),
+        },
+        'parametros': {
+            'customizacoes': customizacoes, 'historicos_por_item': historicos_por_item,
+            'profundidade': profundidade, 'arestas_por_item': arestas_por_item,
+            'linhas_erp': linhas_erp, 'repeticoes': repeticoes, 'semente': semente, 'usar_cache': usar_cache,
+        },
+        'dados': {
+            'customizacoes': catalogo['customizacoes'], 'dependencias': catalogo['dependencias'],
+            'historicos': catalogo['historicos'], 'segundos_geracao': geracao,
+        },
+        'cenarios': cenarios,
+    }
+
+
+def gravar_resultado(resultado, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+# Compara dois resultados: para cada cenário presente nos dois, a variação (%) das métricas principais.
+# Valores positivos em tempos e consultas (ou negativos em vazão) indicam regressão.
+def comparar_resultados(anterior, atual):
+    metricas = ('p50_ms', 'p95_ms', 'consultas', 'linhas_por_segundo', 'memoria_pico_kb')
+    comparacao = {}
+    for nome, dados in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome, {})
+        comparacao[nome] = {
+            metrica: {'antes': antes[metrica], 'depois': dados[metrica],
+                      'variacao_pct': (dados[metrica] - antes[metrica]) / antes[metrica] * 100 if antes[metrica] else None}
+            for metrica in metricas
+            if metrica in dados and metrica in antes
+        }
+    return comparacao
@@ -0,0 +1,199 @@
+# customizacoes/busca.py
+# Busca textual sobre customizações e documentação técnica, usando um índice invertido (TermoBusca).
+#
+# Os textos são quebrados em termos normalizados (minúsculos, sem acento, sem palavras vazias do
+# português) e gravados uma única vez, na escrita. A busca consulta só o índice: cada termo da
+# pesquisa vira uma busca por prefixo no índice (termo LIKE 'cont%', que usa o índice da coluna),
+# sem varrer as tabelas com LIKE '%...%'. O índice é atualizado pelos sinais de gravação
+# e, nas gravações em lote (sincronização com o ERP), chamando indexar_customizacoes().
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Customizacao, DocumentacaoTecnica, TermoBusca, TipoCustomizacao
+
+# Peso de cada campo na relevância de um termo.
+PESOS_CAMPOS = {
+    'codigo_erp': 4.0,
+    'nome': 3.0,
+    'tipo__nome': 1.5,
+    'descricao': 1.0,
+    'documentacao__conteudo': 0.5,
+}
+# Palavras muito comuns que não ajudam a encontrar nada.
+PALAVRAS_VAZIAS = frozenset(
+    'a ao aos as com da das de do dos e em na nas no nos o os ou para pela pelas pelo pelos por '
+    'que se sem um uma umas uns'.split()
+)
+TAMANHO_MAXIMO_TERMO = 60
+# Quantas customizações são (re)indexadas por vez.
+TAMANHO_LOTE_INDEXACAO = 500
+
+_SEPARADORES = re.compile(r'[^a-z0-9]+')
+
+
+# Normaliza um texto e devolve a lista de termos (com repetição), na ordem em que aparecem.
+def tokenizar(texto):
+    if not texto:
+        return []
+    # NFKD separa as letras dos acentos ('ç' -> 'c' + cedilha); descartamos as marcas.
+    sem_acento = ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+    return [
+        termo[:TAMANHO_MAXIMO_TERMO]
+        for termo in _SEPARADORES.split(sem_acento.lower())
+        if len(termo) > 1 and termo not in PALAVRAS_VAZIAS
+    ]
+
+
+# Calcula {termo: peso} de uma customização a partir dos valores dos seus campos.
+def calcular_termos(valores):
+    frequencias = defaultdict(lambda: defaultdict(int))
+    for campo, peso in PESOS_CAMPOS.items():
+        for termo in tokenizar(valores.get(campo)):
+            frequencias[termo][peso] += 1
+    # Frequência amortecida (1 + log) para que um termo repetido mil vezes na documentação
+    # não passe na frente de um termo que aparece no nome.
+    return {
+        termo: sum(peso * (1 + math.log(qtd)) for peso, qtd in por_peso.items())
+        for termo, por_peso in frequencias.items()
+    }
+
+
+# (Re)indexa as customizações informadas: uma leitura, um DELETE e um bulk_create por lote.
+def indexar_customizacoes(ids):
+    ids = list(ids)
+    for inicio in range(0, len(ids), TAMANHO_LOTE_INDEXACAO):
+        lote = ids[inicio:inicio + TAMANHO_LOTE_INDEXACAO]
+        valores = Customizacao.objects.filter(id__in=lote).values('id', *PESOS_CAMPOS)
+        entradas = [
+            TermoBusca(termo=termo, customizacao_id=linha['id'], peso=peso)
+            for linha in valores
+            for termo, peso in calcular_termos(linha).items()
+        ]
+        with transaction.atomic():
+            TermoBusca.objects.filter(customizacao_id__in=lote).delete()
+            TermoBusca.objects.bulk_create(entradas, batch_size=2000)
+
+
+# Reconstrói o índice inteiro (ex: na implantação ou após mudar os pesos).
+def reindexar_tudo():
+    ids = Customizacao.objects.order_by('id').values_list('id', flat=True)
+    total = 0
+    lote = []
+    for pk in ids.iterator(chunk_size=TAMANHO_LOTE_INDEXACAO):
+        lote.append(pk)
+        if len(lote) == TAMANHO_LOTE_INDEXACAO:
+            indexar_customizacoes(lote)
+            total += len(lote)
+            lote = []
+    indexar_customizacoes(lote)
+    return total + len(lote)
+
+
+# Condição que encontra no índice todos os termos que começam com 'termo'.
+def _faixa_prefixo(termo):
+    # LIKE 'termo%' usa o índice da coluna. Uma faixa (termo >= 'abz' AND termo < 'ab{') dependeria
+    # da ordenação da collation, que no SQL Server põe a pontuação antes das letras e dígitos.
+    return Q(termo__startswith=termo)
+
+
+# Consulta ao índice: uma linha {customizacao_id, relevancia} por customização que contém todos os
+# termos de 'texto' (como palavra inteira ou prefixo), da mais relevante para a menos.
+# Retorna None se o texto não tiver nenhum termo pesquisável.
+def consultar_indice(texto):
+    termos = list(dict.fromkeys(tokenizar(texto)))
+    if not termos:
+        return None
+    faixas = [_faixa_prefixo(termo) for termo in termos]
+    # Uma coluna de relevância por termo pesquisado; uma customização só entra se todas forem > 0.
+    por_termo = {
+        f'r{i}': Sum(Case(When(faixa, then=F('peso')), default=Value(0.0), output_field=FloatField()))
+        for i, faixa in enumerate(faixas)
+    }
+    consulta = (
+        TermoBusca.objects.filter(reduce(or_, faixas))
+        .values('customizacao_id')
+        .annotate(**por_termo)
+        .filter(**{f'{nome}__gt': 0 for nome in por_termo})
+        .annotate(relevancia=reduce(lambda a, b: a + b, (F(nome) for nome in por_termo)))
+        .order_by('-relevancia', 'customizacao_id')
+    )
+    return consulta
+
+
+# Busca 'texto' no índice. Retorna uma lista de até 'limite' (id da customização, relevância).
+def buscar(texto, limite=None):
+    consulta = consultar_indice(texto)
+    if consulta is None:
+        return []
+    if limite is not None:
+        consulta = consulta[:limite]
+    return [(linha['customizacao_id'], linha['relevancia']) for linha in consulta]
+
+
+# --- Filtro para os ViewSets ---
+# Substitui o SearchFilter do DRF mantendo o mesmo parâmetro (?search=). Sem ?ordering=,
+# os resultados vêm ordenados por relevância. Não há limite de resultados: o índice entra na
+# consulta da listagem como subconsulta, então a contagem, a paginação e a exportação veem todos.
+class BuscaIndexadaFilter(BaseFilterBackend):
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, '').strip()
+        if not texto:
+            return queryset
+        consulta = consultar_indice(texto)
+        if consulta is None:
+            return queryset.none()
+        queryset = queryset.filter(id__in=consulta.values('customizacao_id'))
+        if not request.query_params.get('ordering'):
+            # A relevância só é calculada para as customizações encontradas (subconsulta correlacionada).
+            relevancia = consulta.filter(customizacao_id=OuterRef('pk')).values('relevancia')[:1]
+            queryset = queryset.annotate(relevancia_busca=Subquery(relevancia, output_field=FloatField()))
+            queryset = queryset.order_by('-relevancia_busca', 'id')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Busca textual (sem acentos, por prefixo) em nome, código, tipo, descrição e documentação.',
+            'schema': {'type': 'string'},
+        }]
+
+
+# --- Atualização incremental do índice ---
+
+@receiver(post_save, sender=Customizacao)
+def _customizacao_salva(sender, instance, **kwargs):
+    indexar_customizacoes([instance.pk])
+
+
+@receiver(post_save, sender=DocumentacaoTecnica)
+def _documentacao_salva(sender, instance, **kwargs):
+    indexar_customizacoes([instance.customizacao_id])
+
+
+@receiver(post_delete, sender=DocumentacaoTecnica)
+def _documentacao_excluida(sender, instance, **kwargs):
+    # Depois do commit: se a customização também estiver sendo excluída (em cascata), não há o que
+    # reindexar, e os termos dela já foram removidos junto.
+    customizacao_id = instance.customizacao_id
+    transaction.on_commit(lambda: indexar_customizacoes([customizacao_id]))
+
+
+@receiver(post_save, sender=TipoCustomizacao)
+def _tipo_salvo(sender, instance, created, **kwargs):
+    if not created:
+        indexar_customizacoes(instance.customizacao_set.values_list('id', flat=True))
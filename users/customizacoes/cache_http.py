@@ -0,0 +1,117 @@
+# customizacoes/cache_http.py
+# GET condicional (ETag / Last-Modified) e cache de respostas para as listagens.
+#
+# A versão dos dados de uma resposta vem do próprio banco, com consultas pequenas, e não de um
+# contador em memória: assim gravações feitas por outros processos (outros workers, o comando
+# sincronizar_erp) também a mudam, mesmo sem um cache compartilhado entre eles.
+# - Customizacao, Dependencia e DocumentacaoTecnica: os IDs dos registros mais recentes de
+#   RegistroMudanca (ver mudancas.py), que recebe uma linha a cada criação, alteração e exclusão.
+# - TipoCustomizacao (poucas linhas e sem data de alteração): o conteúdo da tabela inteira.
+#
+# A ETag de uma resposta é derivada dessas versões, da URL e do usuário; se o cliente já tem essa
+# ETag, a resposta é 304 Not Modified sem consultar os dados. As páginas das listagens ficam
+# guardadas (já serializadas) no cache sob a mesma chave, então um cliente sem a ETag também não
+# lê os dados; como a chave muda com o banco, uma página nunca é servida depois de uma gravação.
+
+import hashlib
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from config.roteador import marca_leitura
+
+from .models import RegistroMudanca, TipoCustomizacao
+
+PREFIXO_RESPOSTA = 'customizacoes:http:resposta:'
+# Tempo máximo (segundos) que uma página fica em cache, mesmo sem nenhuma gravação.
+TTL_RESPOSTA = 300
+# Quantos registros recentes de RegistroMudanca formam a versão. Usar vários IDs, e não só o maior,
+# cobre a transação longa (ex: um lote do ERP) que confirma IDs menores que o maior já visível.
+REGISTROS_VERSAO = 100
+
+
+# Versão dos modelos acompanhados por RegistroMudanca: (texto, data da mudança mais recente).
+def _versao_mudancas(modelos):
+    registros = list(
+        RegistroMudanca.objects.filter(modelo__in=[modelo._meta.model_name for modelo in modelos])
+        .order_by('-id').values_list('id', 'data')[:REGISTROS_VERSAO]
+    )
+    texto = ','.join(str(pk) for pk, _ in registros)
+    return texto, max((data for _, data in registros), default=None)
+
+
+def _versao_tipos():
+    linhas = TipoCustomizacao.objects.order_by('id').values_list('id', 'nome', 'descricao')
+    return '|'.join(map(repr, linhas))
+
+
+# Versão dos dados de 'modelos': (texto que muda a cada gravação, data da última gravação ou None).
+def obter_versao(modelos):
+    partes, datas = [], []
+    acompanhados = [modelo for modelo in modelos if modelo is not TipoCustomizacao]
+    if acompanhados:
+        texto, data = _versao_mudancas(acompanhados)
+        partes.append(texto)
+        datas.append(data)
+    if TipoCustomizacao in modelos:
+        partes.append(_versao_tipos())
+    datas = [data for data in datas if data is not None]
+    return '#'.join(partes), max(datas) if datas else None
+
+
+# --- Mixin para os ViewSets ---
+class RespostaCondicionalMixin:
+    # Modelos cujas gravações mudam as respostas deste ViewSet.
+    modelos_cache = ()
+
+    def _condicao(self, request):
+        versao, data = obter_versao(self.modelos_cache)
+        escopo = request.user.pk if request.user.is_authenticated else 'anonimo'
+        texto = '|'.join(map(str, [
+            versao, escopo, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), marca_leitura(),
+        ]))
+        etag = quote_etag(hashlib.blake2b(texto.encode('utf-8'), digest_size=16).hexdigest())
+        # Last-Modified: a gravação mais recente entre os modelos da resposta (resolução de segundos);
+        # None quando nenhum deles tem data (só tipos).
+        modificado_em = int(data.timestamp()) if data is not None else None
+        return etag, modificado_em
+
+    def _nao_modificado(self, request, etag, modificado_em):
+        enviada = request.META.get('HTTP_IF_NONE_MATCH')
+        if enviada is not None:
+            # If-None-Match tem precedência sobre If-Modified-Since.
+            return etag in [valor.strip() for valor in enviada.split(',')] or enviada.strip() == '*'
+        if modificado_em is None:
+            return False
+        desde = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return desde is not None and modificado_em <= desde
+
+    def _responder(self, request, gerar, guardar):
+        etag, modificado_em = self._condicao(request)
+        if self._nao_modificado(request, etag, modificado_em):
+            resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            chave = PREFIXO_RESPOSTA + etag.strip('"')
+            dados = cache.get(chave) if guardar else None
+            if dados is not None:
+                resposta = Response(dados)
+            else:
+                resposta = gerar()
+                if guardar and resposta.status_code == status.HTTP_200_OK:
+                    cache.set(chave, resposta.data, TTL_RESPOSTA)
+        resposta['ETag'] = etag
+        if modificado_em is not None:
+            resposta['Last-Modified'] = http_date(modificado_em)
+        # O cliente pode guardar a resposta, mas deve revalidá-la (barato) a cada uso.
+        patch_cache_control(resposta, private=True, no_cache=True)
+        patch_vary_headers(resposta, ['Authorization'])
+        return resposta
+
+    def list(self, request, *args, **kwargs):
+        return self._responder(request, lambda: super(RespostaCondicionalMixin, self).list(request, *args, **kwargs), True)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._responder(request, lambda: super(RespostaCondicionalMixin, self).retrieve(request, *args, **kwargs), False)
@@ -0,0 +1,52 @@
+# customizacoes/dashboard.py
+# Números do dashboard (cards e itens recentes), calculados com uma única consulta de
+# agregação condicional e guardados em cache por alguns segundos. O cache é descartado
+# sempre que uma customização é salva ou removida, ou após uma sincronização em lote.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Customizacao
+
+CHAVE_CACHE = 'customizacoes:dashboard:resumo'
+# Tempo máximo (segundos) que o resumo fica em cache, mesmo sem nenhuma invalidação.
+TTL_CACHE = getattr(settings, 'DASHBOARD_CACHE_TTL', 30)
+# Janela do card de customizações alteradas recentemente.
+JANELA_RECENTES = timedelta(days=7)
+QUANTIDADE_RECENTES = 10
+
+
+def calcular_resumo():
+    # Os quatro contadores saem de uma única varredura da tabela (COUNT ... FILTER / CASE WHEN).
+    cards = Customizacao.objects.aggregate(
+        total=Count('id'),
+        ativas=Count('id', filter=Q(ativo=True)),
+        inativas=Count('id', filter=Q(ativo=False)),
+        alteradas_semana=Count('id', filter=Q(data_ultima_alteracao__gte=timezone.now() - JANELA_RECENTES)),
+    )
+    # Dicionários (e não objetos do modelo): é o que vai para o cache e para a resposta JSON.
+    recentes = list(
+        Customizacao.objects.order_by('-data_ultima_alteracao', '-id')
+        .values('id', 'nome', 'codigo_erp', 'ativo', 'data_ultima_alteracao')[:QUANTIDADE_RECENTES]
+    )
+    return {'cards': cards, 'recentes': recentes}
+
+
+def obter_resumo():
+    return cache.get_or_set(CHAVE_CACHE, calcular_resumo, TTL_CACHE)
+
+
+def invalidar_cache_dashboard():
+    cache.delete(CHAVE_CACHE)
+
+
+@receiver(post_save, sender=Customizacao)
+@receiver(post_delete, sender=Customizacao)
+def _customizacao_alterada(sender, **kwargs):
+    invalidar_cache_dashboard()
@@ -1,102 +1,314 @@
 # Este arquivo centraliza a lógica de comunicação com o banco de dados do ERP RM TOTVS.
 # É uma boa prática separar essa lógica para manter o código organizado.
 
+import hashlib # Biblioteca para calcular hashes (impressões digitais do conteúdo).
 import pyodbc  # Biblioteca para conectar a bancos de dados via ODBC.
-import os      # Biblioteca para acessar variáveis de ambiente.
-from datetime import datetime, timedelta # Bibliotecas para trabalhar com datas e horas.
-
-# Função para obter uma conexão com o banco de dados do ERP.
-def get_erp_db_connection():
-    # Lê as credenciais do banco de dados a partir das variáveis de ambiente.
-    db_name = os.getenv('DB_NAME')
-    db_user = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_host = os.getenv('DB_HOST')
-    db_port = os.getenv('DB_PORT')
-    odbc_driver = os.getenv('ODBC_DRIVER')
-
-    # Monta a string de conexão ODBC.
-    conn_str = (
-        f"DRIVER={{{odbc_driver}}};"
-        f"SERVER={db_host},{db_port};"
-        f"DATABASE={db_name};"
-        f"UID={db_user};"
-        f"PWD={db_password};"
-        "TrustServerCertificate=yes;" # Necessário para algumas configurações de SQL Server.
-    )
-    # Retorna o objeto de conexão.
-    return pyodbc.connect(conn_str)
+from datetime import timedelta # Biblioteca para trabalhar com intervalos de tempo.
 
-# Função para monitorar o ERP e sincronizar com o banco de dados do Django.
-def monitorar_novas_customizacoes_erp():
-    # Esta função é um EXEMPLO. Você precisará adaptá-la à estrutura real do seu banco de dados ERP.
-    
-    # Importa os modelos do Django aqui dentro da função para evitar importações circulares.
-    from customizacoes.models import Customizacao, TipoCustomizacao, HistoricoAlteracao
+from django.db import transaction # Controle de transações do Django.
+from django.utils import timezone  # Utilitários de data/hora com fuso horário.
+
+# Leitura do ERP em blocos (fetchmany), usando o pool de conexões compartilhado.
+from customizacoes.erp_leitor import ler_em_blocos, ler_em_paralelo
+
+# Quantidade de registros do ERP processados por lote (uma leitura, um bulk_create, um commit).
+TAMANHO_LOTE = 500
+# Colunas lidas da tabela FCUSTOMIZACOES, na ordem esperada por _processar_lote.
+# CONTEUDO é o texto SQL/fórmula da customização, usado pela análise automática de dependências.
+COLUNAS_ERP = ('ID_CUSTOMIZACAO', 'NOME', 'TIPO', 'DATA_CRIACAO', 'CONTEUDO')
+# Nome da marca d'água usada pela rotina de monitoramento da tabela FCUSTOMIZACOES.
+NOME_SINCRONIZACAO = 'FCUSTOMIZACOES'
+# Nome das execuções da reconciliação completa em ExecucaoSincronizacao (a trava é a mesma).
+NOME_RECONCILIACAO = 'FCUSTOMIZACOES:reconciliacao'
+# Na primeira execução (sem marca d'água) olhamos apenas o último dia, como antes.
+JANELA_INICIAL = timedelta(days=1)
+
+
+# Retorna o usuário 'sistema', usado para registrar alterações automáticas.
+def obter_usuario_sistema():
     from django.contrib.auth import get_user_model
     User = get_user_model()
 
-    # Tenta obter um usuário 'sistema' para registrar alterações automáticas.
     # Se não existir, cria um. Você precisa definir uma senha segura.
     try:
-        sistema_user = User.objects.get(username='sistema')
+        return User.objects.get(username='sistema')
     except User.DoesNotExist:
-        sistema_user = User.objects.create_user(username='sistema', password='senha_segura_aqui', is_staff=True)
+        return User.objects.create_user(username='sistema', password='senha_segura_aqui', is_staff=True)
+
+
+# Converte a data do ERP (sem fuso) para uma data com fuso, como o Django espera com USE_TZ=True.
+def _data_com_fuso(data):
+    if data is not None and timezone.is_naive(data):
+        return timezone.make_aware(data)
+    return data
+
+
+# Resolve os nomes de tipo para objetos TipoCustomizacao, criando os que faltam.
+# 'cache_tipos' é compartilhado entre os lotes de uma mesma execução, então cada nome
+# é consultado no banco no máximo uma vez por execução.
+def _resolver_tipos(nomes, cache_tipos):
+    from customizacoes.models import TipoCustomizacao
+
+    faltantes = {nome for nome in nomes if nome not in cache_tipos}
+    if not faltantes:
+        return cache_tipos
+
+    # Uma consulta para os tipos que já existem...
+    for tipo in TipoCustomizacao.objects.filter(nome__in=faltantes):
+        cache_tipos[tipo.nome] = tipo
+    faltantes -= cache_tipos.keys()
+
+    if faltantes:
+        # ...e um INSERT em lote para os novos. ignore_conflicts cobre o caso de outro
+        # processo ter criado o mesmo tipo no meio tempo; por isso relemos depois.
+        TipoCustomizacao.objects.bulk_create(
+            [TipoCustomizacao(nome=nome) for nome in faltantes], ignore_conflicts=True
+        )
+        for tipo in TipoCustomizacao.objects.filter(nome__in=faltantes):
+            cache_tipos[tipo.nome] = tipo
+    return cache_tipos
+
+
+# Calcula a impressão digital das colunas do ERP que nos interessam.
+# Se o ERP alterar qualquer uma delas, o hash muda; caso contrário, nada precisa ser gravado.
+def calcular_fingerprint(nome, tipo_str, codigo_fonte):
+    conteudo = '\x1f'.join('' if valor is None else str(valor) for valor in (nome, tipo_str, codigo_fonte))
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Processa um lote de linhas do ERP com um número fixo de consultas, independente do tamanho do lote:
+# cria as customizações novas e atualiza apenas as que mudaram no ERP.
+# Retorna uma tupla (criadas, alteradas).
+def _processar_lote(linhas, sistema_user, cache_tipos):
+    from django.db.models.functions import Length
+    from customizacoes.auditoria import calcular_alteracoes, registrar_historico
+    from customizacoes.models import Customizacao, RegistroMudanca
+
+    # Indexa as linhas pelo código do ERP (o último valor vence se o ERP repetir um ID no lote).
+    por_codigo = {
+        str(erp_id): (nome, tipo_str, data_criacao_erp, codigo_fonte)
+        for erp_id, nome, tipo_str, data_criacao_erp, codigo_fonte in linhas
+    }
+
+    # Uma única consulta traz o ID, o hash e os valores auditados (para o histórico das alterações)
+    # de todos os códigos do lote que já existem no Django. Do código-fonte basta o tamanho.
+    existentes = {}
+    anteriores = {}
+    for codigo, pk, hash_erp, nome, tipo_id, tamanho_fonte in Customizacao.objects.filter(
+        codigo_erp__in=por_codigo.keys()
+    ).values_list('codigo_erp', 'id', 'hash_erp', 'nome', 'tipo_id', Length('codigo_fonte')):
+        existentes[codigo] = (pk, hash_erp)
+        anteriores[pk] = {'nome': nome, 'tipo_id': tipo_id, 'codigo_fonte': tamanho_fonte}
+
+    novos = {}
+    alterados = {}
+    sem_hash = []
+    for codigo, (nome, tipo_str, data_criacao_erp, codigo_fonte) in por_codigo.items():
+        fingerprint = calcular_fingerprint(nome, tipo_str, codigo_fonte)
+        if codigo not in existentes:
+            novos[codigo] = (nome, tipo_str, data_criacao_erp, codigo_fonte, fingerprint)
+            continue
+        pk, hash_atual = existentes[codigo]
+        if hash_atual is None:
+            # Registro anterior ao controle por hash: apenas grava o hash, sem gerar histórico.
+            sem_hash.append(Customizacao(id=pk, hash_erp=fingerprint))
+        elif hash_atual != fingerprint:
+            alterados[codigo] = (pk, nome, tipo_str, codigo_fonte, fingerprint)
+
+    if sem_hash:
+        Customizacao.objects.bulk_update(sem_hash, ['hash_erp'], batch_size=TAMANHO_LOTE)
+    if not novos and not alterados:
+        return [], []
+
+    nomes_tipos = {dados[1] for dados in novos.values()} | {dados[2] for dados in alterados.values()}
+    tipos = _resolver_tipos({nome for nome in nomes_tipos if nome}, cache_tipos)
+
+    criadas = []
+    if novos:
+        criadas = Customizacao.objects.bulk_create([
+            Customizacao(
+                nome=nome,
+                tipo=tipos.get(tipo_str),
+                codigo_erp=codigo,
+                data_criacao=_data_com_fuso(data_criacao_erp),  # Usa a data do ERP.
+                criado_por=sistema_user,  # Atribui ao usuário 'sistema'.
+                codigo_fonte=codigo_fonte,
+                hash_erp=fingerprint,
+            )
+            for codigo, (nome, tipo_str, data_criacao_erp, codigo_fonte, fingerprint) in novos.items()
+        ], batch_size=TAMANHO_LOTE)
+
+        # Nem todo backend devolve as chaves primárias no bulk_create; relemos os IDs em uma consulta.
+        ids_por_codigo = dict(
+            Customizacao.objects.filter(codigo_erp__in=novos.keys()).values_list('codigo_erp', 'id')
+        )
+        for cust in criadas:
+            cust.id = ids_por_codigo[cust.codigo_erp]
+            registrar_historico(
+                cust.id, 'Criação (ERP)', calcular_alteracoes({}, cust.valores_auditados()),
+                detalhes=f'Nova customização detectada no ERP: {cust.nome} (ID: {cust.codigo_erp})',
+                usuario=sistema_user,
+            )
+
+    alteradas = []
+    if alterados:
+        agora = timezone.now()
+        # bulk_update não dispara o auto_now, então a data de alteração é preenchida aqui.
+        alteradas = [
+            Customizacao(
+                id=pk, nome=nome, tipo=tipos.get(tipo_str), codigo_fonte=codigo_fonte,
+                hash_erp=fingerprint, data_ultima_alteracao=agora,
+            )
+            for pk, nome, tipo_str, codigo_fonte, fingerprint in alterados.values()
+        ]
+        Customizacao.objects.bulk_update(
+            alteradas, ['nome', 'tipo', 'codigo_fonte', 'hash_erp', 'data_ultima_alteracao'], batch_size=TAMANHO_LOTE
+        )
+        for codigo, cust in zip(alterados, alteradas):
+            atuais = {campo: cust.valor_auditado(campo, getattr(cust, campo)) for campo in anteriores[cust.id]}
+            registrar_historico(
+                cust.id, 'Alteração (ERP)', calcular_alteracoes(anteriores[cust.id], atuais),
+                detalhes=f'Alteração detectada no ERP: {cust.nome} (ID: {codigo})',
+                usuario=sistema_user,
+            )
+
+    # bulk_create/bulk_update não disparam sinais: atualiza o índice de busca e o feed de mudanças aqui.
+    from customizacoes.busca import indexar_customizacoes
+    from customizacoes.mudancas import registrar_mudancas
+    indexar_customizacoes([cust.id for cust in criadas + alteradas])
+    registrar_mudancas(Customizacao, [cust.id for cust in criadas], RegistroMudanca.OPERACAO_CRIACAO)
+    registrar_mudancas(Customizacao, [cust.id for cust in alteradas], RegistroMudanca.OPERACAO_ALTERACAO)
+    # Dependências dos textos novos ou alterados, na mesma transação do lote. Referências de textos que
+    # não mudaram a customizações recém-criadas só aparecem com 'manage.py analisar_dependencias_sql --forcar'.
+    from customizacoes.analisador_sql import analisar_dependencias
+    analisar_dependencias(ids=[cust.id for cust in criadas + alteradas])
+    return criadas, alteradas
+
+
+# Descarta os caches que dependem do catálogo de customizações.
+def _catalogo_alterado():
+    from customizacoes.dashboard import invalidar_cache_dashboard
+    invalidar_cache_dashboard()
+
+
+# Função para monitorar o ERP e sincronizar com o banco de dados do Django.
+# Lê apenas os registros posteriores à marca d'água salva e grava em lotes, de modo que
+# o custo de uma execução é proporcional ao número de lotes, e não ao número de linhas.
+# 'ao_gravar_lote', se informada, é chamada dentro da transação de cada lote, antes do commit
+# (o comando sincronizar_erp a usa para renovar a trava; se ela levantar uma exceção, o lote é desfeito).
+# Retorna um dicionário com as estatísticas da execução. Se 'estatisticas' for informado, ele é
+# preenchido lote a lote: quem chama vê os lotes já confirmados mesmo se a execução for interrompida.
+def monitorar_novas_customizacoes_erp(ao_gravar_lote=None, estatisticas=None):
+    # Esta função é um EXEMPLO. Você precisará adaptá-la à estrutura real do seu banco de dados ERP.
+    
+    # Importa os modelos do Django aqui dentro da função para evitar importações circulares.
+    from customizacoes.models import SincronizacaoERP
+
+    sistema_user = obter_usuario_sistema()
+    marca, _ = SincronizacaoERP.objects.get_or_create(nome=NOME_SINCRONIZACAO)
+    if estatisticas is None:
+        estatisticas = {}
+    estatisticas.update(lidas=0, inseridas=0, alteradas=0)
+
+    # Sem marca d'água: começa pela janela inicial (o ERP guarda datas sem fuso).
+    desde = marca.ultima_data_criacao or (timezone.now() - JANELA_INICIAL)
+    desde = timezone.make_naive(desde) if timezone.is_aware(desde) else desde
+    ultimo_id = marca.ultimo_id_erp or ''
 
-    conn = None # Inicializa a variável de conexão como nula.
     try:
-        # Obtém a conexão com o banco do ERP.
-        conn = get_erp_db_connection()
-        cursor = conn.cursor() # Cria um cursor para executar comandos SQL.
-        
         # !!! IMPORTANTE: Adapte esta consulta para a sua realidade do ERP RM TOTVS !!!
-        # Esta consulta de exemplo busca customizações criadas no último dia.
-        # Você precisa saber o nome da tabela e das colunas no seu ERP.
-        cursor.execute("SELECT ID_CUSTOMIZACAO, NOME, TIPO, DATA_CRIACAO FROM FCUSTOMIZACOES WHERE DATA_CRIACAO > ?", datetime.now() - timedelta(days=1))
-        
-        # Pega todos os resultados da consulta.
-        novas_customizacoes_erp = cursor.fetchall()
-
-        # Itera sobre cada customização encontrada no ERP.
-        for erp_cust in novas_customizacoes_erp:
-            erp_id, nome, tipo_str, data_criacao_erp = erp_cust
-            
-            # Verifica se a customização do ERP já existe no banco de dados do Django.
-            if not Customizacao.objects.filter(codigo_erp=erp_id).exists():
-                # Se não existe, vamos criá-la.
-                
-                # Cria ou obtém o tipo de customização.
-                tipo_customizacao, created = TipoCustomizacao.objects.get_or_create(nome=tipo_str)
-
-                # Cria a customização no banco de dados do Django.
-                customizacao_django = Customizacao.objects.create(
-                    nome=nome,
-                    tipo=tipo_customizacao,
-                    codigo_erp=erp_id,
-                    data_criacao=data_criacao_erp, # Usa a data do ERP.
-                    criado_por=sistema_user # Atribui ao usuário 'sistema'.
-                )
-                # Cria um registro de histórico para esta nova customização.
-                HistoricoAlteracao.objects.create(
-                    customizacao=customizacao_django,
-                    alterado_por=sistema_user,
-                    tipo_alteracao='Criação (ERP)',
-                    detalhes_alteracao=f'Nova customização detectada no ERP: {nome} (ID: {erp_id})'
-                )
-                print(f"Nova customização do ERP registrada: {nome}")
-            else:
-                # Aqui você pode adicionar lógica para detectar ALTERAÇÕES em customizações existentes.
-                # Isso é mais complexo e pode envolver comparar hashes de conteúdo ou datas de modificação.
-                pass
+        # Busca tudo o que veio depois da marca d'água, em ordem, para que a marca
+        # possa avançar a cada lote. O ID desempata registros criados no mesmo instante.
+        sql = (
+            f"SELECT {', '.join(COLUNAS_ERP)} FROM FCUSTOMIZACOES "
+            "WHERE DATA_CRIACAO > ? OR (DATA_CRIACAO = ? AND ID_CUSTOMIZACAO > ?) "
+            "ORDER BY DATA_CRIACAO, ID_CUSTOMIZACAO"
+        )
+
+        cache_tipos = {}
+        # Lê um lote por vez, em vez de carregar todo o resultado de uma vez.
+        for linhas in ler_em_blocos(sql, (desde, desde, ultimo_id), TAMANHO_LOTE):
+            # Cada lote é gravado junto com o avanço da marca d'água: se a execução cair,
+            # a próxima recomeça exatamente do último lote confirmado.
+            with transaction.atomic():
+                criadas, alteradas = _processar_lote(linhas, sistema_user, cache_tipos)
+                if ao_gravar_lote is not None:
+                    ao_gravar_lote()
+                ultimo_id_erp, _, _, ultima_data, _ = linhas[-1]
+                marca.ultima_data_criacao = _data_com_fuso(ultima_data)
+                marca.ultimo_id_erp = str(ultimo_id_erp)
+                marca.save(update_fields=['ultima_data_criacao', 'ultimo_id_erp', 'data_ultima_execucao'])
+
+            estatisticas['lidas'] += len(linhas)
+            estatisticas['inseridas'] += len(criadas)
+            estatisticas['alteradas'] += len(alteradas)
+            for cust in criadas:
+                print(f"Nova customização do ERP registrada: {cust.nome}")
 
     except pyodbc.Error as ex:
         # Captura erros de conexão ou consulta com o banco de dados.
         sqlstate = ex.args[0]
         print(f"Erro ao conectar ou consultar o banco de dados do ERP: {sqlstate}")
+        estatisticas['erro'] = f"Erro ao consultar o ERP: {sqlstate}"
+
+    finally:
+        # Também quando outra exceção interrompe a execução: os lotes já confirmados continuam gravados.
+        if estatisticas['inseridas'] or estatisticas['alteradas']:
+            # Gravações em lote não disparam sinais: avisa quem mantém caches derivados do catálogo.
+            _catalogo_alterado()
+    return estatisticas
+
+# Reconcilia todo o catálogo do ERP com o Django, detectando customizações novas e alteradas.
+# A rotina incremental (monitorar_novas_customizacoes_erp) só lê o que foi criado depois da marca
+# d'água; edições no ERP de customizações antigas só aparecem aqui. O comando sincronizar_erp a
+# executa periodicamente (--reconciliar-a-cada).
+# Como a comparação é feita só por hash, em lotes, a rotina é leve o bastante para rodar a cada poucos minutos.
+# Com shards > 1 a faixa de IDs do ERP é lida em paralelo por várias threads (útil para uma carga inicial
+# completa); a gravação no Django continua em uma única thread, lote a lote.
+# 'ao_gravar_lote' e 'estatisticas' funcionam como em monitorar_novas_customizacoes_erp.
+# Retorna um dicionário com as estatísticas da execução.
+def reconciliar_customizacoes_erp(shards=1, tamanho_bloco=TAMANHO_LOTE, ao_gravar_lote=None, estatisticas=None):
+    sistema_user = obter_usuario_sistema()
+    if estatisticas is None:
+        estatisticas = {}
+    estatisticas.update(lidas=0, inseridas=0, alteradas=0)
+
+    try:
+        # !!! IMPORTANTE: Adapte esta consulta para a sua realidade do ERP RM TOTVS !!!
+        if shards > 1:
+            blocos = ler_em_paralelo('FCUSTOMIZACOES', COLUNAS_ERP, 'ID_CUSTOMIZACAO', shards, tamanho_bloco)
+        else:
+            blocos = ler_em_blocos(
+                f"SELECT {', '.join(COLUNAS_ERP)} FROM FCUSTOMIZACOES ORDER BY ID_CUSTOMIZACAO",
+                (), tamanho_bloco,
+            )
+
+        cache_tipos = {}
+        for linhas in blocos:
+            with transaction.atomic():
+                criadas, alteradas = _processar_lote(linhas, sistema_user, cache_tipos)
+                if ao_gravar_lote is not None:
+                    ao_gravar_lote()
+            estatisticas['lidas'] += len(linhas)
+            estatisticas['inseridas'] += len(criadas)
+            estatisticas['alteradas'] += len(alteradas)
+
+        print(
+            f"Reconciliação com o ERP concluída: {estatisticas['lidas']} lidas, "
+            f"{estatisticas['inseridas']} novas, {estatisticas['alteradas']} alteradas."
+        )
+
+    except pyodbc.Error as ex:
+        sqlstate = ex.args[0]
+        print(f"Erro ao conectar ou consultar o banco de dados do ERP: {sqlstate}")
+        estatisticas['erro'] = f"Erro ao consultar o ERP: {sqlstate}"
+
     finally:
-        # O bloco 'finally' sempre é executado, com ou sem erro.
-        if conn:
-            conn.close() # Garante que a conexão com o banco de dados seja sempre fechada.
+        # Também quando outra exceção interrompe a execução: os lotes já confirmados continuam gravados.
+        if estatisticas['inseridas'] or estatisticas['alteradas']:
+            # Gravações em lote não disparam sinais: avisa quem mantém caches derivados do catálogo.
+            _catalogo_alterado()
+    return estatisticas
 
-# Você pode agendar esta função para rodar periodicamente (ex: usando Celery ou um cron job)
-# ou chamá-la via um endpoint de API para testes/gatilhos manuais.
+# Para rodar periodicamente, use o comando "python manage.py sincronizar_erp", que garante que só
+# um servidor sincronize por vez. A função também pode ser chamada via um endpoint de API para testes.
@@ -0,0 +1,145 @@
+# customizacoes/exportacao.py
+# Exportação completa (CSV ou NDJSON) das listagens, em streaming.
+#
+# As linhas são lidas do banco em blocos (iterator(chunk_size=...)) e escritas na resposta à medida
+# que chegam: nada é paginado nem montado em memória, então exportar 500 mil linhas usa a mesma
+# memória que exportar 10. Os filtros da listagem (?tipo=, ?search=, ?customizacao=...) valem também
+# aqui, e ?since= limita a exportação ao que mudou a partir de uma data (exportações incrementais).
+#
+# Com ?since= as linhas saem na ordem (data, id). Várias linhas podem ter a mesma data, então para
+# retomar uma exportação sem perder nem repetir linhas o cliente envia a data e o id da última linha
+# recebida: ?since=<data>&since_id=<id>. Só com ?since= a data informada é incluída (>=), e as linhas
+# dessa data que o cliente já tinha vêm de novo.
+
+import csv
+import json
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+from config.roteador import alias_leitura
+
+TAMANHO_BLOCO_EXPORTACAO = 2000
+LINHAS_POR_PEDACO = 500
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# "Arquivo" que só devolve o que recebe: o csv.writer escreve nele e a linha volta para o streaming.
+class _Eco:
+    def write(self, valor):
+        return valor
+
+
+def _valor_texto(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+
+# Junta as linhas formatadas em pedaços de LINHAS_POR_PEDACO: enviar uma linha por vez
+# custaria uma escrita no socket (e uma volta do servidor WSGI) por registro.
+def _em_pedacos(textos):
+    pedaco = []
+    for texto in textos:
+        pedaco.append(texto)
+        if len(pedaco) == LINHAS_POR_PEDACO:
+            yield ''.join(pedaco)
+            pedaco = []
+    if pedaco:
+        yield ''.join(pedaco)
+
+
+def _linhas_csv(colunas, linhas):
+    escritor = csv.writer(_Eco())
+    # BOM para o Excel reconhecer o UTF-8 (acentos) ao abrir o arquivo.
+    yield '\ufeff' + escritor.writerow(colunas)
+    for linha in linhas:
+        yield escritor.writerow([_valor_texto(valor) for valor in linha])
+
+
+def _linhas_ndjson(colunas, linhas):
+    codificador = json.JSONEncoder(ensure_ascii=False)
+    for linha in linhas:
+        yield codificador.encode(dict(zip(colunas, (_valor_texto(valor) for valor in linha)))) + '\n'
+
+
+# Gera a resposta em streaming para 'queryset'. 'campos' é uma lista de (coluna no arquivo, campo do ORM).
+def exportar_queryset(queryset, campos, formato, nome_arquivo):
+    if formato not in FORMATOS:
+        raise ValidationError({'formato': f"Formatos aceitos: {', '.join(FORMATOS)}."})
+    colunas = [coluna for coluna, _ in campos]
+    linhas = queryset.values_list(*(campo for _, campo in campos)).iterator(chunk_size=TAMANHO_BLOCO_EXPORTACAO)
+    gerador = _linhas_csv(colunas, linhas) if formato == 'csv' else _linhas_ndjson(colunas, linhas)
+    resposta = StreamingHttpResponse(_em_pedacos(gerador), content_type=FORMATOS[formato])
+    resposta['Content-Disposition'] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return resposta
+
+
+# Lê ?since= (data/hora ISO 8601). Datas sem fuso são interpretadas no fuso do projeto.
+def ler_since(request):
+    valor = request.query_params.get('since')
+    if not valor:
+        return None
+    data = parse_datetime(valor)
+    if data is None:
+        raise ValidationError({'since': 'Use uma data/hora ISO 8601, ex: 2024-05-01T00:00:00.'})
+    if timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+# Lê ?since_id= (id da última linha já exportada com a data de ?since=).
+def ler_since_id(request):
+    valor = request.query_params.get('since_id')
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValidationError({'since_id': 'Informe o id (inteiro) da última linha recebida.'})
+
+
+# --- Mixin para os ViewSets ---
+# GET /api/<recurso>/exportar/?formato=csv|ndjson&since=...&<filtros da listagem>
+class ExportacaoMixin:
+    # Lista de (coluna no arquivo, campo do ORM) exportados.
+    campos_exportacao = ()
+    # Campo de data usado pelo ?since= (None: o recurso não suporta exportação incremental).
+    campo_since = None
+    # Ordem das linhas exportadas. Com ?since= é sempre (campo_since, id), a ordem do cursor.
+    ordem_exportacao = ('id',)
+    nome_exportacao = 'exportacao'
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        since = ler_since(request)
+        since_id = ler_since_id(request)
+        if since_id is not None and since is None:
+            raise ValidationError({'since_id': 'Use junto com ?since=.'})
+        if since is not None:
+            if self.campo_since is None:
+                raise ValidationError({'since': 'Este recurso não suporta exportação incremental.'})
+            if since_id is None:
+                queryset = queryset.filter(**{f'{self.campo_since}__gte': since})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.campo_since}__gt': since}) | Q(**{self.campo_since: since, 'id__gt': since_id})
+                )
+            # O cursor (data, id) só funciona nesta ordem.
+            queryset = queryset.order_by(self.campo_since, 'id')
+        elif not request.query_params.get('ordering') and not request.query_params.get('search'):
+            # Sem ?ordering= explícito, exporta na ordem estável do recurso.
+            queryset = queryset.order_by(*self.ordem_exportacao)
+        # As linhas são lidas depois que a view termina (durante o streaming), fora da requisição:
+        # fixa aqui o banco de leitura escolhido para ela (a réplica, se houver).
+        queryset = queryset.using(alias_leitura())
+        formato = request.query_params.get('formato', 'csv').lower()
+        return exportar_queryset(queryset, self.campos_exportacao, formato, self.nome_exportacao)
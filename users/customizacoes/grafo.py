@@ -0,0 +1,210 @@
+# customizacoes/grafo.py
+# Grafo de dependências entre customizações, mantido em memória para responder consultas
+# transitivas (impacto, ordem topológica, ciclos) sem uma requisição ou consulta por salto.
+#
+# As arestas da tabela Dependencia são carregadas com uma única consulta e guardadas como
+# vetores de inteiros no formato CSR (compressed sparse row): os vizinhos do nó i ficam em
+# destinos[inicio[i]:inicio[i + 1]]. O grafo é recarregado quando uma Dependencia é salva ou
+# removida, inclusive por outro processo: a versão dele são os IDs dos registros mais recentes de
+# Dependencia em RegistroMudanca (ver mudancas.py e cache_http.py), lidos do banco a cada consulta.
+
+import threading
+from array import array
+from collections import deque
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache_http import REGISTROS_VERSAO
+from .models import Dependencia, RegistroMudanca
+
+
+class GrafoDependencias:
+    """Grafo dirigido: uma aresta origem -> destino significa "origem depende de destino"."""
+
+    def __init__(self, arestas):
+        # Mapeia os IDs das customizações para índices densos 0..n-1.
+        self.ids = array('q')
+        self.indice = {}
+        pares = []
+        for origem, destino in arestas:
+            pares.append((self._indexar(origem), self._indexar(destino)))
+
+        n = len(self.ids)
+        # 'saida': de quem cada nó depende. 'entrada': quem depende de cada nó.
+        self.saida_inicio, self.saida = self._montar_csr(n, pares)
+        self.entrada_inicio, self.entrada = self._montar_csr(n, [(d, o) for o, d in pares])
+        self.total_arestas = len(pares)
+        # Resultados globais (ordem topológica e ciclos) calculados uma vez por versão do grafo.
+        self._ordem = None
+        self._ciclos = None
+
+    def _indexar(self, pk):
+        i = self.indice.get(pk)
+        if i is None:
+            i = self.indice[pk] = len(self.ids)
+            self.ids.append(pk)
+        return i
+
+    @staticmethod
+    def _montar_csr(n, pares):
+        graus = [0] * (n + 1)
+        for origem, _ in pares:
+            graus[origem + 1] += 1
+        for i in range(n):
+            graus[i + 1] += graus[i]
+        inicio = array('l', graus)
+        vizinhos = array('l', [0] * len(pares))
+        posicao = list(graus[:n])
+        for origem, destino in pares:
+            vizinhos[posicao[origem]] = destino
+            posicao[origem] += 1
+        return inicio, vizinhos
+
+    def _vizinhos(self, inicio, vizinhos, i):
+        return vizinhos[inicio[i]:inicio[i + 1]]
+
+    def _percorrer(self, pk, inicio, vizinhos, profundidade_maxima):
+        # Busca em largura a partir de 'pk'. Retorna {id: profundidade} dos nós alcançados.
+        origem = self.indice.get(pk)
+        if origem is None:
+            return {}
+        profundidade = {origem: 0}
+        fila = deque([origem])
+        while fila:
+            atual = fila.popleft()
+            nivel = profundidade[atual]
+            if profundidade_maxima is not None and nivel >= profundidade_maxima:
+                continue
+            for vizinho in self._vizinhos(inicio, vizinhos, atual):
+                if vizinho not in profundidade:
+                    profundidade[vizinho] = nivel + 1
+                    fila.append(vizinho)
+        del profundidade[origem]
+        return {self.ids[i]: nivel for i, nivel in profundidade.items()}
+
+    def dependencias(self, pk, profundidade_maxima=None):
+        # Tudo de que 'pk' depende, direta ou indiretamente.
+        return self._percorrer(pk, self.saida_inicio, self.saida, profundidade_maxima)
+
+    def dependentes(self, pk, profundidade_maxima=None):
+        # Tudo o que é afetado se 'pk' mudar (quem depende dele, direta ou indiretamente).
+        return self._percorrer(pk, self.entrada_inicio, self.entrada, profundidade_maxima)
+
+    def ordem_topologica(self):
+        # Algoritmo de Kahn: cada customização aparece depois de todas as suas dependências.
+        # Retorna (ordem, restantes); 'restantes' são os nós presos em ciclos (vazio se não houver).
+        if self._ordem is None:
+            self._ordem = self._calcular_ordem_topologica()
+        return self._ordem
+
+    def _calcular_ordem_topologica(self):
+        n = len(self.ids)
+        pendentes = array('l', (self.saida_inicio[i + 1] - self.saida_inicio[i] for i in range(n)))
+        fila = deque(i for i in range(n) if pendentes[i] == 0)
+        ordem = []
+        while fila:
+            atual = fila.popleft()
+            ordem.append(atual)
+            for dependente in self._vizinhos(self.entrada_inicio, self.entrada, atual):
+                pendentes[dependente] -= 1
+                if pendentes[dependente] == 0:
+                    fila.append(dependente)
+        colocados = set(ordem)
+        restantes = [self.ids[i] for i in range(n) if i not in colocados]
+        return [self.ids[i] for i in ordem], restantes
+
+    def ciclos(self):
+        # Componentes fortemente conexas (Tarjan, versão iterativa) com mais de um nó,
+        # ou com um nó que depende de si mesmo. Cada componente é uma lista de IDs.
+        if self._ciclos is None:
+            self._ciclos = self._calcular_ciclos()
+        return self._ciclos
+
+    def _calcular_ciclos(self):
+        n = len(self.ids)
+        indice = [-1] * n
+        menor = [0] * n
+        na_pilha = [False] * n
+        pilha = []
+        componentes = []
+        contador = 0
+        for raiz in range(n):
+            if indice[raiz] != -1:
+                continue
+            trabalho = [(raiz, self.saida_inicio[raiz])]
+            indice[raiz] = menor[raiz] = contador
+            contador += 1
+            pilha.append(raiz)
+            na_pilha[raiz] = True
+            while trabalho:
+                no, proximo = trabalho[-1]
+                if proximo < self.saida_inicio[no + 1]:
+                    trabalho[-1] = (no, proximo + 1)
+                    vizinho = self.saida[proximo]
+                    if indice[vizinho] == -1:
+                        indice[vizinho] = menor[vizinho] = contador
+                        contador += 1
+                        pilha.append(vizinho)
+                        na_pilha[vizinho] = True
+                        trabalho.append((vizinho, self.saida_inicio[vizinho]))
+                    elif na_pilha[vizinho]:
+                        menor[no] = min(menor[no], indice[vizinho])
+                    continue
+                trabalho.pop()
+                if trabalho:
+                    pai = trabalho[-1][0]
+                    menor[pai] = min(menor[pai], menor[no])
+                if menor[no] == indice[no]:
+                    componente = []
+                    while True:
+                        membro = pilha.pop()
+                        na_pilha[membro] = False
+                        componente.append(membro)
+                        if membro == no:
+                            break
+                    auto_referencia = no in self._vizinhos(self.saida_inicio, self.saida, no)
+                    if len(componente) > 1 or auto_referencia:
+                        componentes.append([self.ids[i] for i in componente])
+        return componentes
+
+
+# --- Cache do grafo no processo ---
+_grafo = None
+_versao_grafo = None
+_lock = threading.Lock()
+
+
+# Versão das arestas no banco. Do banco principal, como as próprias arestas (ver obter_grafo).
+def _versao_atual():
+    return tuple(
+        RegistroMudanca.objects.using(DEFAULT_DB_ALIAS)
+        .filter(modelo=Dependencia._meta.model_name)
+        .order_by('-id').values_list('id', flat=True)[:REGISTROS_VERSAO]
+    )
+
+
+# Retorna o grafo atual, recarregando do banco se alguma Dependencia mudou desde a última carga.
+def obter_grafo():
+    global _grafo, _versao_grafo
+    versao = _versao_atual()
+    if _grafo is not None and _versao_grafo == versao:
+        return _grafo
+    with _lock:
+        if _grafo is None or _versao_grafo != versao:
+            # Sempre do banco principal: o grafo fica em memória até a próxima gravação, então
+            # carregá-lo de uma réplica atrasada deixaria arestas antigas em cache.
+            arestas = Dependencia.objects.using(DEFAULT_DB_ALIAS).values_list(
+                'customizacao_origem_id', 'customizacao_destino_id'
+            )
+            _grafo = GrafoDependencias(arestas.iterator(chunk_size=10000))
+            _versao_grafo = versao
+    return _grafo
+
+
+# Descarta o grafo deste processo. Os demais processos só percebem a mudança pela versão no banco:
+# gravações em lote (bulk_create/update) de Dependencia, que não disparam sinais, precisam
+# chamar registrar_mudancas() (mudancas.py).
+def invalidar_grafo():
+    global _versao_grafo
+    with _lock:
+        _versao_grafo = None
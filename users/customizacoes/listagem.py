@@ -0,0 +1,178 @@
+# customizacoes/listagem.py
+# Listagem rápida: as páginas das listagens são lidas com .values() e convertidas direto em JSON,
+# sem criar objetos do modelo nem passar pelo ModelSerializer linha a linha.
+#
+# O mapeamento é montado uma vez por ViewSet a partir do próprio serializer (mesmos campos, na
+# mesma ordem, com as mesmas conversões), então a resposta é idêntica à do serializer. Campos que
+# só copiam o valor do banco (inteiros, textos, booleanos, chaves estrangeiras) não passam por
+# conversão nenhuma; as datas são convertidas com o fuso resolvido uma vez por página (e não uma
+# vez por valor, como no DateTimeField); os demais usam o to_representation do próprio campo.
+# Campos calculados (SerializerMethodField) precisam de um conversor em 'conversores_listagem'.
+#
+# Para usar, inclua ListagemRapidaMixin no ViewSet (depois do RespostaCondicionalMixin, para as
+# páginas continuarem em cache). O detalhe, a criação e a edição continuam usando o serializer.
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Campos do DRF cujo to_representation devolve o próprio valor lido do banco.
+_CAMPOS_SEM_CONVERSAO = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+)
+
+
+class _CampoRapido:
+    __slots__ = ('nome', 'coluna', 'conversor', 'relacao', 'ausente')
+
+    def __init__(self, nome, coluna, conversor, relacao=None, ausente=None):
+        self.nome = nome
+        # Coluna no .values() (ex: 'tipo__nome').
+        self.coluna = coluna
+        # Função aplicada aos valores não nulos (None: o valor vai como veio do banco), ou
+        # _PorPagina(fabrica), quando a função depende da requisição (ex: o fuso ativo).
+        self.conversor = conversor
+        # Para 'source' com relação (ex: 'tipo.nome'): coluna da chave estrangeira. Se ela for nula,
+        # o DRF omite o campo, ou usa o default/None (ver Field.get_attribute).
+        self.relacao = relacao
+        self.ausente = ausente
+
+
+class _PorPagina:
+    __slots__ = ('fabrica',)
+
+    def __init__(self, fabrica):
+        self.fabrica = fabrica
+
+
+# O mesmo que DateTimeField.to_representation (formato ISO 8601), com o fuso já resolvido.
+def _conversor_data_hora(campo):
+    formato = getattr(campo, 'format', api_settings.DATETIME_FORMAT)
+    if formato is None or formato.lower() != ISO_8601:
+        return campo.to_representation
+
+    def fabrica():
+        fuso = campo.timezone if hasattr(campo, 'timezone') else campo.default_timezone()
+        if fuso is None:
+            return campo.to_representation
+
+        def converter(valor):
+            if isinstance(valor, str) or valor.utcoffset() is None:
+                return campo.to_representation(valor)
+            try:
+                texto = valor.astimezone(fuso).isoformat()
+            except OverflowError:
+                return campo.to_representation(valor)
+            return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+        return converter
+    return _PorPagina(fabrica)
+
+
+def _conversor(campo):
+    if type(campo) in _CAMPOS_SEM_CONVERSAO:
+        return None
+    if type(campo) is serializers.DateTimeField:
+        return _conversor_data_hora(campo)
+    if isinstance(campo, serializers.PrimaryKeyRelatedField):
+        # O .values() já traz a chave; o DRF mostraria obj.pk.
+        return campo.pk_field.to_representation if campo.pk_field is not None else None
+    if isinstance(campo, serializers.RelatedField):
+        raise ImproperlyConfigured(f"Listagem rápida: o campo relacionado '{campo.field_name}' não é suportado.")
+    return campo.to_representation
+
+
+# Valor de um campo com relação nula, como o DRF faz: default, None ou campo omitido (_OMITIR).
+_OMITIR = object()
+
+
+def _valor_ausente(campo):
+    if campo.default is not empty:
+        return campo.get_default()
+    if campo.allow_null:
+        return None
+    if not campo.required:
+        return _OMITIR
+    raise ImproperlyConfigured(f"Listagem rápida: o campo obrigatório '{campo.field_name}' pode faltar.")
+
+
+class MapeadorListagem:
+    """Converte as linhas de .values() nos mesmos dicionários que o serializer produziria."""
+
+    def __init__(self, serializer_class, conversores=None):
+        conversores = conversores or {}
+        self.campos = []
+        colunas = []
+        for nome, campo in serializer_class().fields.items():
+            if campo.write_only:
+                continue
+            if nome in conversores:
+                coluna, conversor = conversores[nome]
+                self.campos.append(_CampoRapido(nome, coluna, conversor))
+                colunas.append(coluna)
+                continue
+            if isinstance(campo, serializers.SerializerMethodField) or campo.source == '*':
+                raise ImproperlyConfigured(
+                    f"Listagem rápida: informe um conversor para '{nome}' em conversores_listagem."
+                )
+            caminho = campo.source.split('.')
+            coluna = '__'.join(caminho)
+            relacao = '__'.join(caminho[:-1]) if len(caminho) > 1 else None
+            ausente = _valor_ausente(campo) if relacao else None
+            self.campos.append(_CampoRapido(nome, coluna, _conversor(campo), relacao, ausente))
+            colunas.append(coluna)
+            if relacao:
+                colunas.append(relacao)
+        # Sem repetições, na ordem em que aparecem.
+        self.colunas = list(dict.fromkeys(colunas))
+
+    def consultar(self, queryset):
+        return queryset.values(*self.colunas)
+
+    def serializar(self, linhas):
+        campos = [
+            (
+                campo.nome, campo.coluna,
+                campo.conversor.fabrica() if isinstance(campo.conversor, _PorPagina) else campo.conversor,
+                campo.relacao, campo.ausente,
+            )
+            for campo in self.campos
+        ]
+        resultado = []
+        for linha in linhas:
+            item = {}
+            for nome, coluna, conversor, relacao, ausente in campos:
+                if relacao is not None and linha[relacao] is None:
+                    if ausente is not _OMITIR:
+                        item[nome] = ausente
+                    continue
+                valor = linha[coluna]
+                if valor is not None and conversor is not None:
+                    valor = conversor(valor)
+                item[nome] = valor
+            resultado.append(item)
+        return resultado
+
+
+# --- Mixin para os ViewSets ---
+class ListagemRapidaMixin:
+    # Campos calculados do serializer: {campo: (coluna do ORM, função aplicada ao valor da coluna)}.
+    conversores_listagem = {}
+
+    def obter_mapeador(self):
+        # Montado uma vez por ViewSet (o serializer e os conversores são fixos na classe).
+        classe = type(self)
+        mapeador = classe.__dict__.get('_mapeador_listagem')
+        if mapeador is None:
+            mapeador = MapeadorListagem(self.get_serializer_class(), self.conversores_listagem)
+            classe._mapeador_listagem = mapeador
+        return mapeador
+
+    def list(self, request, *args, **kwargs):
+        mapeador = self.obter_mapeador()
+        linhas = mapeador.consultar(self.filter_queryset(self.get_queryset()))
+        pagina = self.paginate_queryset(linhas)
+        if pagina is not None:
+            return self.get_paginated_response(mapeador.serializar(pagina))
+        return Response(mapeador.serializar(linhas))
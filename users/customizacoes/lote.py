@@ -0,0 +1,244 @@
+# customizacoes/lote.py
+# Gravação de customizações em lote (criar, atualizar e desativar milhares de registros por requisição).
+#
+# Cada item é validado pelos campos (serializer), mas as validações que dependem do banco
+# (tipo existe? código do ERP já usado? ID existe?) são feitas uma única vez para o lote inteiro.
+# A gravação acontece em uma transação, com bulk_create/bulk_update, e o histórico de todos os
+# itens (com as diferenças campo a campo) é gravado com um único bulk_create quando ela é
+# confirmada (ver auditoria.py). O resultado informa, item a item, o que aconteceu.
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .auditoria import calcular_alteracoes, registrar_historico
+from .models import Customizacao, RegistroMudanca, TipoCustomizacao
+from .mudancas import registrar_mudancas
+
+# Número máximo de itens aceitos em uma requisição. Mantém as consultas com __in abaixo do
+# limite de ~2100 parâmetros por comando do SQL Server.
+MAXIMO_ITENS_LOTE = 2000
+TAMANHO_LOTE = 500
+# Campos que podem ser informados nos itens do lote.
+CAMPOS_LOTE = ('nome', 'tipo_id', 'codigo_erp', 'descricao', 'codigo_fonte', 'ativo')
+
+
+class ErroLote(Exception):
+    """Requisição de lote inválida como um todo (formato, tamanho)."""
+
+
+# Valida os campos de um item sem consultar o banco (a unicidade e as chaves são checadas no lote todo).
+class CustomizacaoLoteSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    tipo = serializers.IntegerField(source='tipo_id', allow_null=True, required=False)
+
+    class Meta:
+        model = Customizacao
+        fields = ('id', 'nome', 'tipo', 'codigo_erp', 'descricao', 'codigo_fonte', 'ativo')
+        extra_kwargs = {'codigo_erp': {'validators': []}}
+
+
+def _verificar_itens(itens):
+    if not isinstance(itens, list) or not itens:
+        raise ErroLote('Envie uma lista não vazia de itens.')
+    if len(itens) > MAXIMO_ITENS_LOTE:
+        raise ErroLote(f'No máximo {MAXIMO_ITENS_LOTE} itens por requisição.')
+
+
+# Valida os campos de cada item. Retorna ({índice: dados validados}, {índice: erros}).
+def _validar_campos(itens, parcial):
+    validos, erros = {}, {}
+    for indice, item in enumerate(itens):
+        serializer = CustomizacaoLoteSerializer(data=item, partial=parcial)
+        if serializer.is_valid():
+            validos[indice] = serializer.validated_data
+        else:
+            erros[indice] = serializer.errors
+    return validos, erros
+
+
+def _anotar_erro(erros, validos, indice, campo, mensagem):
+    erros.setdefault(indice, {}).setdefault(campo, []).append(mensagem)
+    validos.pop(indice, None)
+
+
+# Confere, com uma consulta, se os tipos informados existem.
+def _validar_tipos(validos, erros):
+    tipos = {dados['tipo_id'] for dados in validos.values() if dados.get('tipo_id') is not None}
+    existentes = set(TipoCustomizacao.objects.filter(id__in=tipos).values_list('id', flat=True)) if tipos else set()
+    for indice, dados in list(validos.items()):
+        tipo = dados.get('tipo_id')
+        if tipo is not None and tipo not in existentes:
+            _anotar_erro(erros, validos, indice, 'tipo', f'Tipo {tipo} não existe.')
+
+
+# Confere, com uma consulta, se os códigos do ERP são únicos (no banco e dentro do próprio lote).
+def _validar_codigos(validos, erros, ids_por_indice=None):
+    ids_por_indice = ids_por_indice or {}
+    codigos = {}
+    for indice, dados in validos.items():
+        if 'codigo_erp' in dados:
+            codigos.setdefault(dados['codigo_erp'], []).append(indice)
+    if not codigos:
+        return
+    donos = dict(Customizacao.objects.filter(codigo_erp__in=codigos.keys()).values_list('codigo_erp', 'id'))
+    for codigo, indices in codigos.items():
+        for indice in indices:
+            if len(indices) > 1:
+                _anotar_erro(erros, validos, indice, 'codigo_erp', f'Código {codigo} repetido no lote.')
+            elif codigo in donos and donos[codigo] != ids_por_indice.get(indice):
+                _anotar_erro(erros, validos, indice, 'codigo_erp', f'Já existe uma customização com o código {codigo}.')
+
+
+def _resultado(indices_aplicados, erros, status, ids):
+    resultados = []
+    for indice in sorted(set(indices_aplicados) | set(erros)):
+        if indice in erros:
+            resultados.append({'indice': indice, 'status': 'erro', 'erros': erros[indice]})
+        else:
+            resultados.append({'indice': indice, 'status': status, 'id': ids[indice]})
+    return resultados
+
+
+# Atualiza o índice de busca e o resumo do dashboard (bulk_create/bulk_update não disparam sinais).
+def _catalogo_alterado(ids):
+    from .busca import indexar_customizacoes
+    from customizacoes.dashboard import invalidar_cache_dashboard
+    indexar_customizacoes(ids)
+    invalidar_cache_dashboard()
+
+
+# Cria as customizações de 'itens' (lista de dicionários no formato da API).
+# Sem 'ignorar_invalidos', um único item inválido cancela o lote inteiro.
+# Retorna (aplicado, resultados), onde 'resultados' tem uma entrada por item.
+def criar_em_lote(itens, usuario, ignorar_invalidos=False):
+    _verificar_itens(itens)
+    validos, erros = _validar_campos(itens, parcial=False)
+    _validar_tipos(validos, erros)
+    _validar_codigos(validos, erros)
+    while True:
+        if erros and not ignorar_invalidos:
+            return False, _resultado([], erros, None, {})
+        try:
+            ids = _gravar_criacao(validos, usuario) if validos else {}
+        except IntegrityError:
+            # Outra requisição gravou um dos códigos depois da validação: a transação foi desfeita,
+            # e a nova validação aponta o item em conflito como qualquer outro item inválido.
+            invalidos = len(erros)
+            _validar_codigos(validos, erros)
+            if len(erros) == invalidos:
+                raise
+            continue
+        return True, _resultado(validos, erros, 'criada', ids)
+
+
+def _gravar_criacao(validos, usuario):
+    with transaction.atomic():
+        Customizacao.objects.bulk_create([
+            Customizacao(criado_por=usuario, **{campo: dados[campo] for campo in CAMPOS_LOTE if campo in dados})
+            for dados in validos.values()
+        ], batch_size=TAMANHO_LOTE)
+        # Nem todo backend devolve as chaves primárias no bulk_create; relemos os IDs em uma consulta.
+        por_codigo = dict(
+            Customizacao.objects.filter(
+                codigo_erp__in=[dados['codigo_erp'] for dados in validos.values()]
+            ).values_list('codigo_erp', 'id')
+        )
+        ids = {indice: por_codigo[dados['codigo_erp']] for indice, dados in validos.items()}
+        for indice, dados in validos.items():
+            registrar_historico(
+                ids[indice], 'Criação', calcular_alteracoes({}, {
+                    campo: Customizacao.valor_auditado(campo, dados[campo]) for campo in CAMPOS_LOTE if campo in dados
+                }),
+                detalhes='Customização criada em lote.', usuario=usuario,
+            )
+        registrar_mudancas(Customizacao, ids.values(), RegistroMudanca.OPERACAO_CRIACAO)
+        transaction.on_commit(lambda: _catalogo_alterado(list(ids.values())))
+    return ids
+
+
+# Atualiza as customizações de 'itens'; cada item traz o 'id' e apenas os campos que mudam.
+# Itens sem nenhuma diferença para o banco não são gravados nem entram no histórico.
+def atualizar_em_lote(itens, usuario, ignorar_invalidos=False):
+    _verificar_itens(itens)
+    validos, erros = _validar_campos(itens, parcial=True)
+    for indice, dados in list(validos.items()):
+        if dados.get('id') is None:
+            _anotar_erro(erros, validos, indice, 'id', 'Informe o ID da customização.')
+    ids_por_indice = {indice: dados['id'] for indice, dados in validos.items()}
+
+    with transaction.atomic():
+        # Uma consulta carrega (e bloqueia) todas as customizações do lote.
+        atuais = Customizacao.objects.select_for_update().in_bulk(set(ids_por_indice.values()))
+        for indice, pk in ids_por_indice.items():
+            if pk not in atuais:
+                _anotar_erro(erros, validos, indice, 'id', f'Customização {pk} não existe.')
+        repeticoes = Counter(ids_por_indice.values())
+        for indice, pk in ids_por_indice.items():
+            if repeticoes[pk] > 1:
+                _anotar_erro(erros, validos, indice, 'id', f'Customização {pk} repetida no lote.')
+        _validar_tipos(validos, erros)
+        _validar_codigos(validos, erros, ids_por_indice)
+        if erros and not ignorar_invalidos:
+            return False, _resultado([], erros, None, {})
+
+        agora = timezone.now()
+        alteradas, campos_gravados = [], {'data_ultima_alteracao'}
+        for indice, dados in validos.items():
+            customizacao = atuais[dados['id']]
+            mudancas = [
+                campo for campo in CAMPOS_LOTE
+                if campo in dados and getattr(customizacao, campo) != dados[campo]
+            ]
+            if not mudancas:
+                continue
+            for campo in mudancas:
+                setattr(customizacao, campo, dados[campo])
+            # bulk_update não dispara o auto_now, então a data de alteração é preenchida aqui.
+            customizacao.data_ultima_alteracao = agora
+            campos_gravados.update(mudancas)
+            alteradas.append(customizacao)
+            # Os valores antigos vieram com a própria consulta do lote (AuditoriaMixin).
+            alteracoes = calcular_alteracoes(customizacao._valores_originais, customizacao.valores_auditados())
+            registrar_historico(
+                customizacao.id, 'Edição', alteracoes,
+                detalhes='Campos alterados em lote: ' + ', '.join(alteracoes), usuario=usuario,
+            )
+        if alteradas:
+            Customizacao.objects.bulk_update(alteradas, sorted(campos_gravados), batch_size=TAMANHO_LOTE)
+            ids_alterados = [customizacao.id for customizacao in alteradas]
+            registrar_mudancas(Customizacao, ids_alterados, RegistroMudanca.OPERACAO_ALTERACAO)
+            transaction.on_commit(lambda: _catalogo_alterado(ids_alterados))
+    return True, _resultado(validos, erros, 'atualizada', ids_por_indice)
+
+
+# Desativa (ativo=False) as customizações de 'ids' com um UPDATE só. IDs inexistentes voltam como erro;
+# customizações já inativas não geram histórico.
+def desativar_em_lote(ids, usuario):
+    _verificar_itens(ids)
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        raise ErroLote('Os IDs devem ser números inteiros.')
+    with transaction.atomic():
+        ativos = dict(
+            Customizacao.objects.select_for_update().filter(id__in=set(ids)).values_list('id', 'ativo')
+        )
+        desativar = [pk for pk, ativo in ativos.items() if ativo]
+        if desativar:
+            Customizacao.objects.filter(id__in=desativar).update(ativo=False, data_ultima_alteracao=timezone.now())
+            for pk in desativar:
+                registrar_historico(
+                    pk, 'Desativação', {'ativo': {'de': True, 'para': False}},
+                    detalhes='Customização desativada em lote.', usuario=usuario,
+                )
+            registrar_mudancas(Customizacao, desativar, RegistroMudanca.OPERACAO_ALTERACAO)
+            from customizacoes.dashboard import invalidar_cache_dashboard
+            transaction.on_commit(invalidar_cache_dashboard)
+    erros = {
+        indice: {'id': [f'Customização {pk} não existe.']}
+        for indice, pk in enumerate(ids) if pk not in ativos
+    }
+    return True, _resultado(
+        [indice for indice, pk in enumerate(ids) if pk in ativos], erros, 'desativada', dict(enumerate(ids))
+    )
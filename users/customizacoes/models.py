@@ -7,6 +7,45 @@ from django.contrib.auth import get_user_model
 # Obtém o modelo de usuário que está ativo no seu projeto.
 User = get_user_model()
 
+
+# Texto de um objeto relacionado para os __str__ abaixo. Só usa o objeto se ele já foi carregado
+# (ex: com select_related); caso contrário mostra o ID, para que listar N registros não faça N consultas.
+def _exibir_relacionado(instancia, campo, atributo):
+    descritor = getattr(type(instancia), campo)
+    if descritor.is_cached(instancia):
+        relacionado = getattr(instancia, campo)
+        return getattr(relacionado, atributo) if relacionado is not None else None
+    pk = getattr(instancia, descritor.field.attname)
+    return f"#{pk}" if pk is not None else None
+
+
+# Auditoria por campo (ver customizacoes/auditoria.py): guarda os valores dos campos auditados como
+# vieram do banco, para que o histórico saiba o que mudou em um save() sem reler o registro.
+class AuditoriaMixin:
+    # Campos auditados (pelo attname, ex: 'tipo_id').
+    campos_auditados = ()
+    # Campos de texto longo: o histórico guarda só o tamanho (em caracteres), não o texto.
+    campos_resumidos = ()
+
+    @classmethod
+    def valor_auditado(cls, campo, valor):
+        if campo in cls.campos_resumidos and valor is not None:
+            return len(valor)
+        return valor
+
+    # Valores atuais dos campos auditados carregados na instância (campos adiados ficam de fora).
+    def valores_auditados(self):
+        return {
+            campo: self.valor_auditado(campo, self.__dict__[campo])
+            for campo in self.campos_auditados if campo in self.__dict__
+        }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_originais = instancia.valores_auditados()
+        return instancia
+
 # --- Modelo TipoCustomizacao ---
 # Armazena os tipos de customização que existem (ex: 'Fórmula Visual', 'Consulta SQL').
 class TipoCustomizacao(models.Model):
@@ -22,7 +61,10 @@ class TipoCustomizacao(models.Model):
 
 # --- Modelo Customizacao ---
 # O modelo principal, que representa uma customização do ERP.
-class Customizacao(models.Model):
+class Customizacao(AuditoriaMixin, models.Model):
+    campos_auditados = ('nome', 'tipo_id', 'codigo_erp', 'descricao', 'codigo_fonte', 'ativo')
+    campos_resumidos = ('codigo_fonte',)
+
     # models.CharField: Campo de texto para o nome da customização.
     nome = models.CharField(max_length=255)
     # models.ForeignKey: Cria uma relação com o modelo TipoCustomizacao.
@@ -32,6 +74,8 @@ class Customizacao(models.Model):
     codigo_erp = models.CharField(max_length=100, unique=True, help_text="Código da customização no ERP RM TOTVS")
     # models.TextField: Descrição opcional da customização.
     descricao = models.TextField(blank=True, null=True)
+    # Texto SQL/fórmula da customização, como está no ERP. Usado para descobrir dependências automaticamente.
+    codigo_fonte = models.TextField(blank=True, null=True)
     # models.DateTimeField: Armazena data e hora.
     # auto_now_add=True: Preenchido automaticamente na criação.
     data_criacao = models.DateTimeField(auto_now_add=True)
@@ -41,6 +85,11 @@ class Customizacao(models.Model):
     criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='customizacoes_criadas')
     # models.BooleanField: Campo para armazenar um valor verdadeiro/falso (True/False).
     ativo = models.BooleanField(default=True)
+    # Impressão digital (hash) das colunas do ERP usadas na última sincronização.
+    # Permite detectar alterações no ERP comparando apenas hashes, sem carregar o objeto inteiro.
+    hash_erp = models.CharField(max_length=32, blank=True, null=True, editable=False)
+    # Hash do codigo_fonte na última análise de dependências; se não mudou, a análise é pulada.
+    hash_analise = models.CharField(max_length=32, blank=True, null=True, editable=False)
 
     def __str__(self):
         return self.nome
@@ -59,13 +108,27 @@ class HistoricoAlteracao(models.Model):
     tipo_alteracao = models.CharField(max_length=50)
     # models.TextField: Descrição detalhada do que foi alterado.
     detalhes_alteracao = models.TextField(blank=True, null=True)
+    # Diferenças campo a campo, em JSON: {"campo": {"de": valor antigo, "para": valor novo}}.
+    # Gravado por customizacoes/auditoria.py; vazio nos registros anteriores à auditoria por campo.
+    alteracoes = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Paginação por chave do histórico completo (do mais recente para o mais antigo).
+            models.Index(fields=['-data_alteracao', '-id'], name='hist_data_id_idx'),
+            # Histórico de uma customização específica, na mesma ordem.
+            models.Index(fields=['customizacao', '-data_alteracao', '-id'], name='hist_cust_data_id_idx'),
+        ]
 
     def __str__(self):
-        return f"Alteração em {self.customizacao.nome} por {self.alterado_por.username if self.alterado_por else 'Desconhecido'}"
+        alterado_por = _exibir_relacionado(self, 'alterado_por', 'username')
+        return f"Alteração em {_exibir_relacionado(self, 'customizacao', 'nome')} por {alterado_por or 'Desconhecido'}"
 
 # --- Modelo Dependencia ---
 # Mapeia as dependências entre customizações.
-class Dependencia(models.Model):
+class Dependencia(AuditoriaMixin, models.Model):
+    campos_auditados = ('customizacao_origem_id', 'customizacao_destino_id', 'tipo_dependencia', 'descricao')
+
     # A customização que depende de outra.
     customizacao_origem = models.ForeignKey(Customizacao, on_delete=models.CASCADE, related_name='dependencias_saida')
     # A customização da qual a origem depende.
@@ -80,11 +143,15 @@ class Dependencia(models.Model):
         unique_together = ('customizacao_origem', 'customizacao_destino')
 
     def __str__(self):
-        return f"{self.customizacao_origem.nome} -> {self.customizacao_destino.nome}"
+        return f"{_exibir_relacionado(self, 'customizacao_origem', 'nome')} -> {_exibir_relacionado(self, 'customizacao_destino', 'nome')}"
 
 # --- Modelo DocumentacaoTecnica ---
 # Armazena a documentação técnica de uma customização.
-class DocumentacaoTecnica(models.Model):
+class DocumentacaoTecnica(AuditoriaMixin, models.Model):
+    # O texto em si fica nas revisões (RevisaoDocumentacao); o histórico guarda o tamanho.
+    campos_auditados = ('customizacao_id', 'conteudo')
+    campos_resumidos = ('conteudo',)
+
     # models.OneToOneField: Relação de "um para um". Cada customização tem apenas uma documentação.
     customizacao = models.OneToOneField(Customizacao, on_delete=models.CASCADE, related_name='documentacao')
     # O conteúdo da documentação.
@@ -93,6 +160,129 @@ class DocumentacaoTecnica(models.Model):
     data_ultima_atualizacao = models.DateTimeField(auto_now=True)
     # Usuário que atualizou pela última vez.
     atualizado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Número da revisão atual (ver RevisaoDocumentacao); 0 enquanto não houver histórico.
+    revisao_atual = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self):
+        return f"Documentação de {_exibir_relacionado(self, 'customizacao', 'nome')}"
+
+    def save(self, *args, **kwargs):
+        # revisao_atual só é alterada por registrar_revisao (revisoes.py): um save() de uma instância
+        # lida antes de outra edição não pode gravar de volta um número de revisão desatualizado.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name != 'revisao_atual'
+            ]
+        super().save(*args, **kwargs)
+
+# --- Modelo SincronizacaoERP ---
+# Guarda a "marca d'água" de cada rotina de sincronização com o ERP, ou seja,
+# o último registro do ERP já processado. Assim cada execução lê apenas o que é novo.
+class SincronizacaoERP(models.Model):
+    # Identificador da rotina (ex: 'FCUSTOMIZACOES').
+    nome = models.CharField(max_length=100, unique=True)
+    # DATA_CRIACAO do último registro do ERP já processado.
+    ultima_data_criacao = models.DateTimeField(null=True, blank=True)
+    # ID_CUSTOMIZACAO do último registro processado (desempate entre registros com a mesma data).
+    ultimo_id_erp = models.CharField(max_length=100, blank=True, null=True)
+    # Data e hora em que a marca d'água foi atualizada pela última vez.
+    data_ultima_execucao = models.DateTimeField(auto_now=True)
+    # Trava (lease) da rotina: só o processo 'trava_dono' sincroniza até 'trava_expira_em'.
+    # Mantida pelo comando sincronizar_erp (ver customizacoes/sincronizacao.py).
+    trava_dono = models.CharField(max_length=255, blank=True, null=True, editable=False)
+    trava_expira_em = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"Sincronização {self.nome} até {self.ultima_data_criacao} ({self.ultimo_id_erp})"
+
+# --- Modelo ExecucaoSincronizacao ---
+# Estatísticas de cada execução de uma rotina de sincronização com o ERP.
+class ExecucaoSincronizacao(models.Model):
+    # Rotina executada (mesmo nome de SincronizacaoERP) e processo que a executou (host:pid).
+    nome = models.CharField(max_length=100)
+    executor = models.CharField(max_length=255)
+    inicio = models.DateTimeField()
+    # Duração da execução, em segundos.
+    duracao = models.FloatField()
+    # Linhas lidas do ERP, customizações criadas e alteradas.
+    lidas = models.PositiveIntegerField(default=0)
+    inseridas = models.PositiveIntegerField(default=0)
+    alteradas = models.PositiveIntegerField(default=0)
+    # Mensagem de erro, se a execução falhou.
+    erro = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['nome', 'inicio'])]
+        ordering = ['-inicio']
+
+    def __str__(self):
+        return f"{self.nome} em {self.inicio}: {self.lidas} lidas, {self.inseridas} novas, {self.alteradas} alteradas"
+
+# --- Modelo TermoBusca ---
+# Índice invertido da busca textual: para cada termo normalizado (minúsculo, sem acentos),
+# as customizações em que ele aparece e o peso dele em cada uma. Mantido por customizacoes/busca.py.
+class TermoBusca(models.Model):
+    # O termo normalizado (ex: 'formula', 'contabil').
+    termo = models.CharField(max_length=60)
+    # A customização em que o termo aparece (nome, código, tipo, descrição ou documentação).
+    customizacao = models.ForeignKey(Customizacao, on_delete=models.CASCADE, related_name='termos_busca')
+    # Relevância do termo nessa customização (depende do campo e da frequência).
+    peso = models.FloatField()
+
+    class Meta:
+        # O índice por termo atende a busca exata e por prefixo (termo LIKE 'abc%').
+        unique_together = ('termo', 'customizacao')
+
+    def __str__(self):
+        return f"{self.termo} -> {self.customizacao_id} ({self.peso})"
+
+# --- Modelo RegistroMudanca ---
+# Log de mudanças (somente inclusão) de Customizacao, Dependencia e DocumentacaoTecnica.
+# Alimenta o feed /api/mudancas/: os clientes guardam o cursor (o ID do último registro visto)
+# e pedem só o que mudou depois dele, em vez de listar o catálogo inteiro. Mantido por customizacoes/mudancas.py.
+class RegistroMudanca(models.Model):
+    OPERACAO_CRIACAO = 'criacao'
+    OPERACAO_ALTERACAO = 'alteracao'
+    OPERACAO_EXCLUSAO = 'exclusao'
+    OPERACOES = [
+        (OPERACAO_CRIACAO, 'Criação'),
+        (OPERACAO_ALTERACAO, 'Alteração'),
+        (OPERACAO_EXCLUSAO, 'Exclusão'),
+    ]
+
+    # O ID cresce a cada registro e serve de cursor do feed.
+    id = models.BigAutoField(primary_key=True)
+    # Modelo alterado (ex: 'customizacao', 'dependencia', 'documentacaotecnica').
+    modelo = models.CharField(max_length=50)
+    # ID do objeto alterado (o objeto pode já ter sido excluído, por isso não é uma ForeignKey).
+    objeto_id = models.BigIntegerField()
+    operacao = models.CharField(max_length=10, choices=OPERACOES)
+    data = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.operacao} {self.modelo} {self.objeto_id}"
+
+# --- Modelo RevisaoDocumentacao ---
+# Histórico de versões da documentação técnica. Para economizar espaço, cada revisão guarda só
+# a diferença (delta) para a anterior, comprimida; a cada algumas revisões é guardado o texto
+# completo (snapshot), para que reconstruir qualquer versão aplique poucos deltas. Mantido por customizacoes/revisoes.py.
+class RevisaoDocumentacao(models.Model):
+    documentacao = models.ForeignKey(DocumentacaoTecnica, on_delete=models.CASCADE, related_name='revisoes')
+    # Número sequencial da revisão dentro da documentação (1, 2, 3...).
+    numero = models.PositiveIntegerField()
+    # True: 'dados' é o texto completo; False: é o delta para a revisão anterior.
+    snapshot = models.BooleanField(default=False)
+    # Texto completo ou delta, comprimido com zlib.
+    dados = models.BinaryField()
+    # Tamanho (em caracteres) do texto desta revisão, para exibir sem reconstruí-lo.
+    tamanho = models.PositiveIntegerField(default=0)
+    autor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    data = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('documentacao', 'numero')
+        ordering = ['documentacao', 'numero']
 
     def __str__(self):
-        return f"Documentação de {self.customizacao.nome}"
+        return f"Revisão {self.numero} da documentação {self.documentacao_id}"
@@ -0,0 +1,137 @@
+# customizacoes/mudancas.py
+# Feed de mudanças: em vez de listar o catálogo inteiro para descobrir o que mudou, o cliente
+# guarda um cursor e pede só as criações, alterações e exclusões posteriores a ele.
+#
+# Toda gravação de Customizacao, Dependencia e DocumentacaoTecnica acrescenta uma linha em
+# RegistroMudanca (pelos sinais, ou por registrar_mudancas() nas gravações em lote). O custo de
+# uma consulta ao feed depende do número de mudanças desde o cursor, não do tamanho do catálogo.
+#
+# Com ?espera=N o pedido fica aberto até N segundos esperando uma mudança (long polling). A espera
+# verifica a cada INTERVALO_ESPERA segundos se há um registro depois do cursor (uma consulta pela
+# chave primária), então acorda também com gravações de outros processos (workers, sincronizar_erp).
+
+import threading
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Customizacao, Dependencia, DocumentacaoTecnica, RegistroMudanca
+
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+ESPERA_MAXIMA = 30
+# Intervalo (segundos) entre as verificações de novos registros durante a espera (long polling).
+INTERVALO_ESPERA = 1.0
+# IDs são reservados no INSERT, mas ficam visíveis só no COMMIT: uma transação longa pode confirmar
+# o ID 10 depois que o 11 já foi entregue. Por isso o feed para em um "buraco" na sequência até
+# que ele esteja aberto há mais que esta janela (aí é um ID descartado por ROLLBACK e pode ser pulado).
+# O tempo conta de quando o buraco foi visto pela primeira vez, e não da data dos registros
+# seguintes: uma transação que ficou aberta mais que a janela (ex: um lote grande do ERP) ainda é
+# esperada depois de confirmar, se o buraco acabou de aparecer para o feed.
+JANELA_LACUNA = timedelta(seconds=getattr(settings, 'MUDANCAS_JANELA_LACUNA', 30))
+# Máximo de buracos anotados por processo (os mais antigos são descartados).
+MAXIMO_LACUNAS = 1000
+
+# {primeiro ID do buraco: instante (time.monotonic) em que foi visto pela primeira vez neste processo}.
+_lacunas_vistas = {}
+_lock_lacunas = threading.Lock()
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(ultimo_id):
+    return urlsafe_b64encode(f'm{ultimo_id}'.encode('ascii')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        texto = urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+        if not texto.startswith('m'):
+            raise ValueError
+        return int(texto[1:])
+    except (TypeError, ValueError, UnicodeError):
+        raise CursorInvalido('Cursor inválido.')
+
+
+# Registra mudanças feitas por gravações em lote (bulk_create/bulk_update/update), que não disparam sinais.
+# 'modelo' é a classe do modelo; 'ids' os IDs dos objetos; 'operacao' uma das RegistroMudanca.OPERACOES.
+def registrar_mudancas(modelo, ids, operacao):
+    registros = [
+        RegistroMudanca(modelo=modelo._meta.model_name, objeto_id=pk, operacao=operacao)
+        for pk in ids
+    ]
+    if registros:
+        RegistroMudanca.objects.bulk_create(registros, batch_size=1000)
+
+
+# Lê as mudanças posteriores ao cursor. Retorna (registros, próximo cursor, tem_mais).
+def ler_mudancas(ultimo_id, limite=LIMITE_PADRAO):
+    registros = list(
+        RegistroMudanca.objects.filter(id__gt=ultimo_id).order_by('id')[:limite + 1]
+    )
+    tem_mais = len(registros) > limite
+    registros = registros[:limite]
+
+    entregues = []
+    esperado = ultimo_id + 1
+    for registro in registros:
+        if registro.id != esperado and not _lacuna_vencida(esperado):
+            # Pode haver uma transação ainda aberta com os IDs que faltam: espera por eles.
+            tem_mais = True
+            break
+        entregues.append(registro)
+        esperado = registro.id + 1
+    proximo = entregues[-1].id if entregues else ultimo_id
+    return entregues, proximo, tem_mais
+
+
+# Diz se o buraco que começa em 'pk' já está aberto há mais que JANELA_LACUNA (e pode ser pulado).
+def _lacuna_vencida(pk):
+    agora = time.monotonic()
+    with _lock_lacunas:
+        vista_em = _lacunas_vistas.setdefault(pk, agora)
+        if len(_lacunas_vistas) > MAXIMO_LACUNAS:
+            for antiga in sorted(_lacunas_vistas)[:len(_lacunas_vistas) - MAXIMO_LACUNAS]:
+                del _lacunas_vistas[antiga]
+    return agora - vista_em >= JANELA_LACUNA.total_seconds()
+
+
+# Como ler_mudancas, mas, se não houver nada novo, espera até 'espera' segundos por uma mudança.
+def aguardar_mudancas(ultimo_id, limite=LIMITE_PADRAO, espera=0):
+    # 'espera > 0' é falso também para NaN: nesse caso não espera.
+    prazo = time.monotonic() + (min(espera, ESPERA_MAXIMA) if espera > 0 else 0)
+    while True:
+        registros, proximo, tem_mais = ler_mudancas(ultimo_id, limite)
+        if registros or time.monotonic() >= prazo:
+            return registros, proximo, tem_mais
+        # Nada novo: espera um registro depois do cursor (ou, se o feed parou num buraco, o próximo ciclo).
+        while time.monotonic() < prazo:
+            time.sleep(INTERVALO_ESPERA)
+            if tem_mais or RegistroMudanca.objects.filter(id__gt=ultimo_id).exists():
+                break
+
+
+# --- Registro automático pelos sinais ---
+
+@receiver(post_save, sender=Customizacao)
+@receiver(post_save, sender=Dependencia)
+@receiver(post_save, sender=DocumentacaoTecnica)
+def _objeto_salvo(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        operacao = RegistroMudanca.OPERACAO_CRIACAO if created else RegistroMudanca.OPERACAO_ALTERACAO
+        registrar_mudancas(sender, [instance.pk], operacao)
+
+
+@receiver(post_delete, sender=Customizacao)
+@receiver(post_delete, sender=Dependencia)
+@receiver(post_delete, sender=DocumentacaoTecnica)
+def _objeto_excluido(sender, instance, **kwargs):
+    registrar_mudancas(sender, [instance.pk], RegistroMudanca.OPERACAO_EXCLUSAO)
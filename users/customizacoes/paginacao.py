@@ -0,0 +1,129 @@
+# customizacoes/paginacao.py
+# Paginação por chave (keyset/cursor) para tabelas que só crescem, como o histórico de alterações.
+#
+# Em vez de OFFSET + COUNT(*), cada página guarda a chave (data, id) do último item e a próxima
+# página filtra "chave < última chave", usando o índice composto. Assim a página 10.000 custa o
+# mesmo que a primeira. O cursor é opaco para o cliente: basta seguir os links 'next'/'previous'.
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginacaoPorChave(BasePagination):
+    # Campo de data que, junto com o 'id', ordena os registros (do mais recente para o mais antigo).
+    campo_data = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    mensagem_cursor_invalido = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decodificar_cursor(request)
+        campo = self.campo_data
+
+        # Sem cursor ou avançando ('>'): do mais novo para o mais antigo, depois da chave do cursor.
+        # Voltando ('<'): percorre no sentido contrário e inverte o resultado no fim.
+        voltando = cursor is not None and cursor[0] == '<'
+        if voltando:
+            queryset = queryset.order_by(campo, 'id')
+        else:
+            queryset = queryset.order_by(f'-{campo}', '-id')
+
+        if cursor is not None:
+            _, data, pk = cursor
+            if voltando:
+                filtro = Q(**{f'{campo}__gt': data}) | Q(**{campo: data, 'id__gt': pk})
+            else:
+                filtro = Q(**{f'{campo}__lt': data}) | Q(**{campo: data, 'id__lt': pk})
+            queryset = queryset.filter(filtro)
+
+        # Busca um item a mais só para saber se existe outra página naquele sentido.
+        itens = list(queryset[:self.page_size + 1])
+        mais_itens = len(itens) > self.page_size
+        itens = itens[:self.page_size]
+        if voltando:
+            itens.reverse()
+            self.tem_anterior, self.tem_proxima = mais_itens, True
+        else:
+            self.tem_anterior, self.tem_proxima = cursor is not None, mais_itens
+        self.itens = itens
+        return itens
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                tamanho = int(request.query_params[self.page_size_query_param])
+                if tamanho > 0:
+                    return min(tamanho, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.tem_proxima or not self.itens:
+            return None
+        return self._link('>', self.itens[-1])
+
+    def get_previous_link(self):
+        if not self.tem_anterior or not self.itens:
+            return None
+        return self._link('<', self.itens[0])
+
+    def _link(self, direcao, item):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.codificar_cursor(direcao, item))
+
+    def _valor(self, item, campo):
+        # Aceita tanto objetos do modelo quanto dicionários (consultas com .values()).
+        return item[campo] if isinstance(item, dict) else getattr(item, campo)
+
+    def codificar_cursor(self, direcao, item):
+        texto = f"{direcao}|{self._valor(item, self.campo_data).isoformat()}|{self._valor(item, 'id')}"
+        return urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+    def decodificar_cursor(self, request):
+        valor = request.query_params.get(self.cursor_query_param)
+        if not valor:
+            return None
+        try:
+            direcao, data, pk = urlsafe_b64decode(valor.encode('ascii')).decode('utf-8').split('|')
+            data = parse_datetime(data)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.mensagem_cursor_invalido)
+        if direcao not in ('<', '>') or data is None:
+            raise NotFound(self.mensagem_cursor_invalido)
+        return direcao, data, pk
+
+
+# --- Paginação do histórico de alterações ---
+# Usa os índices (data_alteracao, id) e (customizacao, data_alteracao, id) de HistoricoAlteracao.
+class PaginacaoHistorico(PaginacaoPorChave):
+    campo_data = 'data_alteracao'
@@ -0,0 +1,123 @@
+# customizacoes/revisoes.py
+# Versões da documentação técnica, guardadas como deltas comprimidos (ver RevisaoDocumentacao).
+#
+# O delta é calculado por linhas: uma lista de operações "copie as linhas i..j da versão anterior"
+# ou "insira este texto". Em documentos longos, uma edição típica muda poucas linhas, então o
+# delta (ainda comprimido com zlib) ocupa uma fração do texto. A cada INTERVALO_SNAPSHOT revisões
+# o texto completo é guardado, de modo que reconstruir uma versão aplica no máximo esse número de deltas.
+
+import difflib
+import json
+import zlib
+
+from django.db import transaction
+
+from .models import DocumentacaoTecnica, RevisaoDocumentacao
+
+INTERVALO_SNAPSHOT = 10
+NIVEL_COMPRESSAO = 6
+
+
+def _comprimir(texto):
+    return zlib.compress(texto.encode('utf-8'), NIVEL_COMPRESSAO)
+
+
+def _descomprimir(dados):
+    return zlib.decompress(bytes(dados)).decode('utf-8')
+
+
+# Delta de 'antigo' para 'novo': lista de [inicio, fim] (copiar linhas do antigo) ou "texto" (inserir).
+def calcular_delta(antigo, novo):
+    linhas_antigas = antigo.splitlines(keepends=True)
+    linhas_novas = novo.splitlines(keepends=True)
+    operacoes = []
+    comparador = difflib.SequenceMatcher(None, linhas_antigas, linhas_novas, autojunk=False)
+    for codigo, i1, i2, j1, j2 in comparador.get_opcodes():
+        if codigo == 'equal':
+            operacoes.append([i1, i2])
+        elif j2 > j1:
+            # 'replace' e 'insert' viram inserção; 'delete' simplesmente não copia as linhas.
+            operacoes.append(''.join(linhas_novas[j1:j2]))
+    return json.dumps(operacoes, ensure_ascii=False, separators=(',', ':'))
+
+
+def aplicar_delta(antigo, delta):
+    linhas_antigas = antigo.splitlines(keepends=True)
+    partes = []
+    for operacao in json.loads(delta):
+        if isinstance(operacao, str):
+            partes.append(operacao)
+        else:
+            partes.extend(linhas_antigas[operacao[0]:operacao[1]])
+    return ''.join(partes)
+
+
+def _nova_revisao(documentacao, numero, texto, anterior, autor):
+    snapshot = anterior is None or numero % INTERVALO_SNAPSHOT == 1
+    dados = _comprimir(texto)
+    if not snapshot:
+        delta = _comprimir(calcular_delta(anterior, texto))
+        # Se o delta não for menor que o texto inteiro (reescrita completa), guarda o texto.
+        if len(delta) < len(dados):
+            dados = delta
+        else:
+            snapshot = True
+    return RevisaoDocumentacao(
+        documentacao=documentacao, numero=numero, snapshot=snapshot,
+        dados=dados, tamanho=len(texto), autor=autor,
+    )
+
+
+# Registra o conteúdo atual de 'documentacao' como uma nova revisão. Chame depois de salvar, na mesma
+# transação e com a linha travada (select_for_update), para que edições simultâneas não disputem o número.
+# 'conteudo_anterior' é o texto gravado no banco antes da edição (None na criação); 'autor' é quem editou.
+def registrar_revisao(documentacao, conteudo_anterior, autor):
+    with transaction.atomic():
+        atual = DocumentacaoTecnica.objects.select_for_update().values_list('revisao_atual', flat=True).get(
+            pk=documentacao.pk
+        )
+        # O delta parte do texto da última revisão, e não do que o chamador acha que havia antes.
+        ultimo = obter_conteudo(documentacao.pk, atual) if atual else None
+        numero = atual
+        novas = []
+        # Um texto gravado sem passar por aqui (documentação anterior ao histórico, admin, shell)
+        # entra como uma revisão sem autor, para que os deltas seguintes partam do texto que existia.
+        if conteudo_anterior is not None and conteudo_anterior != ultimo:
+            numero += 1
+            novas.append(_nova_revisao(documentacao, numero, conteudo_anterior, ultimo, None))
+            ultimo = conteudo_anterior
+        if documentacao.conteudo != ultimo:
+            numero += 1
+            novas.append(_nova_revisao(documentacao, numero, documentacao.conteudo, ultimo, autor))
+        if not novas:
+            return None
+        RevisaoDocumentacao.objects.bulk_create(novas)
+        DocumentacaoTecnica.objects.filter(pk=documentacao.pk).update(revisao_atual=numero)
+        documentacao.revisao_atual = numero
+    return novas[-1]
+
+
+# Reconstrói o texto da revisão 'numero': parte do último snapshot até ela e aplica os deltas.
+def obter_conteudo(documentacao_id, numero):
+    revisoes = list(
+        RevisaoDocumentacao.objects.filter(
+            documentacao_id=documentacao_id, numero__lte=numero,
+            numero__gte=RevisaoDocumentacao.objects.filter(
+                documentacao_id=documentacao_id, numero__lte=numero, snapshot=True,
+            ).order_by('-numero').values('numero')[:1],
+        ).order_by('numero').values_list('numero', 'snapshot', 'dados')
+    )
+    if not revisoes or revisoes[-1][0] != numero:
+        raise RevisaoDocumentacao.DoesNotExist(f'Revisão {numero} não encontrada.')
+    texto = None
+    for _, snapshot, dados in revisoes:
+        conteudo = _descomprimir(dados)
+        texto = conteudo if snapshot else aplicar_delta(texto, conteudo)
+    return texto
+
+
+# Diferença (formato unified diff) entre duas revisões da mesma documentação.
+def comparar_revisoes(documentacao_id, de, para):
+    antigo = obter_conteudo(documentacao_id, de).splitlines(keepends=True)
+    novo = obter_conteudo(documentacao_id, para).splitlines(keepends=True)
+    return ''.join(difflib.unified_diff(antigo, novo, fromfile=f'revisao {de}', tofile=f'revisao {para}'))
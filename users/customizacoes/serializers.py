@@ -1,8 +1,10 @@
 # customizacoes/serializers.py
 
 # Serializers convertem objetos do Django em JSON (para a API) e vice-versa.
+import json
+
 from rest_framework import serializers
-from .models import Customizacao, HistoricoAlteracao, Dependencia, DocumentacaoTecnica, TipoCustomizacao
+from .models import Customizacao, HistoricoAlteracao, Dependencia, DocumentacaoTecnica, RevisaoDocumentacao, TipoCustomizacao
 
 # --- Serializer para TipoCustomizacao ---
 class TipoCustomizacaoSerializer(serializers.ModelSerializer):
@@ -21,16 +23,25 @@ class CustomizacaoSerializer(serializers.ModelSerializer):
         # Campos que não podem ser editados diretamente pela API.
         read_only_fields = ('data_criacao', 'data_ultima_alteracao', 'criado_por')
 
+# Converte o JSON de HistoricoAlteracao.alteracoes (também usado pela listagem rápida, ver listagem.py).
+def ler_alteracoes(valor):
+    return json.loads(valor) if valor else None
+
 # --- Serializer para HistoricoAlteracao ---
 class HistoricoAlteracaoSerializer(serializers.ModelSerializer):
     # Campo somente leitura para mostrar o nome de usuário de quem fez a alteração.
     alterado_por_username = serializers.CharField(source='alterado_por.username', read_only=True)
+    # Diferenças campo a campo ({"campo": {"de": ..., "para": ...}}), guardadas em JSON no banco.
+    alteracoes = serializers.SerializerMethodField()
 
     class Meta:
         model = HistoricoAlteracao
         fields = '__all__'
         read_only_fields = ('data_alteracao',)
 
+    def get_alteracoes(self, obj):
+        return ler_alteracoes(obj.alteracoes)
+
 # ... (Crie serializers para Dependencia e DocumentacaoTecnica da mesma forma)
 class DependenciaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -41,3 +52,15 @@ class DocumentacaoTecnicaSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentacaoTecnica
         fields = '__all__'
+
+# Versão da documentação para as listagens: só os metadados, sem o texto (que pode ser longo).
+class DocumentacaoTecnicaResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentacaoTecnica
+        exclude = ('conteudo',)
+
+# --- Serializer para RevisaoDocumentacao (metadados; o texto é reconstruído sob demanda) ---
+class RevisaoDocumentacaoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RevisaoDocumentacao
+        fields = ('numero', 'snapshot', 'tamanho', 'autor', 'data')
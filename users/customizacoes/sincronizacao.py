@@ -0,0 +1,120 @@
+# customizacoes/sincronizacao.py
+# Execução contínua da sincronização com o ERP (comando sincronizar_erp).
+#
+# - Trava (lease) no banco: cada rotina tem uma linha em SincronizacaoERP; só o processo que
+#   detém a trava sincroniza. A trava é tomada e renovada com um UPDATE condicional (atômico em
+#   qualquer banco) e expira sozinha se o processo morrer, então outro servidor assume em seguida.
+# - Intervalo adaptativo: com mudanças no ERP a consulta seguinte é feita logo (intervalo mínimo);
+#   sem mudanças, o intervalo cresce até o máximo. Assim as novidades aparecem em segundos quando
+#   o ERP está movimentado, sem consultá-lo sem necessidade quando está parado.
+# - Reconciliação periódica: a consulta incremental só vê o que foi criado no ERP depois da marca
+#   d'água; de tempos em tempos o catálogo inteiro é comparado por hash, para trazer as edições.
+# - Cada execução grava suas estatísticas em ExecucaoSincronizacao.
+
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .erp_integrator import (
+    NOME_RECONCILIACAO, NOME_SINCRONIZACAO, monitorar_novas_customizacoes_erp, reconciliar_customizacoes_erp,
+)
+from .models import ExecucaoSincronizacao, SincronizacaoERP
+
+# Margem (segundos) somada à duração da trava, para cobrir pequenas diferenças de relógio e pausas.
+MARGEM_TRAVA = 30
+# Estatísticas de execução mais antigas que isto são apagadas.
+RETENCAO_EXECUCOES = timedelta(days=7)
+
+
+class TravaPerdida(RuntimeError):
+    pass
+
+
+# Identifica o processo atual (host:pid) como dono da trava.
+def identificar_executor():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Toma (ou renova) a trava da rotina 'nome' por 'duracao' segundos. Retorna True se conseguiu.
+def adquirir_trava(nome, dono, duracao):
+    agora = timezone.now()
+    SincronizacaoERP.objects.get_or_create(nome=nome)
+    # O UPDATE só afeta a linha se a trava estiver livre, vencida ou já for nossa: se dois
+    # processos tentarem ao mesmo tempo, o banco garante que só um deles a altera.
+    return SincronizacaoERP.objects.filter(
+        Q(trava_dono__isnull=True) | Q(trava_expira_em__lt=agora) | Q(trava_dono=dono),
+        nome=nome,
+    ).update(trava_dono=dono, trava_expira_em=agora + timedelta(seconds=duracao + MARGEM_TRAVA)) == 1
+
+
+def liberar_trava(nome, dono):
+    SincronizacaoERP.objects.filter(nome=nome, trava_dono=dono).update(trava_dono=None, trava_expira_em=None)
+
+
+class IntervaloAdaptativo:
+    """Intervalo entre consultas ao ERP: mínimo logo após mudanças, crescendo até o máximo sem elas."""
+
+    def __init__(self, minimo, maximo, fator=1.5):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.fator = fator
+        self.atual = minimo
+
+    def registrar(self, mudancas):
+        if mudancas:
+            self.atual = self.minimo
+        else:
+            self.atual = min(self.maximo, self.atual * self.fator)
+        return self.atual
+
+
+# Diz se já passou 'intervalo' (timedelta) desde a última reconciliação completa bem-sucedida, de
+# qualquer servidor (a informação vem do banco, então sobrevive a reinícios e trocas de servidor).
+def reconciliacao_pendente(intervalo):
+    ultima = (
+        ExecucaoSincronizacao.objects.filter(nome=NOME_RECONCILIACAO, erro__isnull=True)
+        .order_by('-inicio').values_list('inicio', flat=True).first()
+    )
+    return ultima is None or timezone.now() - ultima >= intervalo
+
+
+# Executa uma sincronização com a trava de 'dono' e grava as estatísticas. Retorna o ExecucaoSincronizacao.
+# 'duracao_trava' é por quanto tempo (segundos) cada lote gravado renova a trava.
+# Com reconciliar=True compara o catálogo inteiro do ERP (reconciliar_customizacoes_erp), em vez de
+# ler só o que foi criado depois da marca d'água.
+def executar_sincronizacao(dono, duracao_trava, reconciliar=False):
+    def _renovar_trava():
+        # Chamada dentro da transação de cada lote: se outro processo assumiu a trava, o lote é desfeito.
+        if not adquirir_trava(NOME_SINCRONIZACAO, dono, duracao_trava):
+            raise TravaPerdida(f'A trava de {NOME_SINCRONIZACAO} passou para outro processo.')
+
+    inicio = timezone.now()
+    cronometro = time.monotonic()
+    # Preenchido a cada lote confirmado: se a execução for interrompida, os lotes já gravados continuam contados.
+    estatisticas = {}
+    try:
+        rotina = reconciliar_customizacoes_erp if reconciliar else monitorar_novas_customizacoes_erp
+        rotina(ao_gravar_lote=_renovar_trava, estatisticas=estatisticas)
+    except TravaPerdida as ex:
+        estatisticas['erro'] = str(ex)
+    except Exception as ex:
+        # Qualquer outra falha (ex: o banco do Django caiu no meio de um lote) fica registrada na execução.
+        estatisticas['erro'] = f'{type(ex).__name__}: {ex}'
+    return ExecucaoSincronizacao.objects.create(
+        nome=NOME_RECONCILIACAO if reconciliar else NOME_SINCRONIZACAO,
+        executor=dono,
+        inicio=inicio,
+        duracao=time.monotonic() - cronometro,
+        lidas=estatisticas.get('lidas', 0),
+        inseridas=estatisticas.get('inseridas', 0),
+        alteradas=estatisticas.get('alteradas', 0),
+        erro=estatisticas.get('erro'),
+    )
+
+
+def limpar_execucoes_antigas():
+    return ExecucaoSincronizacao.objects.filter(inicio__lt=timezone.now() - RETENCAO_EXECUCOES).delete()[0]
@@ -17,6 +17,10 @@ router.register(r'documentacao-tecnica', views.DocumentacaoTecnicaViewSet)
 
 # urlpatterns é a lista de padrões de URL que o Django usará.
 urlpatterns = [
+    # Feed de mudanças (sincronização incremental dos clientes).
+    path('mudancas/', views.FeedMudancasView.as_view(), name='feed-mudancas'),
+    # Resumo do dashboard (cards e itens recentes).
+    path('dashboard/', views.DashboardView.as_view(), name='dashboard-resumo'),
     # Inclui todas as URLs geradas pelo router.
     path('', include(router.urls)),
 ]
@@ -1,59 +1,310 @@
 # customizacoes/views.py
 
 # Views definem a lógica de como a API responde a requisições.
-from rest_framework import viewsets
+import math
+
+from django.db import transaction
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 
 # Importa os modelos e serializers que a view irá usar.
-from .models import Customizacao, HistoricoAlteracao, Dependencia, DocumentacaoTecnica, TipoCustomizacao
-from .serializers import CustomizacaoSerializer, HistoricoAlteracaoSerializer, DependenciaSerializer, DocumentacaoTecnicaSerializer, TipoCustomizacaoSerializer
+from .models import Customizacao, HistoricoAlteracao, Dependencia, DocumentacaoTecnica, RevisaoDocumentacao, TipoCustomizacao
+from .serializers import CustomizacaoSerializer, HistoricoAlteracaoSerializer, DependenciaSerializer, DocumentacaoTecnicaSerializer, DocumentacaoTecnicaResumoSerializer, RevisaoDocumentacaoSerializer, TipoCustomizacaoSerializer, ler_alteracoes
+from .grafo import obter_grafo
+from .paginacao import PaginacaoHistorico
+from .busca import BuscaIndexadaFilter
+from .auditoria import AutorAuditoriaMixin
+from .cache_http import RespostaCondicionalMixin
+from .exportacao import ExportacaoMixin
+from .listagem import ListagemRapidaMixin
+from .lote import ErroLote, atualizar_em_lote, criar_em_lote, desativar_em_lote
+from .revisoes import comparar_revisoes, obter_conteudo, registrar_revisao
+from customizacoes.dashboard import obter_resumo
+from .mudancas import LIMITE_MAXIMO, LIMITE_PADRAO, CursorInvalido, aguardar_mudancas, codificar_cursor, decodificar_cursor
+
+
+# Lê o parâmetro ?profundidade= (opcional, inteiro positivo) das consultas ao grafo.
+def _profundidade_maxima(request):
+    valor = request.query_params.get('profundidade')
+    if valor in (None, ''):
+        return None
+    try:
+        profundidade = int(valor)
+    except ValueError:
+        profundidade = 0
+    if profundidade < 1:
+        raise ValidationError({'profundidade': 'Informe um número inteiro maior que zero.'})
+    return profundidade
 
 # --- ViewSet para Customizacao ---
 # ModelViewSet fornece automaticamente as ações de Listar, Criar, Ver, Editar e Deletar.
-class CustomizacaoViewSet(viewsets.ModelViewSet):
-    queryset = Customizacao.objects.all()  # O conjunto de todos os objetos que esta view pode operar.
+# A listagem é serializada direto das colunas (ListagemRapidaMixin, ver listagem.py).
+class CustomizacaoViewSet(AutorAuditoriaMixin, RespostaCondicionalMixin, ListagemRapidaMixin, ExportacaoMixin, viewsets.ModelViewSet):
+    # O conjunto de todos os objetos que esta view pode operar. O tipo vem no mesmo SELECT (JOIN),
+    # pois o serializer mostra 'tipo_nome' em cada linha.
+    queryset = Customizacao.objects.select_related('tipo')
     serializer_class = CustomizacaoSerializer # A classe serializer a ser usada.
     permission_classes = [IsAuthenticated]      # Apenas usuários autenticados podem acessar.
     
     # Configurações para filtros, busca e ordenação na API.
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, filters.OrderingFilter]
     filterset_fields = ['tipo', 'ativo']       # Campos para filtro exato (ex: /api/customizacoes/?ativo=true).
-    search_fields = ['nome', 'descricao', 'codigo_erp'] # Campos para busca textual (ex: /api/customizacoes/?search=minha_formula).
+    # Busca textual pelo índice invertido (ex: /api/customizacoes/?search=formula contabil), ordenada por relevância.
+    # Cobre nome, código, tipo, descrição e documentação técnica, sem diferenciar acentos.
     ordering_fields = ['nome', 'data_criacao'] # Campos para ordenação (ex: /api/customizacoes/?ordering=-data_criacao).
+    # Listagem e detalhe respondem 304 (ETag/Last-Modified) e as páginas ficam em cache até a próxima
+    # gravação destes modelos (ver cache_http.py). O tipo aparece em 'tipo_nome' e a documentação entra na busca.
+    modelos_cache = (Customizacao, TipoCustomizacao, DocumentacaoTecnica)
+
+    # Exportação: /api/customizacoes/exportar/?formato=csv&since=2024-05-01T00:00:00&since_id=123 (ver exportacao.py).
+    campos_exportacao = [
+        ('id', 'id'), ('nome', 'nome'), ('tipo', 'tipo_id'), ('tipo_nome', 'tipo__nome'),
+        ('codigo_erp', 'codigo_erp'), ('descricao', 'descricao'), ('ativo', 'ativo'),
+        ('data_criacao', 'data_criacao'), ('data_ultima_alteracao', 'data_ultima_alteracao'),
+        ('criado_por', 'criado_por_id'),
+    ]
+    campo_since = 'data_ultima_alteracao'
+    ordem_exportacao = ('data_ultima_alteracao', 'id')
+    nome_exportacao = 'customizacoes'
 
     # Este método é chamado quando uma nova customização é criada (requisição POST).
+    # O registro no histórico é feito automaticamente, com os valores iniciais (ver auditoria.py).
     def perform_create(self, serializer):
         # Salva o novo objeto, definindo o 'criado_por' com o usuário da requisição.
         serializer.save(criado_por=self.request.user)
-        # Cria um registro no histórico para esta ação.
-        HistoricoAlteracao.objects.create(
-            customizacao=serializer.instance,
-            alterado_por=self.request.user,
-            tipo_alteracao='Criação',
-            detalhes_alteracao='Customização criada inicialmente.'
-        )
+
+    # --- Gravação em lote (ver lote.py) ---
+
+    # POST  /api/customizacoes/lote/   cria as customizações da lista enviada.
+    # PATCH /api/customizacoes/lote/   atualiza; cada item traz o 'id' e os campos que mudam.
+    # Por padrão, um item inválido cancela o lote inteiro (400). Com ?ignorar_invalidos=true,
+    # os itens válidos são gravados e os inválidos voltam com os erros.
+    @action(detail=False, methods=['post', 'patch'])
+    def lote(self, request):
+        ignorar_invalidos = request.query_params.get('ignorar_invalidos', '').lower() in ('1', 'true')
+        gravar = criar_em_lote if request.method == 'POST' else atualizar_em_lote
+        try:
+            aplicado, resultados = gravar(request.data, request.user, ignorar_invalidos)
+        except ErroLote as erro:
+            raise ValidationError({'detail': str(erro)})
+        if not aplicado:
+            return Response({'aplicado': False, 'resultados': resultados}, status=status.HTTP_400_BAD_REQUEST)
+        codigo = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+        return Response({'aplicado': True, 'resultados': resultados}, status=codigo)
+
+    # POST /api/customizacoes/desativar-lote/  {"ids": [1, 2, 3]}
+    @action(detail=False, methods=['post'], url_path='desativar-lote')
+    def desativar_lote(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        try:
+            _, resultados = desativar_em_lote(ids, request.user)
+        except ErroLote as erro:
+            raise ValidationError({'ids': str(erro)})
+        return Response({'aplicado': True, 'resultados': resultados})
+
+    # --- Análise de impacto sobre o grafo de dependências (ver grafo.py) ---
+
+    # GET /api/customizacoes/{id}/dependentes/?profundidade=2
+    # Customizações afetadas se esta mudar (quem depende dela, direta ou indiretamente).
+    @action(detail=True, methods=['get'])
+    def dependentes(self, request, pk=None):
+        customizacao = self.get_object()
+        alcancados = obter_grafo().dependentes(customizacao.pk, _profundidade_maxima(request))
+        return Response(self._resultado_percurso(customizacao, alcancados))
+
+    # GET /api/customizacoes/{id}/dependencias-transitivas/?profundidade=2
+    # Tudo de que esta customização depende, direta ou indiretamente.
+    @action(detail=True, methods=['get'], url_path='dependencias-transitivas')
+    def dependencias_transitivas(self, request, pk=None):
+        customizacao = self.get_object()
+        alcancados = obter_grafo().dependencias(customizacao.pk, _profundidade_maxima(request))
+        return Response(self._resultado_percurso(customizacao, alcancados))
+
+    # GET /api/customizacoes/ordem-topologica/
+    # Ordem em que as customizações podem ser aplicadas (dependências primeiro).
+    # Customizações presas em ciclos não têm ordem e são listadas em 'em_ciclo'.
+    @action(detail=False, methods=['get'], url_path='ordem-topologica')
+    def ordem_topologica(self, request):
+        ordem, em_ciclo = obter_grafo().ordem_topologica()
+        return Response({'ordem': ordem, 'em_ciclo': em_ciclo})
+
+    # GET /api/customizacoes/ciclos/
+    # Ciclos de dependência (cada ciclo é uma lista de IDs de customizações).
+    @action(detail=False, methods=['get'])
+    def ciclos(self, request):
+        ciclos = obter_grafo().ciclos()
+        return Response({'total': len(ciclos), 'ciclos': ciclos})
+
+    def _resultado_percurso(self, customizacao, alcancados):
+        resultados = sorted(alcancados.items(), key=lambda item: (item[1], item[0]))
+        return {
+            'customizacao': customizacao.pk,
+            'total': len(resultados),
+            'resultados': [{'id': pk, 'profundidade': nivel} for pk, nivel in resultados],
+        }
 
 # --- ViewSet para HistoricoAlteracao ---
 # ReadOnlyModelViewSet fornece apenas ações de leitura (Listar e Ver).
-class HistoricoAlteracaoViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = HistoricoAlteracao.objects.all().order_by('-data_alteracao') # Ordena do mais recente para o mais antigo.
+class HistoricoAlteracaoViewSet(ListagemRapidaMixin, ExportacaoMixin, viewsets.ReadOnlyModelViewSet):
+    # Ordena do mais recente para o mais antigo; o usuário vem no mesmo SELECT (para 'alterado_por_username').
+    queryset = HistoricoAlteracao.objects.select_related('alterado_por').order_by('-data_alteracao', '-id')
     serializer_class = HistoricoAlteracaoSerializer
     permission_classes = [IsAuthenticated]
+    # Paginação por cursor: cada página custa o mesmo, por mais fundo que se navegue no histórico.
+    pagination_class = PaginacaoHistorico
+
+    # Filtro por customização (ex: /api/historico-alteracoes/?customizacao=42), servido pelo índice (customizacao, data_alteracao).
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['customizacao']
+    # Na listagem rápida, 'alteracoes' sai do JSON gravado, como no serializer.
+    conversores_listagem = {'alteracoes': ('alteracoes', ler_alteracoes)}
+
+    # Exportação: /api/historico-alteracoes/exportar/?formato=ndjson&since=... (do mais antigo para o mais novo).
+    campos_exportacao = [
+        ('id', 'id'), ('customizacao', 'customizacao_id'), ('data_alteracao', 'data_alteracao'),
+        ('alterado_por', 'alterado_por_id'), ('alterado_por_username', 'alterado_por__username'),
+        ('tipo_alteracao', 'tipo_alteracao'), ('detalhes_alteracao', 'detalhes_alteracao'),
+        ('alteracoes', 'alteracoes'),
+    ]
+    campo_since = 'data_alteracao'
+    ordem_exportacao = ('data_alteracao', 'id')
+    nome_exportacao = 'historico_alteracoes'
 
 # ... (Crie ViewSets para os outros modelos: TipoCustomizacao, Dependencia, DocumentacaoTecnica)
-class TipoCustomizacaoViewSet(viewsets.ModelViewSet):
+class TipoCustomizacaoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = TipoCustomizacao.objects.all()
     serializer_class = TipoCustomizacaoSerializer
     permission_classes = [IsAuthenticated]
+    modelos_cache = (TipoCustomizacao,)
 
-class DependenciaViewSet(viewsets.ModelViewSet):
+class DependenciaViewSet(AutorAuditoriaMixin, ListagemRapidaMixin, ExportacaoMixin, viewsets.ModelViewSet):
     queryset = Dependencia.objects.all()
     serializer_class = DependenciaSerializer
     permission_classes = [IsAuthenticated]
 
-class DocumentacaoTecnicaViewSet(viewsets.ModelViewSet):
+    # Exportação: /api/dependencias/exportar/?formato=csv (Dependencia não tem data, então não há ?since=).
+    campos_exportacao = [
+        ('id', 'id'), ('customizacao_origem', 'customizacao_origem_id'),
+        ('customizacao_destino', 'customizacao_destino_id'), ('tipo_dependencia', 'tipo_dependencia'),
+        ('descricao', 'descricao'),
+    ]
+    nome_exportacao = 'dependencias'
+
+class DocumentacaoTecnicaViewSet(AutorAuditoriaMixin, RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = DocumentacaoTecnica.objects.all()
     serializer_class = DocumentacaoTecnicaSerializer
     permission_classes = [IsAuthenticated]
+    modelos_cache = (DocumentacaoTecnica,)
+
+    # Na listagem o texto não é carregado nem enviado; ele vem no detalhe (/documentacao-tecnica/{id}/).
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.defer('conteudo')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DocumentacaoTecnicaResumoSerializer
+        return super().get_serializer_class()
+
+    # Cada gravação vira uma revisão (ver revisoes.py), na mesma transação.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+            registrar_revisao(serializer.instance, None, self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Trava a linha antes de gravar: edições simultâneas da mesma documentação passam uma de
+            # cada vez, e o texto anterior é o do banco (a instância pode ter sido lida antes da outra edição).
+            conteudo_anterior = DocumentacaoTecnica.objects.select_for_update().values_list(
+                'conteudo', flat=True
+            ).get(pk=serializer.instance.pk)
+            serializer.save()
+            registrar_revisao(serializer.instance, conteudo_anterior, self.request.user)
+
+    # GET /api/documentacao-tecnica/{id}/revisoes/
+    @action(detail=True, methods=['get'])
+    def revisoes(self, request, pk=None):
+        documentacao = self.get_object()
+        revisoes = RevisaoDocumentacao.objects.filter(documentacao=documentacao).order_by('-numero')
+        return Response(RevisaoDocumentacaoSerializer(revisoes, many=True).data)
+
+    # GET /api/documentacao-tecnica/{id}/revisoes/{numero}/
+    @action(detail=True, methods=['get'], url_path=r'revisoes/(?P<numero>\d+)')
+    def revisao(self, request, pk=None, numero=None):
+        documentacao = self.get_object()
+        try:
+            conteudo = obter_conteudo(documentacao.pk, int(numero))
+        except RevisaoDocumentacao.DoesNotExist as erro:
+            raise NotFound(str(erro))
+        return Response({'numero': int(numero), 'conteudo': conteudo})
+
+    # GET /api/documentacao-tecnica/{id}/diff/?de=1&para=3  (sem 'para': compara com a revisão atual)
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        documentacao = self.get_object()
+        try:
+            de = int(request.query_params['de'])
+            para = int(request.query_params.get('para', documentacao.revisao_atual))
+        except (KeyError, ValueError):
+            raise ValidationError({'de': "Informe as revisões em 'de' (e opcionalmente 'para')."})
+        try:
+            diferenca = comparar_revisoes(documentacao.pk, de, para)
+        except RevisaoDocumentacao.DoesNotExist as erro:
+            raise NotFound(str(erro))
+        return Response({'de': de, 'para': para, 'diff': diferenca})
+
+
+# --- Feed de mudanças (ver mudancas.py) ---
+# GET /api/mudancas/?cursor=<cursor>&limite=500&espera=25
+# Devolve as criações, alterações e exclusões de customizações, dependências e documentações
+# posteriores ao cursor, em ordem. O cliente guarda o 'cursor' da resposta e o envia no próximo
+# pedido; com 'tem_mais' verdadeiro, deve pedir de novo logo em seguida. Com ?espera=N (até 30s),
+# o pedido fica aberto até aparecer uma mudança, em vez de o cliente consultar repetidamente.
+class FeedMudancasView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ultimo_id = decodificar_cursor(request.query_params.get('cursor'))
+            limite = int(request.query_params.get('limite', LIMITE_PADRAO))
+            espera = float(request.query_params.get('espera', 0))
+        except CursorInvalido as erro:
+            raise ValidationError({'cursor': str(erro)})
+        except ValueError:
+            raise ValidationError({'detail': "'limite' e 'espera' devem ser números."})
+        # float() aceita 'nan' e 'inf': uma espera sem prazo prenderia o worker para sempre.
+        if not math.isfinite(espera):
+            raise ValidationError({'espera': 'Informe um número de segundos.'})
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+
+        registros, proximo, tem_mais = aguardar_mudancas(ultimo_id, limite, max(espera, 0))
+        return Response({
+            'cursor': codificar_cursor(proximo),
+            'tem_mais': tem_mais,
+            'resultados': [
+                {
+                    'modelo': registro.modelo,
+                    'id': registro.objeto_id,
+                    'operacao': registro.operacao,
+                    'data': registro.data,
+                }
+                for registro in registros
+            ],
+        })
+
+
+# Resumo do dashboard (cards e customizações alteradas recentemente) para o SPA.
+class DashboardView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(obter_resumo())
@@ -2,6 +2,7 @@
 
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -19,5 +20,63 @@ class ConfiguracaoNotificacao(models.Model):
     # Campo para armazenar a URL do webhook do Slack.
     webhook_slack = models.URLField(blank=True, null=True, help_text="URL do Webhook do Slack")
 
+    FREQUENCIA_IMEDIATA = 'IMEDIATA'
+    FREQUENCIA_HORARIA = 'HORARIA'
+    FREQUENCIA_DIARIA = 'DIARIA'
+    FREQUENCIAS = [
+        (FREQUENCIA_IMEDIATA, 'Imediata'),
+        (FREQUENCIA_HORARIA, 'Resumo a cada hora'),
+        (FREQUENCIA_DIARIA, 'Resumo diário'),
+    ]
+    # Com que frequência o usuário quer receber as notificações. Eventos do mesmo período
+    # são agrupados em uma única mensagem de resumo por canal.
+    frequencia = models.CharField(max_length=10, choices=FREQUENCIAS, default=FREQUENCIA_IMEDIATA)
+
     def __str__(self):
         return f"Configurações de Notificação para {self.usuario.username}"
+
+# --- Modelo NotificacaoPendente ---
+# Caixa de saída (outbox) das notificações. Quem notifica apenas grava uma linha aqui, dentro da
+# própria transação; o worker 'manage.py processar_notificacoes' faz a entrega em segundo plano.
+class NotificacaoPendente(models.Model):
+    CANAL_EMAIL = 'EMAIL'
+    CANAL_TEAMS = 'TEAMS'
+    CANAL_SLACK = 'SLACK'
+    CANAIS = [
+        (CANAL_EMAIL, 'E-mail'),
+        (CANAL_TEAMS, 'Microsoft Teams'),
+        (CANAL_SLACK, 'Slack'),
+    ]
+
+    STATUS_PENDENTE = 'PENDENTE'
+    STATUS_ENVIADA = 'ENVIADA'
+    # Esgotou as tentativas: fica guardada para análise (dead-letter), sem novas tentativas.
+    STATUS_FALHA = 'FALHA'
+    STATUS = [
+        (STATUS_PENDENTE, 'Pendente'),
+        (STATUS_ENVIADA, 'Enviada'),
+        (STATUS_FALHA, 'Falha definitiva'),
+    ]
+
+    # Usuário que receberá a notificação.
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name="notificacoes_pendentes")
+    # Canal de entrega e destino (endereço de e-mail ou URL do webhook).
+    canal = models.CharField(max_length=10, choices=CANAIS)
+    destino = models.CharField(max_length=500)
+    assunto = models.CharField(max_length=255)
+    mensagem = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS, default=STATUS_PENDENTE)
+    # Quantas entregas já foram tentadas e quando a próxima pode acontecer.
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    # Mensagem do último erro de entrega, se houver.
+    ultimo_erro = models.TextField(blank=True, null=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_envio = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        # O worker busca sempre por status + próxima tentativa.
+        indexes = [models.Index(fields=['status', 'proxima_tentativa'])]
+
+    def __str__(self):
+        return f"{self.get_canal_display()} para {self.destino}: {self.assunto} ({self.status})"